@@ -1,12 +1,17 @@
 from __future__ import absolute_import, division, print_function, with_statement
 from __future__ import unicode_literals
 
-from deepstreampy.message import connection
+from deepstreampy.message import codec as codecs
+from deepstreampy.message import connection, lanes, standby
+from deepstreampy.message import message_builder, message_parser
 from deepstreampy import constants
 from deepstreampy.record import RecordHandler
 from deepstreampy.event import EventHandler
 from deepstreampy.rpc import RPCHandler
 from deepstreampy.presence import PresenceHandler
+from deepstreampy.resubscribe import ResubscribeManager
+from deepstreampy.routing import DispatchTable
+from deepstreampy.timing_wheel import TimingWheel
 
 from pyee import EventEmitter
 from tornado import gen
@@ -41,29 +46,38 @@ class Client(EventEmitter):
 
         Args:
             url (str): The url to connect to
-            options
+            options: See ``Connection``, ``ConnectionLanes`` when
+                ``connectionLanes`` is more than 1 and ``StandbyConnection``
+                when ``hotStandby`` is set. ``jsonCodec`` picks the JSON
+                codec of all handlers and connections, and ``numpyArrays``
+                lets events and RPCs carry NumPy arrays, see
+                ``codec.get_client_codec``.
         """
         super(Client, self).__init__()
-        self._connection = connection.Connection(self, url, **options)
+        self._codec = codecs.get_client_codec(**options)
+        if options.get('hotStandby', False):
+            if options.get('connectionLanes', 1) > 1:
+                raise ValueError(
+                    "hotStandby can't be used with connectionLanes")
+            self._connection = standby.StandbyConnection(self, url, **options)
+        elif options.get('connectionLanes', 1) > 1:
+            self._connection = lanes.ConnectionLanes(self, url, **options)
+        else:
+            self._connection = connection.Connection(self, url, **options)
+        self._timeouts = TimingWheel(self,
+                                     options.get('timerResolution', 0.01))
+        self._resubscriptions = ResubscribeManager(self, self._connection,
+                                                   **options)
         self._presence = PresenceHandler(self._connection, self, **options)
         self._event = EventHandler(self._connection, self, **options)
         self._rpc = RPCHandler(self._connection, self, **options)
         self._record = RecordHandler(self._connection, self, **options)
-        self._message_callbacks = dict()
-
-        self._message_callbacks[
-            constants.topic.PRESENCE] = self._presence.handle
-
-        self._message_callbacks[
-            constants.topic.EVENT] = self._event.handle
-
-        self._message_callbacks[
-            constants.topic.RPC] = self._rpc.handle
-
-        self._message_callbacks[
-            constants.topic.RECORD] = self._record.handle
 
-        self._message_callbacks[constants.topic.ERROR] = self._on_error
+        self._routes = DispatchTable()
+        for handler in (self._presence, self._event, self._rpc, self._record):
+            handler.register_routes(self._routes)
+        self._routes.register_fallback(constants.topic.ERROR,
+                                       self._on_error_message)
 
     def connect(self, callback=None):
         """Establishes a connection to the url given to the constructor.
@@ -98,21 +112,46 @@ class Client(EventEmitter):
         """
         return self._connection.authenticate(auth_params)
 
+    def drain(self):
+        """Wait for the outbound queue to drain.
+
+        Producers that send faster than the connection can write should yield
+        on this once in a while when ``outboundHighWaterBytes`` or
+        ``outboundHighWaterMessages`` is set.
+
+        Returns:
+            tornado.concurrent.Future: A future that resolves once the outbound
+                queue is below its low-water marks
+        """
+        return self._connection.drain()
+
+    def prepare(self, value):
+        """Serialize a value once, to emit, send or set it many times.
+
+        Broadcasting one payload to many events, or sending the same status
+        over and over, then skips serializing it each time.
+
+        Args:
+            value: JSON serializable data
+
+        Returns:
+            EncodedPayload: accepted as data by ``event.emit``, ``rpc.make``,
+                ``RPCResponse.send`` and ``Record.set``
+        """
+        return message_builder.prepare(value, self._codec)
+
     def _on_message(self, message):
-        if message['topic'] in self._message_callbacks:
-            self._message_callbacks[message['topic']](message)
-            return
-        else:
-            self._on_error(message['topic'],
+        message = message_parser.as_message(message)
+        if not self._routes.dispatch(message):
+            self._on_error(message.topic,
                            constants.event.MESSAGE_PARSE_ERROR,
                            ('Received message for unknown topic ' +
-                            message['topic']))
-            return
+                            message.topic))
 
-        if message['action'] == constants.actions.ERROR:
-            self._on_error(message['topic'],
-                           message['action'],
-                           message['data'][0] if len(message['data']) else None)
+    def _on_error_message(self, message):
+        self._on_error(message.topic,
+                       message.action,
+                       message.data[0] if len(message.data) else None)
 
     def _on_error(self, topic, event, msg=None):
         if event in (constants.event.ACK_TIMEOUT,
@@ -141,6 +180,54 @@ class Client(EventEmitter):
     def connection_state(self):
         return self._connection.state
 
+    @property
+    def outbound_queue_depth(self):
+        """QueueDepth: The number of messages and bytes that are waiting to
+        be written."""
+        return self._connection.outbound_queue_depth
+
+    @property
+    def inbound_queue_depth(self):
+        """QueueDepth: The number of messages and bytes that were received
+        but not handled yet."""
+        return self._connection.inbound_queue_depth
+
+    @property
+    def round_trip_time(self):
+        """RoundTripTime: The smoothed round trip time to the server in
+        seconds, its variation and the number of samples it's based on."""
+        return self._connection.round_trip_time
+
+    @property
+    def dead_peer_timeout(self):
+        """float: Seconds of silence from the server after which the
+        connection is considered lost."""
+        return self._connection.dead_peer_timeout
+
+    @property
+    def dispatch_stats(self):
+        """DispatchStats: Slices run to hand incoming messages to the
+        handlers and the time they took, None unless ``dispatchSliceTime``
+        is set."""
+        return self._connection.dispatch_stats
+
+    @property
+    def codec(self):
+        """Codec: Serializes and parses the JSON in messages."""
+        return self._codec
+
+    @property
+    def timeouts(self):
+        """TimingWheel: Schedules the ack and response timeouts of all
+        handlers."""
+        return self._timeouts
+
+    @property
+    def resubscriptions(self):
+        """ResubscribeManager: Restores the subscriptions of all handlers
+        after a reconnect."""
+        return self._resubscriptions
+
     @property
     def record(self):
         return self._record
@@ -1,6 +1,4 @@
 from __future__ import absolute_import, division, print_function, with_statement
-import sys
-import inspect
 
 
 PING = 'PI'
@@ -40,12 +38,9 @@ QUERY = 'Q'
 WRITE_ACKNOWLEDGEMENT = 'WA'
 
 
-_current_module = sys.modules[__name__]
-
-_reverse_lookup_map = dict()
-for name, value in inspect.getmembers(_current_module):
-    if name.isupper():
-        _reverse_lookup_map[value] = name
+_reverse_lookup_map = dict((value, name)
+                           for name, value in list(globals().items())
+                           if name.isupper())
 
 
 def reverse_lookup(action):
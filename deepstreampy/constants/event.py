@@ -18,3 +18,9 @@ TOO_MANY_AUTH_ATTEMPTS = 'TOO_MANY_AUTH_ATTEMPTS'
 IS_CLOSED = 'IS_CLOSED'
 RECORD_NOT_FOUND = 'RECORD_NOT_FOUND'
 NOT_SUBSCRIBED = 'NOT_SUBSCRIBED'
+OUTBOUND_QUEUE_OVERFLOW = 'outboundQueueOverflow'
+RESUBSCRIBE_PROGRESS = 'resubscribeProgress'
+OUTBOUND_QUEUE_COMPACTED = 'outboundQueueCompacted'
+CONNECTION_FAILOVER = 'connectionFailover'
+INBOUND_QUEUE_OVERFLOW = 'inboundQueueOverflow'
+INBOUND_QUEUE_DRAINED = 'inboundQueueDrained'
@@ -0,0 +1,6 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+BLOCK = 'block'
+DROP_OLDEST = 'dropOldest'
+DROP_NEWEST = 'dropNewest'
+RAISE = 'raise'
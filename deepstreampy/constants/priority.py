@@ -0,0 +1,9 @@
+from __future__ import absolute_import, division, print_function, with_statement
+
+# Outbound priority classes, from most to least urgent
+CONTROL = 0
+ACK = 1
+INTERACTIVE = 2
+BULK = 3
+
+CLASSES = (CONTROL, ACK, INTERACTIVE, BULK)
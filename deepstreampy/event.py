@@ -10,7 +10,7 @@ from deepstreampy.message import message_parser
 from deepstreampy.message import message_builder
 from deepstreampy.utils import Listener
 from deepstreampy.utils import AckTimeoutRegistry
-from deepstreampy.utils import ResubscribeNotifier
+from deepstreampy.routing import DispatchTable
 
 from tornado import concurrent
 
@@ -27,13 +27,15 @@ class EventHandler(object):
         self._client = client
         self._emitter = EventEmitter()
         self._listener = {}
+        self._routes = DispatchTable()
+        self.register_routes(self._routes)
 
         subscription_timeout = options.get("subscriptionTimeout", 15)
         self._ack_timeout_registry = AckTimeoutRegistry(client,
                                                         topic_constants.EVENT,
                                                         subscription_timeout)
-        self._resubscribe_notifier = ResubscribeNotifier(client,
-                                                         self._resubscribe)
+        client.on(event_constants.OUTBOUND_QUEUE_COMPACTED,
+                  self._on_queue_compacted)
 
     def subscribe(self, name, callback):
         """Subscribe to an event.
@@ -49,6 +51,8 @@ class EventHandler(object):
         future = None
         if not self._emitter.listeners(name):
             self._ack_timeout_registry.add(name, actions.SUBSCRIBE)
+            self._client.resubscriptions.add(topic_constants.EVENT,
+                                             actions.SUBSCRIBE, name)
             future = self._connection.send_message(topic_constants.EVENT,
                                                    actions.SUBSCRIBE,
                                                    [name])
@@ -75,6 +79,8 @@ class EventHandler(object):
 
         if not self._emitter.listeners(name):
             self._ack_timeout_registry.add(name, actions.UNSUBSCRIBE)
+            self._client.resubscriptions.remove(topic_constants.EVENT,
+                                                actions.SUBSCRIBE, name)
             return self._connection.send_message(topic_constants.EVENT,
                                                  actions.UNSUBSCRIBE,
                                                  [name])
@@ -90,14 +96,15 @@ class EventHandler(object):
 
         Args:
             name (str): The name of the event.
-            data: JSON serializable data to send along with the event.
+            data: JSON serializable data to send along with the event, or an
+                ``EncodedPayload`` of it
 
         """
         future = self._connection.send_message(
             topic_constants.EVENT, actions.EVENT,
-            [name, message_builder.typed(data)])
+            [name, message_builder.typed_part(data, self._client.codec)])
 
-        self._emitter.emit(name, data)
+        self._emitter.emit(name, message_builder.plain_value(data))
 
         return future
 
@@ -165,60 +172,74 @@ class EventHandler(object):
 
         return listener.send_future
 
-    def handle(self, message):
-        action = message['action']
-        data = message['data']
+    def register_routes(self, routes):
+        """Registers the methods handling incoming event messages.
 
-        if action == actions.ACK:
-            name = message['data'][1]
-        else:
-            name = message['data'][0]
+        Args:
+            routes (DispatchTable): the table to register them with
+        """
+        routes.register(topic_constants.EVENT, actions.EVENT, self._on_event)
+        routes.register(topic_constants.EVENT, actions.ACK, self._on_ack)
+        routes.register(topic_constants.EVENT, actions.ERROR,
+                        self._on_error_message)
+        routes.register_fallback(topic_constants.EVENT,
+                                 self._on_listener_message)
 
-        if action == actions.EVENT:
-            if data and len(data) == 2:
-                self._emitter.emit(
-                    name, message_parser.convert_typed(data[1], self._client))
+    def handle(self, message):
+        self._routes.dispatch(message_parser.as_message(message),
+                              topic_constants.EVENT)
+
+    def _on_event(self, message):
+        name = message.data[0]
+        # The data is converted when the first callback runs, and not at all
+        # if there's nobody to hand it to
+        value = message.typed(1, self._client)
+        # A copy, callbacks may unsubscribe while the event is handed out
+        for callback in list(self._emitter.listeners(name)):
+            if value is None:
+                callback()
             else:
-                self._emitter.emit(name)
+                callback(value.value)
 
-            return
-
-        if (action == actions.ACK and data[0] == actions.UNLISTEN and
-                (name in self._listener) and
-                self._listener[name].destroy_pending):
-            self._listener[name].destroy()
+    def _on_ack(self, message):
+        data = message.data
+        name = data[1]
+        listener = self._listener.get(name)
+        if listener is None:
+            self._ack_timeout_registry.clear(message)
+        elif data[0] == actions.UNLISTEN and listener.destroy_pending:
+            listener.destroy()
             del self._listener[name]
-            return
-        elif name in self._listener:
-            self._listener[name]._on_message(message)
-            return
-        elif action in (actions.SUBSCRIPTION_FOR_PATTERN_REMOVED,
-                        actions.SUBSCRIPTION_HAS_PROVIDER):
-            return
+        else:
+            listener._on_message(message)
 
-        if action == actions.ACK:
-            self._ack_timeout_registry.clear(message)
+    def _on_error_message(self, message):
+        data = message.data
+        if data[0] in self._listener:
+            self._listener[data[0]]._on_message(message)
             return
 
-        if action == actions.ERROR:
-            if data[0] == event_constants.MESSAGE_DENIED:
-                self._ack_timeout_registry.remove(message['data'][1],
-                                                  message['data'][2])
+        if data[0] == event_constants.MESSAGE_DENIED:
+            self._ack_timeout_registry.remove(data[1], data[2])
+        elif data[0] == event_constants.NOT_SUBSCRIBED:
+            self._ack_timeout_registry.remove(data[1], actions.UNSUBSCRIBE)
 
-            elif data[0] == event_constants.NOT_SUBSCRIBED:
-                self._ack_timeout_registry.remove(message['data'][1],
-                                                  actions.UNSUBSCRIBE)
+        message.processed_error = True
+        self._client._on_error(topic_constants.EVENT, data[0], data[1])
 
-            message['processedError'] = True
-            self._client._on_error(topic_constants.EVENT, data[0], data[1])
-            return
-
-        self._client._on_error(topic_constants.EVENT,
-                               event_constants.UNSOLICITED_MESSAGE,
-                               name)
-
-    def _resubscribe(self):
-        for event in self._emitter._events:
-            self._connection.send_message(topic_constants.EVENT,
-                                          actions.SUBSCRIBE,
-                                          [event])
+    def _on_listener_message(self, message):
+        name = message.data[0]
+        if name in self._listener:
+            self._listener[name]._on_message(message)
+        elif message.action not in (
+                actions.SUBSCRIPTION_FOR_PATTERN_REMOVED,
+                actions.SUBSCRIPTION_HAS_PROVIDER):
+            self._client._on_error(topic_constants.EVENT,
+                                   event_constants.UNSOLICITED_MESSAGE,
+                                   name)
+
+    def _on_queue_compacted(self, versions, unsubscribed):
+        for topic, name in unsubscribed:
+            if topic == topic_constants.EVENT:
+                self._ack_timeout_registry.remove(name, actions.SUBSCRIBE)
+                self._ack_timeout_registry.remove(name, actions.UNSUBSCRIBE)
@@ -0,0 +1,125 @@
+"""Sends NumPy arrays as their raw buffer instead of lists of numbers."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.message.codec import Codec
+
+import base64
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Key of the object an array is sent as, next to "dtype" and "shape"
+ARRAY_KEY = '__ndarray__'
+_ARRAY_MARKER = '"{0}"'.format(ARRAY_KEY)
+_ARRAY_MARKER_BYTES = _ARRAY_MARKER.encode()
+
+
+def encode_array(array):
+    """Return the object ``array`` is sent as.
+
+    The buffer of the array is sent base64 encoded, along with its dtype,
+    including the byte order, and its shape.
+
+    Raises:
+        ValueError: for arrays of Python objects or of structured dtypes,
+            which have no portable buffer
+    """
+    dtype = array.dtype
+    if dtype.hasobject or dtype.fields is not None:
+        raise ValueError("Can't send arrays of dtype {0}".format(dtype))
+    data = numpy.ascontiguousarray(array).tobytes()
+    return {ARRAY_KEY: base64.b64encode(data).decode('ascii'),
+            'dtype': dtype.str,
+            'shape': list(array.shape)}
+
+
+def decode_array(obj):
+    """Return the array of an object made by ``encode_array``.
+
+    The array is a read-only view of the decoded buffer, no Python object is
+    created per element.
+
+    Raises:
+        ValueError: if the object doesn't describe a valid array
+    """
+    try:
+        dtype = numpy.dtype(obj['dtype'])
+    except (KeyError, TypeError) as e:
+        raise ValueError('Invalid array dtype: {0}'.format(e))
+    if dtype.hasobject:
+        raise ValueError("Can't receive arrays of dtype {0}".format(dtype))
+    data = base64.b64decode(obj[ARRAY_KEY])
+    return numpy.frombuffer(data, dtype=dtype).reshape(obj.get('shape', -1))
+
+
+def _encode_default(obj):
+    if isinstance(obj, numpy.ndarray):
+        return encode_array(obj)
+    raise TypeError('{0!r} is not JSON serializable'.format(obj))
+
+
+def _decode_object(obj):
+    if ARRAY_KEY in obj:
+        return decode_array(obj)
+    return obj
+
+
+class ArrayCodec(Codec):
+    """Wraps a codec to send NumPy arrays, also inside dicts and lists, as
+    objects holding their raw buffer.
+
+    An array of 100k floats is sent as about 1 MB of base64 instead of being
+    turned into 100k Python floats and written as JSON numbers, and is
+    received through ``numpy.frombuffer``. Other deepstream clients see an
+    object with the keys ``__ndarray__``, ``dtype`` and ``shape``.
+
+    Arrays are encoded through the ``default`` hook of the wrapped codec, so
+    values without arrays are written as they are. Only messages that contain
+    an array are parsed with an ``object_hook`` that turns them back into
+    arrays, everything else is parsed by the wrapped codec as usual.
+    """
+
+    def __init__(self, codec):
+        """
+        Args:
+            codec (Codec): the codec that writes and parses the JSON
+
+        Raises:
+            ImportError: if NumPy isn't installed
+        """
+        if numpy is None:
+            raise ImportError('numpyArrays requires NumPy')
+        self._codec = codec
+
+    def encodes(self, value):
+        return isinstance(value, numpy.ndarray)
+
+    def dumps(self, value, sort_keys=False, default=None):
+        if default is None:
+            return self._codec.dumps(value, sort_keys, _encode_default)
+
+        def encode(obj):
+            if isinstance(obj, numpy.ndarray):
+                return encode_array(obj)
+            return default(obj)
+
+        return self._codec.dumps(value, sort_keys, encode)
+
+    def loads(self, data, object_hook=None):
+        marker = (_ARRAY_MARKER_BYTES if isinstance(data, bytes)
+                  else _ARRAY_MARKER)
+        if marker not in data:
+            return self._codec.loads(data, object_hook)
+        if object_hook is None:
+            return self._codec.loads(data, _decode_object)
+
+        def decode(obj):
+            if ARRAY_KEY in obj:
+                return decode_array(obj)
+            return object_hook(obj)
+
+        return self._codec.loads(data, decode)
@@ -0,0 +1,466 @@
+"""A lean RFC 6455 websocket client on asyncio streams.
+
+Only available on Python 3. Runs on whichever asyncio event loop is current,
+including uvloop.
+"""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.message.transport import Transport
+
+from tornado import ioloop
+from tornado.log import app_log
+
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+import zlib
+
+from urllib.parse import urlsplit
+
+_ACCEPT_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+_OPCODE_CONTINUATION = 0x0
+_OPCODE_TEXT = 0x1
+_OPCODE_BINARY = 0x2
+_OPCODE_CLOSE = 0x8
+_OPCODE_PING = 0x9
+_OPCODE_PONG = 0xa
+
+_FIN = 0x80
+_RSV1 = 0x40
+_MASKED = 0x80
+
+_RSV = 0x70
+
+_DEFLATE_TAIL = b'\x00\x00\xff\xff'
+_CLOSE_TIMEOUT = 5
+# Seconds to connect and upgrade, tornado's default
+_HANDSHAKE_TIMEOUT = 20
+# Close code for a frame that breaks the protocol
+_CLOSE_PROTOCOL_ERROR = 1002
+# Close code for a message that can't be decompressed
+_CLOSE_INVALID_DATA = 1007
+
+
+class HandshakeError(IOError):
+    """Raised when the server doesn't accept the websocket upgrade."""
+
+
+class AsyncioLoop(object):
+    """Exposes an asyncio event loop with the IOLoop methods the client
+    uses."""
+
+    def __init__(self, loop):
+        self._loop = loop
+
+    def call_later(self, delay, callback, *args):
+        return self._loop.call_later(delay, callback, *args)
+
+    def remove_timeout(self, timeout):
+        if timeout is not None:
+            timeout.cancel()
+
+    def add_callback(self, callback, *args):
+        # Unlike IOLoop.add_callback this is not thread safe, every caller in
+        # the client runs on the loop already
+        self._loop.call_soon(callback, *args)
+
+    def time(self):
+        return self._loop.time()
+
+    def start(self):
+        self._loop.run_forever()
+
+    def stop(self):
+        self._loop.stop()
+
+    @property
+    def asyncio_loop(self):
+        return self._loop
+
+
+class AsyncioTransport(Transport):
+    """Runs connections directly on an asyncio event loop."""
+
+    def __init__(self, loop=None, use_uvloop=False):
+        if loop is None:
+            loop = _current_loop(use_uvloop)
+        self._loop = loop
+        self._io_loop = AsyncioLoop(loop)
+
+    @property
+    def io_loop(self):
+        return self._io_loop
+
+    def connect(self, url, on_open, on_message, compression=None):
+        future = asyncio.ensure_future(
+            AsyncioWebSocket.connect(url, on_message, compression),
+            loop=self._loop)
+
+        def on_connected(f):
+            # Frames the server sends right after the upgrade wait until the
+            # connection knows its websocket
+            try:
+                on_open(f)
+            finally:
+                if not f.cancelled() and f.exception() is None:
+                    f.result().start_reading()
+
+        future.add_done_callback(on_connected)
+        return future
+
+    def pause_reading(self, websocket_handler):
+        websocket_handler.pause_reading()
+
+    def resume_reading(self, websocket_handler):
+        websocket_handler.resume_reading()
+
+
+class AsyncioWebSocket(object):
+    """A client side websocket.
+
+    Messages are delivered as bytes, without decoding text frames, so they can
+    be handed to ``message_parser.parse_bytes`` as they are. Nothing is read
+    until ``start_reading`` is called.
+    """
+
+    def __init__(self, reader, writer, on_message, deflate=None):
+        self._reader = reader
+        self._writer = writer
+        self._on_message = on_message
+        self._deflate = deflate
+        self._closing = False
+        self._closed = False
+        self._read_task = None
+        self._close_timeout = None
+        self._resumed = None
+        self._loop = asyncio.get_running_loop()
+
+    @classmethod
+    async def connect(cls, url, on_message, compression=None):
+        """Open a websocket.
+
+        Raises:
+            HandshakeError: if the server doesn't accept the upgrade, or
+                doesn't answer within ``_HANDSHAKE_TIMEOUT`` seconds
+        """
+        try:
+            return await asyncio.wait_for(
+                cls._handshake(url, on_message, compression),
+                _HANDSHAKE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HandshakeError('Websocket handshake timed out')
+
+    @classmethod
+    async def _handshake(cls, url, on_message, compression):
+        parts = urlsplit(url)
+        secure = parts.scheme in ('wss', 'https')
+        port = parts.port or (443 if secure else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        ssl_context = ssl.create_default_context() if secure else None
+        reader, writer = await asyncio.open_connection(parts.hostname, port,
+                                                       ssl=ssl_context)
+
+        key = base64.b64encode(os.urandom(16))
+        request = [
+            'GET {0} HTTP/1.1'.format(path),
+            'Host: {0}:{1}'.format(parts.hostname, port),
+            'Upgrade: websocket',
+            'Connection: Upgrade',
+            'Sec-WebSocket-Key: {0}'.format(key.decode()),
+            'Sec-WebSocket-Version: 13']
+        if compression is not None:
+            offer = 'permessage-deflate; client_max_window_bits'
+            if not compression['context_takeover']:
+                offer += '; client_no_context_takeover'
+            request.append('Sec-WebSocket-Extensions: ' + offer)
+        writer.write(('\r\n'.join(request) + '\r\n\r\n').encode())
+
+        try:
+            response = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            raise HandshakeError('Connection closed during handshake')
+        except asyncio.CancelledError:
+            writer.close()
+            raise
+
+        status, headers = _parse_response(response)
+        accept = base64.b64encode(hashlib.sha1(key + _ACCEPT_GUID).digest())
+        if (status != 101 or
+                headers.get('sec-websocket-accept', '').encode() != accept):
+            writer.close()
+            raise HandshakeError(
+                'Websocket upgrade failed with status {0}'.format(status))
+
+        deflate = None
+        extensions = headers.get('sec-websocket-extensions')
+        if compression is not None and extensions:
+            deflate = _Deflate.negotiated(extensions, compression)
+
+        return cls(reader, writer, on_message, deflate)
+
+    @property
+    def stream(self):
+        return self
+
+    def closed(self):
+        return self._closing or self._closed
+
+    def write_message(self, message, binary=False):
+        """Write a message in a single frame.
+
+        Returns:
+            asyncio.Future: resolves once the message has been handed to the
+                socket, or once the socket's write buffer has drained if it
+                was above its high-water mark
+        """
+        if isinstance(message, str):
+            message = message.encode()
+
+        flags = _FIN
+        if self._deflate is not None and self._deflate.should_compress(
+                message):
+            message = self._deflate.compress(message)
+            flags |= _RSV1
+
+        opcode = _OPCODE_BINARY if binary else _OPCODE_TEXT
+        self._write_frame(flags | opcode, message)
+
+        # drain() returns straight away if the buffer is below the high-water
+        # mark, so only wait on it when it isn't
+        if self._writer.transport.get_write_buffer_size() == 0:
+            future = self._loop.create_future()
+            future.set_result(None)
+            return future
+        return asyncio.ensure_future(self._writer.drain())
+
+    def close(self, code=1000):
+        if self._closing or self._closed:
+            return
+        self._closing = True
+        # The server's close frame has to be read
+        self.resume_reading()
+        self._write_frame(_FIN | _OPCODE_CLOSE, struct.pack('!H', code))
+        # Wait for the server to reply with a close frame, then give up
+        self._close_timeout = self._loop.call_later(_CLOSE_TIMEOUT,
+                                                    self._abort)
+
+    def start_reading(self):
+        """Start reading frames and delivering messages."""
+        if self._read_task is None:
+            self._read_task = asyncio.ensure_future(self._read_frames())
+
+    def pause_reading(self):
+        """Stop reading frames until ``resume_reading`` is called.
+
+        The stream reader stops reading from the socket once its buffer is
+        full, so the server is held back by TCP flow control.
+        """
+        if self._resumed is None:
+            self._resumed = self._loop.create_future()
+
+    def resume_reading(self):
+        resumed = self._resumed
+        self._resumed = None
+        if resumed is not None:
+            resumed.set_result(None)
+
+    def _abort(self):
+        self._writer.close()
+
+    def _fail(self, code):
+        # Sends a close frame without waiting for the reply, the caller stops
+        # reading and closes the socket
+        if not self._closing:
+            self._closing = True
+            self._write_frame(_FIN | _OPCODE_CLOSE, struct.pack('!H', code))
+
+    def _write_frame(self, first_byte, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', first_byte, _MASKED | length)
+        elif length < 65536:
+            header = struct.pack('!BBH', first_byte, _MASKED | 126, length)
+        else:
+            header = struct.pack('!BBQ', first_byte, _MASKED | 127, length)
+        mask = os.urandom(4)
+        self._writer.write(header + mask)
+        self._writer.write(_apply_mask(payload, mask))
+
+    async def _read_frames(self):
+        reader = self._reader
+        fragments = []
+        compressed = False
+        try:
+            while True:
+                if self._resumed is not None:
+                    await self._resumed
+                first_byte, second_byte = await reader.readexactly(2)
+                opcode = first_byte & 0x0f
+                length = second_byte & 0x7f
+                if length == 126:
+                    length, = struct.unpack('!H', await reader.readexactly(2))
+                elif length == 127:
+                    length, = struct.unpack('!Q', await reader.readexactly(8))
+                mask = None
+                if second_byte & _MASKED:
+                    mask = await reader.readexactly(4)
+                payload = await reader.readexactly(length) if length else b''
+                if mask is not None:
+                    payload = _apply_mask(payload, mask)
+
+                if opcode == _OPCODE_CLOSE:
+                    if not self._closing:
+                        self._closing = True
+                        self._write_frame(_FIN | _OPCODE_CLOSE, payload[:2])
+                    break
+                elif opcode == _OPCODE_PING:
+                    self._write_frame(_FIN | _OPCODE_PONG, payload)
+                    continue
+                elif opcode == _OPCODE_PONG:
+                    continue
+
+                # RSV1 marks a compressed message, and only if
+                # permessage-deflate was negotiated
+                reserved = first_byte & _RSV
+                if (reserved & ~_RSV1 or
+                        (reserved and (self._deflate is None or
+                                       opcode == _OPCODE_CONTINUATION))):
+                    self._fail(_CLOSE_PROTOCOL_ERROR)
+                    break
+                if opcode != _OPCODE_CONTINUATION:
+                    compressed = bool(reserved)
+                fragments.append(payload)
+                if not first_byte & _FIN:
+                    continue
+
+                message = (fragments[0] if len(fragments) == 1
+                           else b''.join(fragments))
+                fragments = []
+                if compressed:
+                    try:
+                        message = self._deflate.decompress(message)
+                    except zlib.error:
+                        # The stream can't be read past a corrupt message
+                        self._fail(_CLOSE_INVALID_DATA)
+                        break
+                self._deliver(message)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            self._closed = True
+            if self._close_timeout is not None:
+                self._close_timeout.cancel()
+            self._writer.close()
+            self._deliver(None)
+
+    def _deliver(self, message):
+        # A failing handler must not stop the frames after it
+        try:
+            self._on_message(message)
+        except Exception:
+            app_log.error("Exception in message callback %r",
+                          self._on_message, exc_info=True)
+
+
+class _Deflate(object):
+    """permessage-deflate (RFC 7692) as negotiated for one websocket."""
+
+    def __init__(self, level, threshold, client_takeover, server_takeover,
+                 client_wbits, server_wbits):
+        self._level = level
+        self._threshold = threshold
+        self._client_takeover = client_takeover
+        self._server_takeover = server_takeover
+        self._client_wbits = client_wbits
+        self._server_wbits = server_wbits
+        self._compressor = self._create_compressor()
+        self._decompressor = zlib.decompressobj(-self._server_wbits)
+
+    @classmethod
+    def negotiated(cls, extensions, compression):
+        for extension in extensions.split(','):
+            params = [param.strip() for param in extension.split(';')]
+            if params[0] != 'permessage-deflate':
+                continue
+            agreed = {}
+            for param in params[1:]:
+                name, _, value = param.partition('=')
+                agreed[name.strip()] = value.strip().strip('"')
+            return cls(compression['level'],
+                       compression['threshold'],
+                       (compression['context_takeover'] and
+                        'client_no_context_takeover' not in agreed),
+                       'server_no_context_takeover' not in agreed,
+                       int(agreed.get('client_max_window_bits') or 15),
+                       int(agreed.get('server_max_window_bits') or 15))
+
+    def should_compress(self, message):
+        return len(message) >= self._threshold
+
+    def compress(self, message):
+        compressor = self._compressor
+        if not self._client_takeover:
+            compressor = self._create_compressor()
+        data = (compressor.compress(message) +
+                compressor.flush(zlib.Z_SYNC_FLUSH))
+        return data[:-4]
+
+    def decompress(self, message):
+        if not self._server_takeover:
+            self._decompressor = zlib.decompressobj(-self._server_wbits)
+        return self._decompressor.decompress(message + _DEFLATE_TAIL)
+
+    def _create_compressor(self):
+        return zlib.compressobj(self._level, zlib.DEFLATED,
+                                -self._client_wbits)
+
+
+def _apply_mask(data, mask):
+    """XOR ``data`` with the repeated 4 byte ``mask``.
+
+    Done on a single big integer, which keeps the loop in C.
+    """
+    length = len(data)
+    if not length:
+        return data
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(data, 'big') ^
+            int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+
+def _parse_response(response):
+    lines = response.decode('latin-1').split('\r\n')
+    status_line = lines[0].split(' ', 2)
+    status = int(status_line[1]) if len(status_line) > 1 else 0
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+def _current_loop(use_uvloop):
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+
+    if use_uvloop:
+        import uvloop
+        loop = uvloop.new_event_loop()
+        asyncio.set_event_loop(loop)
+        return loop
+
+    # The loop tornado's IOLoop runs on, created if there is none yet
+    return ioloop.IOLoop.current().asyncio_loop
@@ -0,0 +1,183 @@
+"""JSON codecs used to serialize and parse message data."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.utils import str_types
+
+import json
+import re
+
+STDLIB = 'json'
+ORJSON = 'orjson'
+
+_factories = {}
+_codecs = {}
+_default = None
+_array_codecs = {}
+
+# Numbers this long may be integers orjson can't hold in 64 bits
+_LONG_NUMBER = re.compile(r'\d{19}')
+_LONG_NUMBER_BYTES = re.compile(br'\d{19}')
+
+
+def register_codec(name, factory):
+    """Make a codec available under ``name``.
+
+    Args:
+        name (str): the name to pass as the ``jsonCodec`` option
+        factory (callable): called without arguments the first time the codec
+            is used, returns an instance of ``Codec``. It may raise
+            ``ImportError`` if a library the codec needs isn't installed.
+    """
+    _factories[name] = factory
+    _codecs.pop(name, None)
+
+
+def get_codec(codec=None):
+    """Return the codec a client should use.
+
+    Codecs are created once per name and shared by all clients.
+
+    Args:
+        codec: the name of a registered codec, an instance of ``Codec``, or
+            None for the fastest codec that is installed: ``'orjson'`` if it
+            can be imported, ``'json'`` otherwise. See ``OrjsonCodec`` for
+            how its output differs.
+    """
+    global _default
+
+    if codec is None:
+        if _default is None:
+            try:
+                _default = get_codec(ORJSON)
+            except ImportError:
+                _default = get_codec(STDLIB)
+        return _default
+
+    if not isinstance(codec, str_types):
+        return codec
+
+    if codec not in _codecs:
+        if codec not in _factories:
+            raise ValueError("Unknown JSON codec {0}".format(codec))
+        _codecs[codec] = _factories[codec]()
+    return _codecs[codec]
+
+
+def get_client_codec(jsonCodec=None, numpyArrays=False, **options):
+    """Return the codec a client and its connections should use.
+
+    Args:
+        jsonCodec: see ``get_codec``
+        numpyArrays (bool): whether NumPy arrays can be sent and received,
+            see ``arrays.ArrayCodec``. Requires NumPy.
+        **options: the remaining client options
+    """
+    codec = get_codec(jsonCodec)
+    if not numpyArrays:
+        return codec
+
+    if codec not in _array_codecs:
+        from deepstreampy.message.arrays import ArrayCodec
+        _array_codecs[codec] = ArrayCodec(codec)
+    return _array_codecs[codec]
+
+
+class Codec(object):
+    """Turns values into compact JSON and back.
+
+    Whichever codec is used, the output has to be JSON the server accepts:
+    no whitespace between tokens, and keys in sorted order if asked for.
+    """
+
+    def dumps(self, value, sort_keys=False, default=None):
+        """Return ``value`` as a JSON str.
+
+        Args:
+            value: the value to write
+            sort_keys (bool): whether to write the keys of dicts in sorted
+                order
+            default (callable): called with values the codec can't write,
+                returns a value it can or raises ``TypeError``, like the
+                ``default`` of ``json.dumps``
+        """
+        raise NotImplementedError()
+
+    def loads(self, data, object_hook=None):
+        """Return the value of the JSON in ``data``, a str or bytes.
+
+        Args:
+            data: the JSON
+            object_hook (callable): called with every parsed dict, its result
+                is used instead, like the ``object_hook`` of ``json.loads``
+
+        Raises:
+            ValueError: if ``data`` isn't valid JSON
+        """
+        raise NotImplementedError()
+
+    def encodes(self, value):
+        """Whether ``dumps`` accepts ``value`` although it isn't a dict or
+        list, and it should be sent as an object."""
+        return False
+
+
+class JsonCodec(Codec):
+    """The codec of the standard library's ``json`` module."""
+
+    def dumps(self, value, sort_keys=False, default=None):
+        return json.dumps(value, separators=(',', ':'), sort_keys=sort_keys,
+                          default=default)
+
+    def loads(self, data, object_hook=None):
+        if isinstance(data, bytes) and not isinstance(data, str):
+            data = data.decode()
+        return json.loads(data, object_hook=object_hook)
+
+
+class OrjsonCodec(Codec):
+    """A codec on top of ``orjson``, several times faster than the standard
+    library.
+
+    Unlike the standard library it writes non-ASCII characters as they are
+    instead of escaping them, and writes NaN and infinity as null. Both are
+    still the same values to a JSON parser.
+
+    Whatever orjson can't handle, like integers wider than 64 bits or NaN in
+    received JSON, is left to the standard library, so values are accepted
+    and rejected as ``JsonCodec`` would. So is parsing with an
+    ``object_hook``, which orjson doesn't have.
+    """
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS
+        self._sorted_options = self._options | orjson.OPT_SORT_KEYS
+        self._fallback = JsonCodec()
+
+    def dumps(self, value, sort_keys=False, default=None):
+        options = self._sorted_options if sort_keys else self._options
+        try:
+            return self._orjson.dumps(value, default=default,
+                                      option=options).decode()
+        except self._orjson.JSONEncodeError:
+            return self._fallback.dumps(value, sort_keys, default)
+
+    def loads(self, data, object_hook=None):
+        if object_hook is not None:
+            return self._fallback.loads(data, object_hook)
+        long_number = (_LONG_NUMBER if isinstance(data, str)
+                       else _LONG_NUMBER_BYTES)
+        # orjson would read wide integers as floats
+        if long_number.search(data) is not None:
+            return self._fallback.loads(data)
+        try:
+            return self._orjson.loads(data)
+        except self._orjson.JSONDecodeError:
+            return self._fallback.loads(data)
+
+
+register_codec(STDLIB, JsonCodec)
+register_codec(ORJSON, OrjsonCodec)
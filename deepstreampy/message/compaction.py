@@ -0,0 +1,218 @@
+"""Shrinks the queue of messages that were sent while the connection was
+down."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.constants import actions
+from deepstreampy.constants import topic as topic_constants
+from deepstreampy.constants import message as message_constants
+from deepstreampy.message import message_parser
+from deepstreampy import jsonpath
+from deepstreampy.message import codec as codecs
+
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+
+Compaction = namedtuple('Compaction', 'messages superseded cancelled '
+                                      'versions unsubscribed')
+Compaction.__doc__ = """The outcome of ``compact``.
+
+Attributes:
+    messages (list): the ``(raw_message, future)`` pairs left, in order
+    superseded (list): ``(future, successor)`` for every message that was
+        folded into a later one, the future should resolve with the successor
+    cancelled (list): futures of subscriptions that were dropped together
+        with their unsubscription
+    versions (dict): record name to the sorted versions of its writes that
+        were dropped
+    unsubscribed (list): ``(topic, name)`` of every dropped subscription
+"""
+
+# Subscribing actions that are undone by an UNSUBSCRIBE of the same name
+_SUBSCRIBE_ACTIONS = {
+    topic_constants.RECORD: actions.CREATEORREAD,
+    topic_constants.EVENT: actions.SUBSCRIBE,
+    topic_constants.RPC: actions.SUBSCRIBE}
+
+# A write without the write acknowledgement config
+_UPDATE_SIZE = 3
+_PATCH_SIZE = 4
+
+
+class _Entry(object):
+
+    __slots__ = ('raw', 'future', 'topic', 'action', 'data', 'dropped',
+                 'value')
+
+    def __init__(self, raw, future):
+        self.raw = raw
+        self.future = future
+        self.dropped = False
+        self.value = None
+
+        text = raw.decode('utf-8')
+        if text.count(message_constants.MESSAGE_SEPERATOR) != 1:
+            # A packet of several messages, left as it is
+            self.topic = self.action = self.data = None
+            return
+        parts = text.rstrip(message_constants.MESSAGE_SEPERATOR).split(
+            message_constants.MESSAGE_PART_SEPERATOR)
+        self.topic = parts[0]
+        self.action = parts[1] if len(parts) > 1 else None
+        self.data = parts[2:]
+
+    def rebuild(self):
+        self.raw = (message_constants.MESSAGE_PART_SEPERATOR.join(
+            [self.topic, self.action] + self.data) +
+            message_constants.MESSAGE_SEPERATOR).encode('utf-8')
+
+
+class _Run(object):
+    """The writes to a record since the last other message about it."""
+
+    __slots__ = ('update', 'patches')
+
+    def __init__(self):
+        self.update = None
+        self.patches = OrderedDict()
+
+
+def compact(queued_messages, client, codec=None):
+    """Drops messages from an offline queue that no longer matter.
+
+    Consecutive writes to the same record are folded: an UPDATE replaces the
+    writes before it, a PATCH replaces an earlier PATCH of the same path and
+    is merged into an earlier UPDATE. Versions of the remaining writes are
+    renumbered to stay consecutive. Writes that ask for a write
+    acknowledgement are left alone. A record, event or RPC subscription that
+    is followed by its unsubscription, with nothing else about the name in
+    between, is dropped together with it. Everything else is kept in order.
+
+    Args:
+        queued_messages: ``(raw_message, future)`` pairs, each raw message as
+            bytes
+        client: the client to report parse errors to
+        codec (Codec): the codec to parse and serialize record data with, by
+            default the one ``codec.get_codec`` picks
+
+    Returns:
+        Compaction
+    """
+    if codec is None:
+        codec = codecs.get_codec()
+    entries = [_Entry(raw, future) for raw, future in queued_messages]
+    superseded = []
+    cancelled = []
+    versions = {}
+    unsubscribed = []
+
+    def drop(entry, successor=None):
+        entry.dropped = True
+        if successor is not None:
+            superseded.append((entry.future, successor.future))
+        if entry.topic == topic_constants.RECORD and entry.action in (
+                actions.UPDATE, actions.PATCH):
+            versions.setdefault(entry.data[0], []).append(int(entry.data[1]))
+
+    runs = {}
+    subscriptions = {}
+    for entry in entries:
+        if entry.topic is None or not entry.data:
+            runs.clear()
+            subscriptions.clear()
+            continue
+
+        name = entry.data[0]
+        if entry.topic == topic_constants.RECORD:
+            if (entry.action == actions.UPDATE and
+                    len(entry.data) == _UPDATE_SIZE):
+                run = runs.setdefault(name, _Run())
+                for earlier in list(run.patches.values()) + [run.update]:
+                    if earlier is not None:
+                        drop(earlier, entry)
+                run.update = entry
+                run.patches.clear()
+            elif (entry.action == actions.PATCH and
+                  len(entry.data) == _PATCH_SIZE):
+                run = runs.setdefault(name, _Run())
+                path = entry.data[2]
+                if run.update is not None:
+                    update = run.update
+                    if update.value is None:
+                        update.value = codec.loads(update.data[2])
+                    update.value = jsonpath.set(
+                        update.value, path,
+                        message_parser.convert_typed(entry.data[3], client,
+                                                     codec),
+                        False)
+                    drop(entry, update)
+                else:
+                    earlier = run.patches.pop(path, None)
+                    if earlier is not None:
+                        drop(earlier, entry)
+                    run.patches[path] = entry
+            else:
+                runs.pop(name, None)
+
+        if entry.topic not in _SUBSCRIBE_ACTIONS:
+            continue
+
+        key = (entry.topic, name)
+        if entry.action == _SUBSCRIBE_ACTIONS[entry.topic]:
+            subscriptions[key] = entry
+        elif (entry.action == actions.UNSUBSCRIBE and
+              key in subscriptions):
+            subscription = subscriptions.pop(key)
+            drop(subscription)
+            drop(entry)
+            cancelled.extend([subscription.future, entry.future])
+            unsubscribed.append(key)
+        else:
+            # Acks and RPC responses name the action first
+            subscriptions.pop(key, None)
+            if len(entry.data) > 1:
+                subscriptions.pop((entry.topic, entry.data[1]), None)
+
+    for dropped_versions in versions.values():
+        dropped_versions.sort()
+
+    messages = []
+    for entry in entries:
+        if entry.dropped:
+            continue
+
+        changed = entry.value is not None
+        if changed:
+            entry.data[2] = codec.dumps(entry.value, sort_keys=True)
+        if (entry.topic == topic_constants.RECORD and
+                entry.action in (actions.UPDATE, actions.PATCH) and
+                entry.data[0] in versions):
+            version = int(entry.data[1])
+            new_version = compacted_version(version,
+                                            versions[entry.data[0]])
+            if new_version != version:
+                entry.data[1] = str(new_version)
+                changed = True
+        if changed:
+            entry.rebuild()
+
+        messages.append((entry.raw, entry.future))
+
+    return Compaction(messages, superseded, cancelled, versions, unsubscribed)
+
+
+def compacted_version(version, dropped_versions):
+    """The version a record write ends up with after compaction.
+
+    A dropped write ends up with the version of the write it was folded
+    into, or the one before it.
+
+    Args:
+        version (int): the version before compaction
+        dropped_versions (list): the sorted versions of the record's writes
+            that were dropped
+    """
+    if version is None:
+        return None
+    return version - bisect_right(dropped_versions, version)
@@ -3,39 +3,101 @@ from __future__ import unicode_literals
 
 from deepstreampy.utils import str_types
 from deepstreampy import constants
-from deepstreampy.message import message_builder, message_parser
-
-from tornado import ioloop, concurrent, websocket, gen
-
-from collections import deque
+from deepstreampy.constants import overflow_policy, priority
+from deepstreampy.message import compaction, dispatch, endpoints, journal
+from deepstreampy.message import codec as codecs
+from deepstreampy.message import message_builder
+from deepstreampy.message import latency, message_parser, scheduler
+from deepstreampy.message import transport
+from deepstreampy.message.framer import MessageFramer
+
+from tornado import concurrent
+
+from collections import OrderedDict, namedtuple
+from functools import partial
 import errno
-import time
+
+QueueDepth = namedtuple('QueueDepth', 'messages bytes')
+
+# Messages of these topics establish the connection, everything else waits
+# until it is open
+_HANDSHAKE_TOPICS = frozenset([constants.topic.CONNECTION.encode(),
+                               constants.topic.AUTH.encode()])
+_PART_SEPERATOR = constants.message.MESSAGE_PART_SEPERATOR.encode()
+
+# Incoming messages of the handshake topics skip the dispatch queue, as
+# bytes or as text depending on the transport
+_CONTROL_PREFIXES = frozenset(
+    prefix
+    for topic in (constants.topic.CONNECTION, constants.topic.AUTH)
+    for text in (topic + constants.message.MESSAGE_PART_SEPERATOR,)
+    for prefix in (text, text.encode()))
+
+# Actions the server acknowledges, the time until the ack is a round trip
+_ACKNOWLEDGED_ACTIONS = frozenset(
+    action.encode() for action in (constants.actions.SUBSCRIBE,
+                                   constants.actions.UNSUBSCRIBE,
+                                   constants.actions.CREATEORREAD,
+                                   constants.actions.DELETE,
+                                   constants.actions.LISTEN,
+                                   constants.actions.UNLISTEN,
+                                   constants.actions.REQUEST))
+_CREATEORREAD = constants.actions.CREATEORREAD.encode()
+
+# Round trips measured before they may shorten the dead peer timeout
+_DEAD_PEER_MIN_SAMPLES = 8
+# Seconds a ping may be late at least, however fast the round trips
+_DEAD_PEER_MIN_TIMEOUT = 5
+_SUBSCRIBE = constants.actions.SUBSCRIBE.encode()
+_MAX_PENDING_ROUND_TRIPS = 1024
+# Seconds per dispatch slice when only an inbound budget is configured
+_DEFAULT_SLICE_TIME = 0.01
+
+
+class OutboundQueueFull(Exception):
+    """Raised by ``Connection.send`` when the outbound queue is full and the
+    overflow policy is ``raise``."""
 
 
 class Connection(object):
 
     def __init__(self, client, url, **options):
-        self._io_loop = ioloop.IOLoop.current()
+        """
+        Args:
+            client: the client messages are handed to
+            url: the url of the server, or a list of urls of equivalent
+                servers. After the connection was lost, all of them are tried
+                at once and the first to complete the handshake is used.
+            **options: the client options
+        """
+        self._transport = transport.get_transport(**options)
+        self._io_loop = self._transport.io_loop
+        self._codec = codecs.get_client_codec(**options)
 
         self._client = client
-        self._original_url = url
-        self._url = self._original_url
+        self._endpoints = endpoints.EndpointSet(url)
+        self._url = self._endpoints.best
         self._websocket_handler = None
+        self._probes = []
 
         self._auth_params = None
         self._auth_future = None
         self._connect_callback = None
         self._connect_error = None
 
-        self._message_buffer = ""
+        self._framer = MessageFramer()
+        self._dispatcher = None
         self._deliberate_close = False
         self._redirecting = False
         self._too_many_auth_attempts = False
-        self._queued_messages = deque()
+        self._queued_messages = scheduler.OutboundQueue()
         self._reconnect_timeout = None
         self._reconnection_attempt = 0
 
         self._current_packet_message_count = 0
+        self._current_packet_size = 0
+        self._current_packet_bulk_size = 0
+        self._current_packet = []
         self._send_next_packet_timeout = None
         self._last_heartbeat = None
         self._heartbeat_callback = None
@@ -51,29 +113,140 @@ class Connection(object):
             'reconnectAttemptInterval', 4)
         self._max_reconnect_interval = options.get(
             'maxReconnectInterval', 18)
+        self._reconnect_backoff = endpoints.DecorrelatedJitter(
+            self._reconnect_interval_increment, self._max_reconnect_interval)
         self._heartbeat_interval = options.get('heartbeatInterval', 100)
+        self._dead_peer_min_timeout = options.get('deadPeerMinTimeout',
+                                                  _DEAD_PEER_MIN_TIMEOUT)
+        self._rtt = latency.RoundTripEstimator()
+        self._ping_interval = latency.IntervalEstimator()
+        self._pending_round_trips = OrderedDict()
+        self._auth_sent_at = None
+
+        self._batch_messages = options.get('batchMessages', False)
+        self._max_messages_per_packet = options.get('maxMessagesPerPacket',
+                                                    100)
+        self._max_packet_size = options.get('maxPacketSize', 64 * 1024)
+        self._max_batch_delay = options.get('maxBatchDelay', 0)
+
+        self._high_water_bytes = options.get('outboundHighWaterBytes')
+        self._high_water_messages = options.get('outboundHighWaterMessages')
+        self._low_water_bytes = options.get(
+            'outboundLowWaterBytes', _half(self._high_water_bytes))
+        self._low_water_messages = options.get(
+            'outboundLowWaterMessages', _half(self._high_water_messages))
+        self._overflow_policy = options.get('outboundOverflowPolicy',
+                                            overflow_policy.BLOCK)
+        self._buffered_bytes = 0
+        self._buffered_messages = 0
+        self._in_flight_bytes = 0
+        self._in_flight_messages = 0
+        self._bulk_in_flight_bytes = 0
+        self._bulk_in_flight_limit = options.get('bulkInFlightBytes',
+                                                 64 * 1024)
+        self._outbound_overflowing = False
+        self._drain_futures = []
+
+        self._compression = options.get('compression', False)
+        self._compression_level = options.get('compressionLevel', 6)
+        self._compression_threshold = options.get('compressionThreshold', 1024)
+        self._compression_context_takeover = options.get(
+            'compressionContextTakeover', True)
+
+        self._compact_offline_queue = options.get('compactOfflineQueue', False)
+        self._compaction_threshold = options.get(
+            'offlineQueueCompactionThreshold', 1000)
+        self._compact_at = self._compaction_threshold
+
+        self._inbound_high_water_bytes = options.get('inboundHighWaterBytes')
+        self._inbound_high_water_messages = options.get(
+            'inboundHighWaterMessages')
+        self._inbound_low_water_bytes = options.get(
+            'inboundLowWaterBytes', _half(self._inbound_high_water_bytes))
+        self._inbound_low_water_messages = options.get(
+            'inboundLowWaterMessages',
+            _half(self._inbound_high_water_messages))
+        self._reading_paused = False
+
+        slice_time = options.get('dispatchSliceTime')
+        if slice_time is None and (
+                self._inbound_high_water_bytes is not None or
+                self._inbound_high_water_messages is not None):
+            slice_time = _DEFAULT_SLICE_TIME
+        if slice_time is not None:
+            self._dispatcher = dispatch.SlicedDispatcher(
+                self._io_loop, self._dispatch_span, slice_time,
+                self._on_dispatch_slice)
+
+        self._journal = None
+        self._journal_sync_interval = options.get('offlineJournalSyncInterval',
+                                                  0.1)
+        self._journal_sync_timeout = None
+        self._journal_directory = options.get('offlineJournal')
+        self._journal_segment_size = options.get('offlineJournalSegmentSize',
+                                                 4 * 1024 * 1024)
+        if self._journal_directory:
+            self._open_journal()
+            for entry_id, raw_message in self._journal.replay():
+                self._buffered_bytes += len(raw_message)
+                self._buffered_messages += 1
+                self._queued_messages.append(
+                    (raw_message, self._journaled_future(entry_id)))
 
     def connect(self, callback=None):
+        if self._journal is None and self._journal_directory:
+            # Reconnecting after close(). What the journal holds is still
+            # queued or being written, so it isn't replayed.
+            self._open_journal()
         self._connect_callback = callback
+        return self._transport.connect(self._url, self._on_open,
+                                       self._on_data,
+                                       self._compression_options())
 
-        connect_future = websocket.websocket_connect(
-                self._url,
-                self._io_loop,
-                callback=self._on_open,
-                on_message_callback=self._on_data)
-
-        return connect_future
+    def _compression_options(self):
+        if not self._compression:
+            return None
+        return {'level': self._compression_level,
+                'threshold': self._compression_threshold,
+                'context_takeover': self._compression_context_takeover}
 
     def _check_heartbeat(self):
-        heartbeat_tolerance = self._heartbeat_interval * 2
-        elapsed = time.time() - self._last_heartbeat
-        if elapsed >= heartbeat_tolerance:
+        if self._reading_paused:
+            # Pings wait unread until the handlers caught up
+            self._last_heartbeat = self._io_loop.time()
+        timeout = self.dead_peer_timeout
+        elapsed = self._io_loop.time() - self._last_heartbeat
+        if elapsed >= timeout:
             self._io_loop.remove_timeout(self._heartbeat_callback)
             self._websocket_handler.close()
-            self._on_error("heartbeat not received in the last 1000 milliseconds")
+            self._on_error("heartbeat not received in the last {0:.0f} "
+                           "milliseconds".format(elapsed * 1000))
         else:
             self._heartbeat_callback = self._io_loop.call_later(
-                self._heartbeat_interval, self._check_heartbeat)
+                timeout - elapsed, self._check_heartbeat)
+
+    @property
+    def dead_peer_timeout(self):
+        """float: Seconds without hearing from the server after which the
+        connection is considered dead.
+
+        That is the interval between the server's pings, as observed or else
+        ``heartbeatInterval``, plus the time a ping may be late:
+        ``heartbeatInterval``. Once enough round trips were measured, the
+        round trip timeout shortens that grace, down to
+        ``deadPeerMinTimeout``, 5 seconds by default.
+        """
+        interval = self._ping_interval.interval or self._heartbeat_interval
+        grace = self._heartbeat_interval
+        if self._rtt.round_trip_time.samples >= _DEAD_PEER_MIN_SAMPLES:
+            grace = min(self._rtt.timeout(self._dead_peer_min_timeout), grace)
+        return interval + grace
+
+    @property
+    def round_trip_time(self):
+        """RoundTripTime: The round trip time, measured from requests to the
+        server's acks."""
+        return self._rtt.round_trip_time
 
     def _on_open(self, f):
         exception = f.exception()
@@ -85,11 +258,17 @@ class Connection(object):
 
             return
 
-        self._last_heartbeat = time.time()
+        self._last_heartbeat = self._io_loop.time()
+        self._ping_interval.reset()
+        self._pending_round_trips.clear()
         self._heartbeat_callback = self._io_loop.call_later(
-            self._heartbeat_interval, self._check_heartbeat)
+            self.dead_peer_timeout, self._check_heartbeat)
 
         self._websocket_handler = f.result()
+        self._framer.reset()
+        self._reading_paused = False
+        if self._dispatcher is not None:
+            self._pause_if_lagging()
         self._set_state(constants.connection_state.AWAITING_CONNECTION)
 
         if self._connect_callback:
@@ -118,8 +297,26 @@ class Connection(object):
         self._io_loop.stop()
 
     def close(self):
+        """Close the connection for good, and the offline journal with it.
+
+        ``connect`` opens the journal again.
+        """
+        self._close()
+        self._close_journal()
+
+    def _close(self):
+        # Redirects, rejections and running out of reconnect attempts close
+        # the websocket but keep the journal, the connection may be opened
+        # again
         if self._heartbeat_callback:
             self._io_loop.remove_timeout(self._heartbeat_callback)
+        if self._reconnect_timeout is not None:
+            self._clear_reconnect()
+        for probe in self._probes:
+            probe.discard()
+        self._probes = []
+        self._send_packet()
+        self._sync_journal()
         self._deliberate_close = True
         if self._websocket_handler:
             self._websocket_handler.close()
@@ -154,16 +351,21 @@ class Connection(object):
 
     def _send_auth_params(self):
         self._set_state(constants.connection_state.AUTHENTICATING)
-        raw_auth_message = message_builder.get_message(
+        raw_auth_message = message_builder.build(
             constants.topic.AUTH,
             constants.actions.REQUEST,
-            [self._auth_params])
-        self._websocket_handler.write_message(raw_auth_message.encode())
+            [self._auth_params],
+            self._codec)
+        self._auth_sent_at = self._io_loop.time()
+        self._websocket_handler.write_message(raw_auth_message)
 
     def _handle_auth_response(self, message):
-        message_data = message['data']
-        message_action = message['action']
+        message_data = message.data
+        message_action = message.action
         data_size = len(message_data)
+        if self._auth_sent_at is not None:
+            self._rtt.add_sample(self._io_loop.time() - self._auth_sent_at)
+            self._auth_sent_at = None
         if message_action == constants.actions.ERROR:
             if (message_data and
                     message_data[0] == constants.event.TOO_MANY_AUTH_ATTEMPTS):
@@ -184,6 +386,8 @@ class Connection(object):
 
         elif message_action == constants.actions.ACK:
             self._set_state(constants.connection_state.OPEN)
+            self._reconnection_attempt = 0
+            self._reconnect_backoff.reset()
 
             auth_data = (self._get_auth_data(message_data[0]) if
                          data_size else None)
@@ -193,14 +397,16 @@ class Connection(object):
                 self._auth_future.set_result(
                     {'success': True, 'error': None, 'message': auth_data})
 
+            if self._compact_offline_queue and self._queued_messages:
+                self._compact_queue()
             self._send_queued_messages()
 
     def _handle_connection_response(self, message):
-        action = message['action']
-        data = message['data']
+        action = message.action
+        data = message.data
         if action == constants.actions.PING:
-            self._last_heartbeat = time.time()
-            ping_response = message_builder.get_message(
+            self._ping_interval.add(self._last_heartbeat)
+            ping_response = message_builder.build(
                 constants.topic.CONNECTION, constants.actions.PONG)
             self.send(ping_response)
         elif action == constants.actions.ACK:
@@ -208,7 +414,7 @@ class Connection(object):
             if self._auth_params is not None:
                 self._send_auth_params()
         elif action == constants.actions.CHALLENGE:
-            challenge_response = message_builder.get_message(
+            challenge_response = message_builder.build(
                 constants.topic.CONNECTION,
                 constants.actions.CHALLENGE_RESPONSE,
                 [self._url])
@@ -216,11 +422,11 @@ class Connection(object):
             self.send(challenge_response)
         elif action == constants.actions.REJECTION:
             self._challenge_denied = True
-            self.close()
+            self._close()
         elif action == constants.actions.REDIRECT:
             self._url = data[0]
             self._redirecting = True
-            self.close()
+            self._close()
         elif action == constants.actions.ERROR:
             if data[0] == constants.event.CONNECTION_AUTHENTICATION_TIMEOUT:
                 self._deliberate_close = True
@@ -230,7 +436,8 @@ class Connection(object):
 
     def _get_auth_data(self, data):
         if data:
-            return message_parser.convert_typed(data, self._client)
+            return message_parser.convert_typed(data, self._client,
+                                                self._codec)
 
     def _set_state(self, state):
         self._state = state
@@ -254,55 +461,506 @@ class Connection(object):
     def io_loop(self):
         return self._io_loop
 
+    @property
+    def url(self):
+        """str: The url of the server in use, or tried last."""
+        return self._url
+
     def send_message(self, topic, action, data):
-        message = message_builder.get_message(topic, action, data)
-        return self.send(message)
+        return self.send(
+            message_builder.build(topic, action, data, self._codec))
 
-    def send(self, raw_message):
+    def send(self, raw_message, resubscribe=False):
         """Main method for sending messages.
 
-        All messages are passed onto and handled by tornado.
+        All messages are passed onto and handled by tornado. Until the
+        connection is open, only connection and auth messages are written,
+        everything else is queued. The queue is flushed right after the
+        server acknowledged the login, in as few frames as ``maxPacketSize``
+        and ``maxMessagesPerPacket`` allow, and the futures of the queued
+        messages resolve once the frame containing them is written.
+
+        If the ``batchMessages`` option is set, messages are collected into a
+        packet that is written as a single frame once the current IOLoop
+        iteration ends, ``maxBatchDelay`` seconds pass, or the packet reaches
+        ``maxMessagesPerPacket`` messages or ``maxPacketSize`` bytes.
+
+        Every message has a priority class, see ``scheduler.priority_of``,
+        and queued messages are sent most urgent class first. Record updates
+        are bulk: they are only written while less than ``bulkInFlightBytes``
+        of them are in flight, so connection messages like PONGs, acks and
+        other messages never wait behind more record data than that. Other
+        messages about a record with queued updates wait for them, so they
+        can't overtake them.
+
+        If ``offlineJournal`` is set to a directory, record updates and events
+        that have to be queued are also appended to a journal there, which is
+        synced to disk every ``offlineJournalSyncInterval`` seconds. Messages
+        that weren't written by the time the process exits are queued again by
+        the next connection that uses the same directory.
+
+        If ``compactOfflineQueue`` is set, messages that were superseded by
+        later ones are dropped from the queue before it's flushed, and
+        whenever it grows past ``offlineQueueCompactionThreshold`` or twice
+        its size after the last compaction. See ``compaction.compact``.
+
+        If ``outboundHighWaterBytes`` or ``outboundHighWaterMessages`` is set
+        and the messages that are queued or still being written reach it,
+        ``outboundOverflowPolicy`` decides what happens to an ``INTERACTIVE``
+        or ``BULK`` message (connection messages and acks are always sent):
+            - block: it is queued and written once the queue drains below the
+              low-water mark
+            - dropOldest: the oldest queued ``INTERACTIVE`` or ``BULK``
+              message of the least urgent class is dropped instead, or the
+              message itself if there is none
+            - dropNewest: the message is dropped
+            - raise: ``OutboundQueueFull`` is raised
+
+        Args:
+            raw_message (bytes): one or more messages, or a str of them
+            resubscribe (bool): whether the messages restore subscriptions
+                after a reconnect, only of interest to ``ConnectionLanes``
+
+        Returns:
+            tornado.concurrent.Future: resolves once the message (or the packet
+                containing it) has been written, or with False if the message
+                was dropped
         """
-        if not self._websocket_handler.stream.closed():
-            return self._websocket_handler.write_message(raw_message.encode())
+        if not isinstance(raw_message, bytes):
+            raw_message = raw_message.encode()
+
+        message_priority = self._queued_messages.priority_of(raw_message)
+        # Connection messages and acks, like the PONG that answers a PING,
+        # are exempt from the overflow policy so a busy client isn't taken
+        # for a dead one
+        droppable = message_priority >= priority.INTERACTIVE
+        if droppable and self._is_outbound_full():
+            future = self._on_outbound_overflow(raw_message)
+            if future is not None:
+                return future
         else:
+            future = None
+
+        self._buffered_bytes += len(raw_message)
+        self._buffered_messages += 1
+
+        if _is_handshake(raw_message):
+            if not self._websocket_handler.stream.closed():
+                return self._write(raw_message, future)
+        elif (self._state == constants.connection_state.OPEN and
+              not self._websocket_handler.stream.closed() and
+              not self._queued_messages.blocks(message_priority) and
+              not (droppable and self._outbound_overflowing) and
+              not (message_priority == priority.BULK and
+                   self._bulk_in_flight_full())):
+            return self._write(raw_message, future)
+
+        if future is None:
             future = concurrent.Future()
-            self._queued_messages.append((raw_message.encode(), future))
+        if self._journal is not None and journal.is_journaled(raw_message):
+            self._journal_message(raw_message, future)
+        self._queued_messages.append((raw_message, future))
+        if (self._compact_offline_queue and
+                len(self._queued_messages) >= self._compact_at):
+            self._compact_queue()
+        return future
+
+    def drain(self):
+        """Wait for the outbound queue to drain.
+
+        Returns:
+            tornado.concurrent.Future: resolves once the queued and unwritten
+                messages are below the low-water marks
+        """
+        future = concurrent.Future()
+        if self._is_outbound_drained():
+            future.set_result(None)
+        else:
+            self._drain_futures.append(future)
+        return future
+
+    def take_queued_messages(self):
+        """Removes the messages that are waiting for the connection to open,
+        to send them over another connection instead.
+
+        Returns:
+            list: ``(raw_message, future)`` pairs, each raw message as bytes
+        """
+        queued = list(self._queued_messages)
+        self._queued_messages.clear()
+        for raw_message, _ in queued:
+            self._buffered_bytes -= len(raw_message)
+            self._buffered_messages -= 1
+        self._check_drained()
+        return queued
+
+    @property
+    def outbound_queue_depth(self):
+        """QueueDepth: Messages and bytes that were sent but aren't written
+        yet, including messages queued while the connection is closed."""
+        return QueueDepth(self._buffered_messages, self._buffered_bytes)
+
+    def _is_outbound_full(self):
+        return self._above_high_water(self._buffered_bytes,
+                                      self._buffered_messages)
+
+    def _is_outbound_drained(self):
+        return self._below_low_water(self._buffered_bytes,
+                                     self._buffered_messages)
+
+    def _above_high_water(self, size, count):
+        return ((self._high_water_bytes is not None and
+                 size >= self._high_water_bytes) or
+                (self._high_water_messages is not None and
+                 count >= self._high_water_messages))
+
+    def _below_low_water(self, size, count):
+        return ((self._low_water_bytes is None or
+                 size <= self._low_water_bytes) and
+                (self._low_water_messages is None or
+                 count <= self._low_water_messages))
+
+    def _on_outbound_overflow(self, raw_message):
+        """Applies the overflow policy to a message that doesn't fit.
+
+        Returns:
+            The future to hand to the caller if the message was dealt with,
+            otherwise None and the message should be queued as usual.
+        """
+        policy = self._overflow_policy
+        self._client.emit(constants.event.OUTBOUND_QUEUE_OVERFLOW, policy,
+                          self.outbound_queue_depth)
+
+        if policy == overflow_policy.RAISE:
+            raise OutboundQueueFull(
+                'Outbound queue is full ({0} messages, {1} bytes)'.format(
+                    self._buffered_messages, self._buffered_bytes))
+
+        if (policy == overflow_policy.DROP_OLDEST and
+                self._queued_messages.has_droppable()):
+            dropped_message, dropped_future = (
+                self._queued_messages.pop_oldest())
+            self._buffered_bytes -= len(dropped_message)
+            self._buffered_messages -= 1
+            dropped_future.set_result(False)
+            return None
+
+        if policy in (overflow_policy.DROP_OLDEST,
+                      overflow_policy.DROP_NEWEST):
+            future = concurrent.Future()
+            future.set_result(False)
             return future
 
-    @gen.coroutine
+        self._outbound_overflowing = True
+        return None
+
+    def _journaled_future(self, entry_id):
+        future = concurrent.Future()
+        future.add_done_callback(partial(self._on_journaled_written, entry_id))
+        return future
+
+    def _journal_message(self, raw_message, future):
+        entry_id = self._journal.append(raw_message)
+        future.add_done_callback(partial(self._on_journaled_written, entry_id))
+        self._schedule_journal_sync()
+
+    def _on_journaled_written(self, entry_id, future):
+        # Messages that failed to write stay in the journal and are replayed
+        # by the next process, dropped messages are given up on. So are
+        # messages written while the journal is closed.
+        if future.exception() is None and self._journal is not None:
+            self._journal.ack(entry_id)
+            self._schedule_journal_sync()
+
+    def _schedule_journal_sync(self):
+        if self._journal_sync_timeout is None:
+            self._journal_sync_timeout = self._io_loop.call_later(
+                self._journal_sync_interval, self._sync_journal)
+
+    def _sync_journal(self):
+        if self._journal_sync_timeout is not None:
+            self._io_loop.remove_timeout(self._journal_sync_timeout)
+            self._journal_sync_timeout = None
+        if self._journal is not None:
+            self._journal.sync()
+
+    def _open_journal(self):
+        self._journal = journal.Journal(self._journal_directory,
+                                        self._journal_segment_size)
+
+    def _close_journal(self):
+        self._sync_journal()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _write(self, raw_message, future=None, coalesce=False):
+        self._in_flight_bytes += len(raw_message)
+        self._in_flight_messages += 1
+        bulk_size = (len(raw_message) if scheduler.priority_of(raw_message) ==
+                     priority.BULK else 0)
+        self._bulk_in_flight_bytes += bulk_size
+        self._start_round_trip(raw_message)
+
+        if self._batch_messages or coalesce:
+            return self._add_to_packet(raw_message, future, bulk_size)
+
+        write_future = self._websocket_handler.write_message(raw_message)
+        write_future.add_done_callback(
+            partial(self._on_written, len(raw_message), 1, bulk_size))
+        if future is None:
+            return write_future
+        write_future.add_done_callback(partial(_resolve_futures, [future]))
+        return future
+
+    def _on_written(self, size, count, bulk_size, write_future):
+        self._in_flight_bytes -= size
+        self._in_flight_messages -= count
+        self._bulk_in_flight_bytes -= bulk_size
+        self._buffered_bytes -= size
+        self._buffered_messages -= count
+
+        if (self._queued_messages and
+                self._state == constants.connection_state.OPEN and
+                self._below_low_water(self._in_flight_bytes,
+                                      self._in_flight_messages)):
+            self._send_queued_messages()
+
+        self._check_drained()
+
+    def _check_drained(self):
+        if not self._is_outbound_drained():
+            return
+
+        self._outbound_overflowing = False
+        drain_futures = self._drain_futures
+        self._drain_futures = []
+        for future in drain_futures:
+            future.set_result(None)
+
+    def _bulk_in_flight_full(self):
+        return self._bulk_in_flight_bytes >= self._bulk_in_flight_limit
+
+    def _add_to_packet(self, raw_message, future=None, bulk_size=0):
+        if future is None:
+            future = concurrent.Future()
+
+        self._current_packet.append((raw_message, future))
+        self._current_packet_message_count += 1
+        self._current_packet_size += len(raw_message)
+        self._current_packet_bulk_size += bulk_size
+
+        if (self._current_packet_message_count >=
+                self._max_messages_per_packet or
+                self._current_packet_size >= self._max_packet_size):
+            self._send_packet()
+        elif self._send_next_packet_timeout is None:
+            self._send_next_packet_timeout = self._io_loop.call_later(
+                self._max_batch_delay, self._send_packet)
+
+        return future
+
+    def _send_packet(self):
+        if self._send_next_packet_timeout is not None:
+            self._io_loop.remove_timeout(self._send_next_packet_timeout)
+            self._send_next_packet_timeout = None
+
+        if not self._current_packet:
+            return
+
+        packet = self._current_packet
+        packet_size = self._current_packet_size
+        bulk_size = self._current_packet_bulk_size
+        self._current_packet = []
+        self._current_packet_message_count = 0
+        self._current_packet_size = 0
+        self._current_packet_bulk_size = 0
+
+        if self._websocket_handler.stream.closed():
+            self._in_flight_bytes -= packet_size
+            self._in_flight_messages -= len(packet)
+            self._bulk_in_flight_bytes -= bulk_size
+            self._queued_messages.extendleft(reversed(packet))
+            return
+
+        write_future = self._websocket_handler.write_message(
+            b"".join(raw_message for raw_message, _ in packet))
+        futures = [future for _, future in packet]
+        write_future.add_done_callback(
+            partial(self._on_written, packet_size, len(packet), bulk_size))
+        write_future.add_done_callback(partial(_resolve_futures, futures))
+
+    def _compact_queue(self):
+        result = compaction.compact(self._queued_messages, self._client,
+                                    self._codec)
+
+        self._buffered_bytes -= sum(
+            len(raw_message) for raw_message, _ in self._queued_messages)
+        self._buffered_bytes += sum(
+            len(raw_message) for raw_message, _ in result.messages)
+        self._buffered_messages -= (len(self._queued_messages) -
+                                    len(result.messages))
+        self._queued_messages = scheduler.OutboundQueue(result.messages)
+        self._compact_at = max(self._compaction_threshold,
+                               2 * len(self._queued_messages))
+
+        for future, successor in result.superseded:
+            successor.add_done_callback(partial(_resolve_futures, [future]))
+        for future in result.cancelled:
+            if not future.done():
+                future.set_result(None)
+
+        if result.versions or result.unsubscribed:
+            self._client.emit(constants.event.OUTBOUND_QUEUE_COMPACTED,
+                              result.versions, result.unsubscribed)
+
     def _send_queued_messages(self):
         if self._state != constants.connection_state.OPEN:
             return
 
-        while self._queued_messages:
+        while (self._queued_messages and
+               not self._above_high_water(self._in_flight_bytes,
+                                          self._in_flight_messages)):
+            if (self._queued_messages.next_priority() == priority.BULK and
+                    self._bulk_in_flight_full()):
+                break
             raw_message, future = self._queued_messages.popleft()
-            result = yield self._websocket_handler.write_message(raw_message)
-            future.set_result(result)
+            self._write(raw_message, future, coalesce=True)
+
+        self._send_packet()
 
     def _on_data(self, data):
         if data is None:
             self._on_close()
             return
-        full_buffer = self._message_buffer + data
-        split_buffer = full_buffer.rsplit(constants.message.MESSAGE_SEPERATOR,
-                                          1)
-        if len(split_buffer) > 1:
-            self._message_buffer = split_buffer[1]
-
-        raw_messages = split_buffer[0]
-
-        parsed_messages = message_parser.parse(raw_messages, self._client)
-
-        for msg in parsed_messages:
-            if msg is None:
-                continue
-            if msg['topic'] == constants.topic.CONNECTION:
-                self._handle_connection_response(msg)
-            elif msg['topic'] == constants.topic.AUTH:
-                self._handle_auth_response(msg)
+
+        # Anything from the server shows that it's alive
+        self._last_heartbeat = self._io_loop.time()
+
+        if self._dispatcher is None:
+            for span in self._framer.feed_spans(data):
+                self._dispatch_span(span)
+            return
+
+        # Pings and auth responses are answered right away, everything else
+        # waits for its turn in a slice
+        for span in self._framer.feed_spans(data):
+            buffer, start, end = span
+            if buffer[start:start + 2] in _CONTROL_PREFIXES:
+                self._dispatch_span(span)
             else:
-                self._client._on_message(parsed_messages[0])
+                self._dispatcher.push(span, end - start)
+        self._dispatcher.run()
+        self._pause_if_lagging()
+
+    def _pause_if_lagging(self):
+        count, size = self._dispatcher.pending
+        if self._reading_paused or not (
+                (self._inbound_high_water_bytes is not None and
+                 size >= self._inbound_high_water_bytes) or
+                (self._inbound_high_water_messages is not None and
+                 count >= self._inbound_high_water_messages)):
+            return
+
+        self._reading_paused = True
+        self._transport.pause_reading(self._websocket_handler)
+        self._client.emit(constants.event.INBOUND_QUEUE_OVERFLOW,
+                          self.inbound_queue_depth)
+
+    def _on_dispatch_slice(self):
+        count, size = self._dispatcher.pending
+        if not self._reading_paused or not (
+                (self._inbound_low_water_bytes is None or
+                 size <= self._inbound_low_water_bytes) and
+                (self._inbound_low_water_messages is None or
+                 count <= self._inbound_low_water_messages)):
+            return
+
+        self._resume_reading()
+        self._client.emit(constants.event.INBOUND_QUEUE_DRAINED,
+                          self.inbound_queue_depth)
+
+    def _resume_reading(self):
+        self._reading_paused = False
+        self._last_heartbeat = self._io_loop.time()
+        self._transport.resume_reading(self._websocket_handler)
+
+    def _dispatch_span(self, span):
+        buffer, start, end = span
+        # Bytes come from the asyncio transport, str from tornado
+        if isinstance(buffer, bytes):
+            msg = message_parser.parse_message_bytes(buffer, start, end,
+                                                     self._client)
+        else:
+            msg = message_parser.parse_message(buffer[start:end],
+                                               self._client)
+        if msg is None:
+            return
+        if msg.action == constants.actions.ACK:
+            self._end_round_trip(msg)
+        if msg.topic == constants.topic.CONNECTION:
+            self._handle_connection_response(msg)
+        elif msg.topic == constants.topic.AUTH:
+            self._handle_auth_response(msg)
+        else:
+            self._client._on_message(msg)
+
+    @property
+    def inbound_queue_depth(self):
+        """QueueDepth: Messages and bytes that were received but not handed
+        to the client yet.
+
+        If ``inboundHighWaterBytes`` or ``inboundHighWaterMessages`` is set
+        and the queue reaches it, the connection stops reading from the
+        websocket and emits ``inboundQueueOverflow`` with the queue depth. It
+        continues reading and emits ``inboundQueueDrained`` once the queue is
+        below ``inboundLowWaterBytes`` and ``inboundLowWaterMessages``, half
+        the high-water marks by default. Messages are queued in dispatch
+        slices of ``dispatchSliceTime`` seconds, 0.01 if only the high-water
+        marks are set.
+        """
+        if self._dispatcher is None:
+            return QueueDepth(0, 0)
+        return QueueDepth(*self._dispatcher.pending)
+
+    @property
+    def dispatch_stats(self):
+        """DispatchStats: How incoming messages were dispatched.
+
+        When ``dispatchSliceTime`` is set, messages are handed to the client
+        for at most that many seconds per IOLoop iteration, except for
+        connection and auth messages which are handled as soon as they
+        arrive. Otherwise every frame is dispatched at once and this is None.
+        """
+        if self._dispatcher is None:
+            return None
+        return self._dispatcher.stats
+
+    def _start_round_trip(self, raw_message):
+        parts = raw_message.split(_PART_SEPERATOR, 3)
+        if len(parts) < 3 or parts[1] not in _ACKNOWLEDGED_ACTIONS:
+            return
+        name = parts[2].split(constants.message.MESSAGE_SEPERATOR.encode(),
+                              1)[0]
+        action = parts[1]
+        if action == _CREATEORREAD:
+            # Reads are acknowledged as subscriptions
+            action = _SUBSCRIBE
+        key = (parts[0], action, name)
+        self._pending_round_trips.pop(key, None)
+        self._pending_round_trips[key] = self._io_loop.time()
+        if len(self._pending_round_trips) > _MAX_PENDING_ROUND_TRIPS:
+            self._pending_round_trips.popitem(last=False)
+
+    def _end_round_trip(self, message):
+        data = message.data
+        if len(data) < 2:
+            return
+        sent_at = self._pending_round_trips.pop(
+            (message.topic.encode(), data[0].encode(), data[1].encode()),
+            None)
+        if sent_at is not None:
+            self._rtt.add_sample(self._io_loop.time() - sent_at)
 
     def _try_reconnect(self):
         if self._reconnect_timeout is not None:
@@ -310,33 +968,72 @@ class Connection(object):
 
         if self._reconnection_attempt < self._max_reconnect_attempts:
             self._set_state(constants.connection_state.RECONNECTING)
-
-            interval = min(
-                (self._reconnect_interval_increment *
-                 self._reconnection_attempt),
-                self._max_reconnect_interval)
-
             self._reconnection_attempt += 1
-
             self._reconnect_timeout = self._io_loop.call_later(
-                interval, self._try_open)
+                self._reconnect_backoff.next_delay(), self._try_open)
 
         else:
             self._clear_reconnect()
-            self.close()
+            self._close()
 
     def _try_open(self):
-        self._url = self._original_url
-        self.connect()
         self._reconnect_timeout = None
+        if len(self._endpoints) == 1:
+            self._url = self._endpoints.best
+            self.connect()
+        else:
+            self._probe_endpoints()
+
+    def _probe_endpoints(self):
+        """Connects to every endpoint at once and keeps the first websocket
+        that opens."""
+        started = self._io_loop.time()
+        compression = self._compression_options()
+        self._probes = [_Probe(url) for url in self._endpoints.ordered()]
+        for probe in self._probes:
+            self._transport.connect(
+                probe.url, partial(self._on_probe_open, probe, started),
+                probe.on_message, compression)
+
+    def _on_probe_open(self, probe, started, f):
+        probe.finished = True
+        exception = f.exception()
+        if exception is None:
+            self._endpoints.add_sample(probe.url,
+                                       self._io_loop.time() - started)
+        else:
+            self._endpoints.add_failure(probe.url)
+
+        if probe not in self._probes:
+            # Another endpoint was faster
+            if exception is None:
+                f.result().close()
+            return
+
+        if exception is not None:
+            if all(other.finished for other in self._probes):
+                self._probes = []
+                self._on_open(f)
+            return
+
+        for other in self._probes:
+            if other is not probe:
+                other.discard()
+        self._probes = []
+        self._url = probe.url
+        self._on_open(f)
+        probe.adopt(self._on_data)
 
     def _clear_reconnect(self):
         self._io_loop.remove_timeout(self._reconnect_timeout)
         self._reconnect_timeout = None
         self._reconnection_attempt = 0
+        self._reconnect_backoff.reset()
 
     def _on_close(self):
         self._io_loop.remove_timeout(self._heartbeat_callback)
+        if self._reading_paused:
+            self._resume_reading()
 
         if self._redirecting:
             self._redirecting = False
@@ -345,3 +1042,57 @@ class Connection(object):
             self._set_state(constants.connection_state.CLOSED)
         else:
             self._try_reconnect()
+
+
+class _Probe(object):
+    """A websocket opened while looking for the fastest endpoint.
+
+    Messages are held until the probe is either adopted by the connection or
+    discarded.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.finished = False
+        self._on_message = None
+        self._held = []
+
+    def on_message(self, data):
+        if self._on_message is None:
+            self._held.append(data)
+        else:
+            self._on_message(data)
+
+    def adopt(self, on_message):
+        self._on_message = on_message
+        held = self._held
+        self._held = []
+        for data in held:
+            on_message(data)
+
+    def discard(self):
+        self._held = []
+        self._on_message = _ignore
+
+
+def _ignore(data):
+    pass
+
+
+def _is_handshake(raw_message):
+    return raw_message.split(_PART_SEPERATOR, 1)[0] in _HANDSHAKE_TOPICS
+
+
+def _resolve_futures(futures, write_future):
+    exception = write_future.exception()
+    for future in futures:
+        if future.done():
+            continue
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(write_future.result())
+
+
+def _half(value):
+    return value // 2 if value is not None else None
@@ -0,0 +1,106 @@
+"""Hands incoming messages to the client in time-bounded slices."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from collections import deque, namedtuple
+
+DispatchStats = namedtuple('DispatchStats',
+                           'slices messages pending last longest total')
+DispatchStats.__doc__ = """How incoming messages were dispatched.
+
+Attributes:
+    slices (int): the number of slices run
+    messages (int): the number of messages dispatched
+    pending (int): the number of messages waiting for the next slice
+    last (float): seconds taken by the last slice
+    longest (float): seconds taken by the longest slice
+    total (float): seconds taken by all slices
+"""
+
+
+class SlicedDispatcher(object):
+    """Calls ``dispatch`` for every pushed item, but only for ``slice_time``
+    seconds at a time.
+
+    Once a slice ran out of time the rest of the items wait for the next
+    iteration of the IOLoop, so timers, heartbeats and writes get their turn
+    in between. Every slice dispatches at least one item.
+    """
+
+    def __init__(self, io_loop, dispatch, slice_time, on_slice=None):
+        """
+        Args:
+            io_loop: the loop to yield to between slices
+            dispatch (callable): called with every item
+            slice_time (float): seconds a slice may take
+            on_slice (callable): called without arguments after every slice
+        """
+        self._io_loop = io_loop
+        self._dispatch = dispatch
+        self._slice_time = slice_time
+        self._on_slice = on_slice
+        self._items = deque()
+        self._pending_bytes = 0
+        self._scheduled = False
+        self._running = False
+
+        self._slices = 0
+        self._messages = 0
+        self._last = 0.0
+        self._longest = 0.0
+        self._total = 0.0
+
+    def push(self, item, size=0):
+        """Queues ``item``, which takes up ``size`` bytes."""
+        self._items.append((item, size))
+        self._pending_bytes += size
+
+    def run(self):
+        """Runs a slice now, unless one is running or waiting for its turn
+        already."""
+        if self._running or self._scheduled or not self._items:
+            return
+        self._run_slice()
+
+    def _run_slice(self):
+        self._scheduled = False
+        self._running = True
+        started = self._io_loop.time()
+        deadline = started + self._slice_time
+        count = 0
+        try:
+            while self._items:
+                item, size = self._items.popleft()
+                self._pending_bytes -= size
+                self._dispatch(item)
+                count += 1
+                if self._io_loop.time() >= deadline:
+                    break
+        finally:
+            # Items behind one whose handler raised still get dispatched
+            self._running = False
+            self._record(self._io_loop.time() - started, count)
+            if self._items:
+                self._scheduled = True
+                self._io_loop.add_callback(self._run_slice)
+        if self._on_slice is not None:
+            self._on_slice()
+
+    def _record(self, elapsed, count):
+        self._slices += 1
+        self._messages += count
+        self._last = elapsed
+        self._longest = max(self._longest, elapsed)
+        self._total += elapsed
+
+    @property
+    def pending(self):
+        """tuple: The number of items waiting and the bytes they take up."""
+        return len(self._items), self._pending_bytes
+
+    @property
+    def stats(self):
+        """DispatchStats: Counters and timings of the slices so far."""
+        return DispatchStats(self._slices, self._messages, len(self._items),
+                             self._last, self._longest, self._total)
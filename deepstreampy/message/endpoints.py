@@ -0,0 +1,100 @@
+"""Choosing the server endpoint to connect to, and when to retry."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.utils import str_types
+
+import random
+
+# Weight of a new handshake latency sample in the smoothed latency
+_ALPHA = 1 / 4
+
+
+class EndpointSet(object):
+    """The urls a connection can use, with their smoothed handshake
+    latencies.
+
+    Endpoints that were never measured come after the measured ones, in the
+    order they were given. An endpoint that failed to connect goes to the end
+    until it succeeds again.
+    """
+
+    def __init__(self, urls):
+        """
+        Args:
+            urls: a url or a list of urls
+        """
+        if isinstance(urls, str_types):
+            urls = [urls]
+        if not urls:
+            raise ValueError("At least one endpoint is required")
+        self._urls = list(urls)
+        self._latencies = {}
+        self._failures = {}
+
+    def add_sample(self, url, latency):
+        """Records a successful handshake with ``url`` that took ``latency``
+        seconds."""
+        previous = self._latencies.get(url)
+        if previous is None:
+            self._latencies[url] = latency
+        else:
+            self._latencies[url] = (1 - _ALPHA) * previous + _ALPHA * latency
+        self._failures.pop(url, None)
+
+    def add_failure(self, url):
+        self._failures[url] = self._failures.get(url, 0) + 1
+
+    def latency(self, url):
+        """float: The smoothed handshake latency, None if not measured."""
+        return self._latencies.get(url)
+
+    def ordered(self):
+        """list: The urls from most to least preferred."""
+        def preference(item):
+            index, url = item
+            latency = self._latencies.get(url)
+            return (self._failures.get(url, 0),
+                    latency is None,
+                    latency or 0,
+                    index)
+
+        return [url for _, url in sorted(enumerate(self._urls),
+                                         key=preference)]
+
+    @property
+    def best(self):
+        return self.ordered()[0]
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __iter__(self):
+        return iter(self._urls)
+
+
+class DecorrelatedJitter(object):
+    """Backoff with decorrelated jitter.
+
+    Every delay is picked at random between ``base`` and three times the
+    previous delay, and capped at ``cap``. The first delay is picked between
+    zero and ``base``, so clients that lost the same server don't all retry
+    at once.
+    """
+
+    def __init__(self, base, cap):
+        self._base = base
+        self._cap = cap
+        self._delay = None
+
+    def next_delay(self):
+        if self._delay is None:
+            self._delay = random.uniform(0, self._base)
+        else:
+            self._delay = min(self._cap, random.uniform(
+                self._base, max(self._base, self._delay * 3)))
+        return self._delay
+
+    def reset(self):
+        self._delay = None
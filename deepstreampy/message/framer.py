@@ -0,0 +1,80 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.constants import message as message_constants
+
+MESSAGE_SEPERATOR_BYTES = message_constants.MESSAGE_SEPERATOR.encode()
+
+
+class MessageFramer(object):
+    """Splits incoming frames into complete deepstream messages.
+
+    A message may be split over several frames, and a frame may carry several
+    messages. Incomplete trailing data is kept as a list of chunks and only
+    joined once its separator arrives, so every received byte is scanned and
+    copied a constant number of times regardless of how the messages are
+    framed.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def feed(self, data):
+        """Yield every message completed by ``data``.
+
+        Args:
+            data (str or bytes): a frame as received from the websocket
+
+        Yields:
+            The raw messages, without their trailing separator, as the same
+            type as ``data``.
+        """
+        for buffer, start, end in self.feed_spans(data):
+            yield buffer[start:end]
+
+    def feed_spans(self, data):
+        """Yield the location of every message completed by ``data``.
+
+        Unlike ``feed`` this doesn't slice messages out of the frame, so a
+        parser can address their parts without copying them first.
+
+        Args:
+            data (str or bytes): a frame as received from the websocket
+
+        Yields:
+            tuple: ``(buffer, start, end)`` where ``buffer[start:end]`` is the
+                message without its trailing separator. ``buffer`` is either
+                ``data`` itself or, for a message that spans several frames,
+                the joined chunks of that message.
+        """
+        if isinstance(data, bytes):
+            separator = MESSAGE_SEPERATOR_BYTES
+        else:
+            separator = message_constants.MESSAGE_SEPERATOR
+
+        start = 0
+        end = data.find(separator)
+        while end != -1:
+            if self._chunks:
+                self._chunks.append(data[start:end])
+                buffer = data[:0].join(self._chunks)
+                self._chunks = []
+                if buffer:
+                    yield buffer, 0, len(buffer)
+            elif start < end:
+                yield data, start, end
+
+            start = end + 1
+            end = data.find(separator, start)
+
+        if start < len(data):
+            self._chunks.append(data[start:])
+
+    def reset(self):
+        """Discard any incomplete message."""
+        self._chunks = []
+
+    @property
+    def pending(self):
+        """int: Length of the incomplete message received so far."""
+        return sum(len(chunk) for chunk in self._chunks)
@@ -0,0 +1,292 @@
+"""An on-disk journal for messages sent while the connection is down."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.constants import topic as topic_constants
+from deepstreampy.constants import actions as action_constants
+from deepstreampy.constants import message as message_constants
+
+import bisect
+import mmap
+import os
+import struct
+import zlib
+
+# Length and CRC of the payload, then the entry id
+_HEADER = struct.Struct('<IIQ')
+# The checkpoint file holds the CRC of the rest of it, then the id below which
+# everything is acknowledged, the next entry id and the number of ids
+# acknowledged above the first, which follow as ``_ACKED_ID``s
+_CHECKPOINT_CRC = struct.Struct('<I')
+_CHECKPOINT = struct.Struct('<QQI')
+_ACKED_ID = struct.Struct('<Q')
+_SEGMENT_SUFFIX = '.seg'
+_CHECKPOINT_FILE = 'checkpoint'
+_CHECKPOINT_TEMP_FILE = 'checkpoint.tmp'
+
+_PART_SEPERATOR = message_constants.MESSAGE_PART_SEPERATOR.encode()
+
+# Only writes are worth replaying after a restart. Subscriptions, listens and
+# RPCs belong to the process that made them.
+JOURNALED_MESSAGES = frozenset([
+    (topic_constants.RECORD.encode(), action_constants.UPDATE.encode()),
+    (topic_constants.RECORD.encode(), action_constants.PATCH.encode()),
+    (topic_constants.EVENT.encode(), action_constants.EVENT.encode())])
+
+
+def is_journaled(raw_message):
+    """Whether ``raw_message`` (bytes) should be written to the journal."""
+    parts = raw_message.split(_PART_SEPERATOR, 2)
+    return len(parts) > 2 and (parts[0], parts[1]) in JOURNALED_MESSAGES
+
+
+class Journal(object):
+    """Append-only, memory-mapped segments of messages.
+
+    Every entry gets an increasing id. Once an entry has been written to the
+    server it's acknowledged. The id below which everything is acknowledged
+    is kept in a checkpoint file, along with the acknowledged ids above it,
+    so one entry that never gets acknowledged doesn't hold back the others.
+    Segments that only hold acknowledged entries are deleted. Appends and
+    acknowledgements are synced to disk by ``sync``, which the connection
+    calls in batches.
+
+    A journal opened on a directory written by an earlier process yields the
+    unacknowledged entries from ``replay``.
+    """
+
+    def __init__(self, directory, segment_size=4 * 1024 * 1024):
+        """
+        Args:
+            directory (str): where to keep the segments, created if missing
+            segment_size (int): size in bytes each segment is allocated with
+        """
+        self._directory = directory
+        self._segment_size = segment_size
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._checkpoint_path = os.path.join(directory, _CHECKPOINT_FILE)
+        self._checkpoint, next_id, self._acked = _read_checkpoint(
+            self._checkpoint_path)
+        self._acks_dirty = False
+
+        # Segments from earlier processes, as (path, first entry id, last
+        # entry id)
+        self._segments = []
+        self._recovered = []
+        # Ids aren't reused, even those of deleted segments
+        next_id = max([self._checkpoint, next_id] +
+                      [entry_id + 1 for entry_id in self._acked])
+        for path in self._segment_paths():
+            entries = list(_read_segment(path))
+            if entries:
+                self._segments.append((path, entries[0][0], entries[-1][0]))
+            else:
+                self._segments.append((path, next_id, -1))
+            for entry_id, payload in entries:
+                next_id = max(next_id, entry_id + 1)
+                if (entry_id >= self._checkpoint and
+                        entry_id not in self._acked):
+                    self._recovered.append((entry_id, payload))
+
+        self._next_id = next_id
+        self._pending = len(self._recovered)
+        self._segment = None
+        self._segment_file = None
+        self._segment_path = None
+        self._offset = 0
+        self._dirty = False
+        self._remove_acked_segments()
+
+    def replay(self):
+        """Return the unacknowledged entries of earlier processes.
+
+        Returns:
+            list: ``(entry_id, raw_message)`` in the order they were appended
+        """
+        recovered = self._recovered
+        self._recovered = []
+        return recovered
+
+    def append(self, raw_message):
+        """Append ``raw_message`` (bytes) and return its entry id."""
+        size = _HEADER.size + len(raw_message)
+        if self._segment is None or self._offset + size > len(self._segment):
+            self._open_segment(size)
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._pending += 1
+        _HEADER.pack_into(self._segment, self._offset, len(raw_message),
+                          zlib.crc32(raw_message) & 0xffffffff, entry_id)
+        self._offset += _HEADER.size
+        self._segment[self._offset:self._offset + len(raw_message)] = (
+            raw_message)
+        self._offset += len(raw_message)
+        path, first_id, _ = self._segments[-1]
+        self._segments[-1] = (path, first_id, entry_id)
+        self._dirty = True
+        return entry_id
+
+    def ack(self, entry_id):
+        """Mark the entry as written, it won't be replayed anymore."""
+        if entry_id < self._checkpoint or entry_id in self._acked:
+            return
+        self._pending -= 1
+        self._acked.add(entry_id)
+        while self._checkpoint in self._acked:
+            self._acked.remove(self._checkpoint)
+            self._checkpoint += 1
+        self._acks_dirty = True
+
+    def sync(self):
+        """Flush appended entries and the checkpoint to disk."""
+        if self._dirty:
+            self._segment.flush()
+            self._dirty = False
+
+        if self._acks_dirty:
+            self._remove_acked_segments()
+            self._write_checkpoint()
+            self._acks_dirty = False
+
+    def close(self):
+        self.sync()
+        self._close_segment()
+
+    @property
+    def pending(self):
+        """int: Number of entries that aren't acknowledged yet."""
+        return self._pending
+
+    def _write_checkpoint(self):
+        # Written next to the checkpoint and renamed over it, so a crash
+        # leaves either the old or the new checkpoint
+        data = _CHECKPOINT.pack(self._checkpoint, self._next_id,
+                                len(self._acked))
+        data += b''.join(_ACKED_ID.pack(entry_id)
+                         for entry_id in sorted(self._acked))
+        temp_path = os.path.join(self._directory, _CHECKPOINT_TEMP_FILE)
+        with open(temp_path, 'wb') as checkpoint_file:
+            checkpoint_file.write(
+                _CHECKPOINT_CRC.pack(zlib.crc32(data) & 0xffffffff) + data)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self._checkpoint_path)
+        _sync_directory(self._directory)
+
+    def _segment_paths(self):
+        names = sorted(name for name in os.listdir(self._directory)
+                       if name.endswith(_SEGMENT_SUFFIX))
+        return [os.path.join(self._directory, name) for name in names]
+
+    def _open_segment(self, min_size):
+        self.sync()
+        self._close_segment()
+
+        self._segment_path = os.path.join(
+            self._directory,
+            '{0:020d}{1}'.format(self._next_id, _SEGMENT_SUFFIX))
+        size = max(self._segment_size, min_size + _HEADER.size)
+        self._segment_file = open(self._segment_path, 'w+b')
+        self._segment_file.truncate(size)
+        self._segment = mmap.mmap(self._segment_file.fileno(), size)
+        self._offset = 0
+        self._segments.append((self._segment_path, self._next_id, -1))
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment_file.close()
+            self._segment = None
+            self._segment_file = None
+
+    def _remove_acked_segments(self):
+        # Everything but the segment being appended to can go once all of its
+        # entries are acknowledged. The acknowledged ids of a deleted segment
+        # don't have to be remembered anymore.
+        acked = sorted(self._acked)
+        kept = []
+        for segment in self._segments:
+            path, first_id, last_id = segment
+            start = max(first_id, self._checkpoint)
+            low = bisect.bisect_left(acked, start)
+            high = bisect.bisect_right(acked, last_id)
+            if (path == self._segment_path or
+                    (last_id >= start and high - low != last_id - start + 1)):
+                kept.append(segment)
+                continue
+            os.remove(path)
+            self._acked.difference_update(acked[low:high])
+        self._segments = kept
+
+        # Whatever is below the first remaining segment is gone
+        first_id = kept[0][1] if kept else self._next_id
+        if first_id > self._checkpoint:
+            self._acked = set(entry_id for entry_id in self._acked
+                              if entry_id >= first_id)
+            self._checkpoint = first_id
+            while self._checkpoint in self._acked:
+                self._acked.remove(self._checkpoint)
+                self._checkpoint += 1
+
+
+def _read_checkpoint(path):
+    """Return the checkpoint, the next entry id and the set of ids
+    acknowledged above the checkpoint.
+
+    A checkpoint that is missing or damaged counts as nothing acknowledged,
+    so every entry in the segments is replayed.
+    """
+    try:
+        with open(path, 'rb') as checkpoint_file:
+            data = checkpoint_file.read()
+    except IOError:
+        return 0, 0, set()
+
+    header_size = _CHECKPOINT_CRC.size + _CHECKPOINT.size
+    if len(data) < header_size:
+        return 0, 0, set()
+    crc, = _CHECKPOINT_CRC.unpack_from(data)
+    checkpoint, next_id, count = _CHECKPOINT.unpack_from(
+        data, _CHECKPOINT_CRC.size)
+    if (len(data) != header_size + count * _ACKED_ID.size or
+            zlib.crc32(data[_CHECKPOINT_CRC.size:]) & 0xffffffff != crc):
+        return 0, 0, set()
+    return checkpoint, next_id, set(
+        _ACKED_ID.unpack_from(data, offset)[0]
+        for offset in range(header_size, len(data), _ACKED_ID.size))
+
+
+def _sync_directory(directory):
+    """Make renames in ``directory`` durable. Windows can't open a directory
+    to sync it, and doesn't need to."""
+    if os.name == 'nt':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_segment(path):
+    """Yield ``(entry_id, payload)`` for every intact entry of a segment."""
+    with open(path, 'rb') as segment_file:
+        data = segment_file.read()
+
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, crc, entry_id = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        payload = data[start:start + length]
+        # A zero length marks the unused end of the segment, a bad CRC an
+        # append that didn't make it to disk
+        if (not length or len(payload) < length or
+                zlib.crc32(payload) & 0xffffffff != crc):
+            return
+        yield entry_id, payload
+        offset = start + length
@@ -0,0 +1,304 @@
+"""Spreads a client's traffic over several parallel connections."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy import constants
+from deepstreampy.message import connection, dispatch
+from deepstreampy.constants import connection_state
+from deepstreampy.constants import message as message_constants
+
+from tornado import concurrent, gen
+
+from collections import OrderedDict
+import os
+import zlib
+
+ROUTE_BY_TOPIC = 'topic'
+ROUTE_BY_NAME = 'name'
+
+# Topics are spread over the lanes in this order when routing by topic, so
+# records, RPCs and events get lanes of their own as soon as there are enough
+_TOPIC_ORDER = (constants.topic.RECORD,
+                constants.topic.RPC,
+                constants.topic.EVENT,
+                constants.topic.PRESENCE)
+
+# From least to most established, the aggregate state of the lanes is the
+# least established state of any lane
+_STATE_ORDER = (connection_state.ERROR,
+                connection_state.CLOSED,
+                connection_state.RECONNECTING,
+                connection_state.AWAITING_CONNECTION,
+                connection_state.CHALLENGING,
+                connection_state.AWAITING_AUTHENTICATION,
+                connection_state.AUTHENTICATING,
+                connection_state.OPEN)
+
+_PART_SEPERATOR = message_constants.MESSAGE_PART_SEPERATOR.encode()
+_MESSAGE_SEPERATOR = message_constants.MESSAGE_SEPERATOR.encode()
+
+
+class ConnectionLanes(object):
+    """A set of connections that stands in for a single ``Connection``.
+
+    Every lane is a complete connection with its own authentication and
+    heartbeat. Outgoing messages are routed to a lane by topic or by a hash of
+    the record, event or RPC name, so everything concerning one name always
+    uses the same lane and arrives in order. Incoming messages are handled by
+    the client regardless of the lane they arrive on.
+
+    Options:
+        connectionLanes (int): the number of lanes
+        laneRouting: ``'topic'``, ``'name'`` or a callable taking the topic,
+            action and data of a message and returning a lane index
+        laneTopics (dict): topic to lane index, overrides the default
+            assignment when routing by topic
+    """
+
+    def __init__(self, client, url, **options):
+        self._client = client
+        self._lanes = [
+            connection.Connection(_LaneClient(client, self, index), url,
+                                  **_lane_options(options, index))
+            for index in range(options.get('connectionLanes', 2))]
+        self._io_loop = self._lanes[0].io_loop
+
+        routing = options.get('laneRouting', ROUTE_BY_TOPIC)
+        self._custom_routing = callable(routing)
+        if callable(routing):
+            self._route = routing
+        elif routing == ROUTE_BY_NAME:
+            self._route = self._route_by_name
+        elif routing == ROUTE_BY_TOPIC:
+            self._route = self._route_by_topic
+        else:
+            raise ValueError("Unknown lane routing {0}".format(routing))
+
+        self._topic_lanes = dict(
+            (topic, index % len(self._lanes))
+            for index, topic in enumerate(_TOPIC_ORDER))
+        self._topic_lanes.update(options.get('laneTopics', {}))
+
+        self._state = connection_state.CLOSED
+        self._reconnected_lanes = set()
+        self._resubscribing_lanes = set()
+
+    def connect(self, callback=None):
+        futures = [lane.connect() for lane in self._lanes]
+        future = gen.multi(futures)
+        if callback:
+            future.add_done_callback(lambda f: callback())
+        return future
+
+    def close(self):
+        for lane in self._lanes:
+            lane.close()
+
+    def authenticate(self, auth_params):
+        """Authenticates every lane with the same parameters.
+
+        Returns:
+            tornado.concurrent.Future: resolves with the result of the first
+                lane that failed, or of the first lane if all succeeded
+        """
+        future = concurrent.Future()
+        auth_future = gen.multi(
+            [lane.authenticate(auth_params) for lane in self._lanes])
+
+        def on_authenticated(f):
+            results = f.result()
+            failed = [result for result in results if not result['success']]
+            future.set_result(failed[0] if failed else results[0])
+
+        auth_future.add_done_callback(on_authenticated)
+        return future
+
+    def send_message(self, topic, action, data):
+        return self._lane_for(topic, action, data).send_message(topic, action,
+                                                                data)
+
+    def send(self, raw_message, resubscribe=False):
+        """Sends one or more messages.
+
+        Messages for the same lane are passed on together. When
+        ``resubscribe`` is set, only lanes that reconnected get the messages,
+        the others never lost their subscriptions.
+
+        Returns:
+            tornado.concurrent.Future: resolves once the messages were written
+                on every lane they were routed to, with False if any lane
+                dropped them, like ``Connection.send``
+        """
+        if not isinstance(raw_message, bytes):
+            raw_message = raw_message.encode()
+        lane_messages = OrderedDict()
+        for message in raw_message.split(_MESSAGE_SEPERATOR):
+            if not message:
+                continue
+            lane = self._lane_for_raw(message)
+            if resubscribe and lane not in self._resubscribing_lanes:
+                continue
+            lane_messages.setdefault(lane, []).append(
+                message + _MESSAGE_SEPERATOR)
+
+        futures = [lane.send(b''.join(messages), resubscribe)
+                   for lane, messages in lane_messages.items()]
+        if len(futures) == 1:
+            return futures[0]
+
+        future = concurrent.Future()
+        if not futures:
+            future.set_result(None)
+            return future
+
+        def on_sent(f):
+            if f.exception() is not None:
+                future.set_exception(f.exception())
+            elif any(result is False for result in f.result()):
+                future.set_result(False)
+            else:
+                future.set_result(None)
+
+        gen.multi(futures).add_done_callback(on_sent)
+        return future
+
+    def drain(self):
+        return gen.multi([lane.drain() for lane in self._lanes])
+
+    @property
+    def outbound_queue_depth(self):
+        depths = [lane.outbound_queue_depth for lane in self._lanes]
+        return connection.QueueDepth(sum(depth.messages for depth in depths),
+                                     sum(depth.bytes for depth in depths))
+
+    @property
+    def inbound_queue_depth(self):
+        depths = [lane.inbound_queue_depth for lane in self._lanes]
+        return connection.QueueDepth(sum(depth.messages for depth in depths),
+                                     sum(depth.bytes for depth in depths))
+
+    @property
+    def round_trip_time(self):
+        """RoundTripTime: The round trip time of the slowest lane."""
+        return max((lane.round_trip_time for lane in self._lanes),
+                   key=lambda rtt: rtt.smoothed or 0)
+
+    @property
+    def dead_peer_timeout(self):
+        return max(lane.dead_peer_timeout for lane in self._lanes)
+
+    @property
+    def dispatch_stats(self):
+        """DispatchStats: The dispatch counters of all lanes combined, None
+        unless ``dispatchSliceTime`` is set."""
+        stats = [lane.dispatch_stats for lane in self._lanes]
+        if stats[0] is None:
+            return None
+        return dispatch.DispatchStats(
+            sum(lane_stats.slices for lane_stats in stats),
+            sum(lane_stats.messages for lane_stats in stats),
+            sum(lane_stats.pending for lane_stats in stats),
+            max(lane_stats.last for lane_stats in stats),
+            max(lane_stats.longest for lane_stats in stats),
+            sum(lane_stats.total for lane_stats in stats))
+
+    @property
+    def state(self):
+        """str: The least established state of any lane."""
+        return self._state
+
+    @property
+    def io_loop(self):
+        return self._io_loop
+
+    @property
+    def lanes(self):
+        """list: The connections of every lane."""
+        return list(self._lanes)
+
+    def _lane_for(self, topic, action, data):
+        return self._lanes[self._route(topic, action, data) % len(self._lanes)]
+
+    def _lane_for_raw(self, message):
+        if self._custom_routing:
+            parts = message.decode().split(
+                message_constants.MESSAGE_PART_SEPERATOR)
+            return self._lane_for(parts[0], parts[1], parts[2:])
+
+        # The built-in routes look at no more than the first two data parts,
+        # and hash the name as it was encoded
+        parts = message.split(_PART_SEPERATOR, 4)
+        return self._lane_for(parts[0].decode(), parts[1].decode(), parts[2:4])
+
+    def _route_by_topic(self, topic, action, data):
+        return self._topic_lanes.get(topic, 0)
+
+    def _route_by_name(self, topic, action, data):
+        if topic == constants.topic.PRESENCE or not data:
+            return self._route_by_topic(topic, action, data)
+
+        if action == constants.actions.ACK or (
+                topic == constants.topic.RPC and
+                action == constants.actions.ERROR):
+            # RPC acks and errors are prefixed by the action or error
+            name = data[1]
+        else:
+            name = data[0]
+
+        if not isinstance(name, bytes):
+            name = name.encode()
+        return zlib.crc32(name) & 0xffffffff
+
+    def _on_lane_state_changed(self, index, state):
+        if state == connection_state.RECONNECTING:
+            self._reconnected_lanes.add(self._lanes[index])
+
+        aggregate_state = min(
+            (lane.state for lane in self._lanes),
+            key=_STATE_ORDER.index)
+        if aggregate_state == self._state:
+            return
+
+        self._state = aggregate_state
+        if aggregate_state == connection_state.OPEN:
+            # Only the reconnected lanes lost their subscriptions, the
+            # resubscription that follows is limited to them
+            self._resubscribing_lanes = self._reconnected_lanes
+            self._reconnected_lanes = set()
+        self._client.emit(constants.event.CONNECTION_STATE_CHANGED,
+                          aggregate_state)
+
+
+def _lane_options(options, index):
+    journal_directory = options.get('offlineJournal')
+    if not journal_directory:
+        return options
+
+    # Lanes can't share a journal, each one gets a directory of its own
+    lane_options = dict(options)
+    lane_options['offlineJournal'] = os.path.join(
+        journal_directory, 'lane{0}'.format(index))
+    return lane_options
+
+
+class _LaneClient(object):
+    """Stands in for the client towards a single lane.
+
+    Everything is passed on to the client, except for connection state changes
+    which are combined across all lanes first.
+    """
+
+    def __init__(self, client, lanes, index):
+        self._client = client
+        self._lanes = lanes
+        self._index = index
+
+    def emit(self, event, *args):
+        if event == constants.event.CONNECTION_STATE_CHANGED:
+            self._lanes._on_lane_state_changed(self._index, *args)
+        else:
+            self._client.emit(event, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,90 @@
+"""Round trip time estimation for a connection."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+RoundTripTime = namedtuple('RoundTripTime', 'smoothed variance samples')
+RoundTripTime.__doc__ = """Round trip times in seconds.
+
+Attributes:
+    smoothed (float): the smoothed round trip time, None without samples
+    variance (float): the smoothed mean deviation of the round trip time
+    samples (int): the number of round trips measured
+"""
+
+# Gains from RFC 6298
+_ALPHA = 1 / 8
+_BETA = 1 / 4
+_K = 4
+
+
+class RoundTripEstimator(object):
+    """Keeps a smoothed round trip time and its variation, as TCP does for
+    its retransmission timeout (RFC 6298)."""
+
+    def __init__(self):
+        self._smoothed = None
+        self._variance = None
+        self._samples = 0
+
+    def add_sample(self, rtt):
+        """Adds a measured round trip of ``rtt`` seconds."""
+        if rtt < 0:
+            return
+        if self._smoothed is None:
+            self._smoothed = rtt
+            self._variance = rtt / 2
+        else:
+            self._variance = ((1 - _BETA) * self._variance +
+                              _BETA * abs(self._smoothed - rtt))
+            self._smoothed = (1 - _ALPHA) * self._smoothed + _ALPHA * rtt
+        self._samples += 1
+
+    def timeout(self, minimum=0):
+        """Returns how long a reply may take before it's overdue.
+
+        Args:
+            minimum (float): the lower bound of the timeout
+
+        Returns:
+            float: the smoothed round trip time plus four times its
+                variation, or None without samples
+        """
+        if self._smoothed is None:
+            return None
+        return max(self._smoothed + _K * self._variance, minimum)
+
+    @property
+    def round_trip_time(self):
+        """RoundTripTime: The current estimate."""
+        return RoundTripTime(self._smoothed, self._variance, self._samples)
+
+
+class IntervalEstimator(object):
+    """Smooths the time between recurring events, like server pings."""
+
+    def __init__(self):
+        self._last = None
+        self._interval = None
+
+    def add(self, now):
+        """Records an occurrence at ``now`` on a monotonic clock."""
+        if self._last is not None:
+            interval = now - self._last
+            if self._interval is None:
+                self._interval = interval
+            else:
+                self._interval = ((1 - _ALPHA) * self._interval +
+                                  _ALPHA * interval)
+        self._last = now
+
+    def reset(self):
+        self._last = None
+
+    @property
+    def interval(self):
+        """float: The smoothed interval, None until there were two
+        occurrences."""
+        return self._interval
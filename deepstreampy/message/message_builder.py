@@ -1,66 +1,203 @@
 from __future__ import absolute_import, division, print_function, with_statement
 from deepstreampy.constants import types
 from deepstreampy.constants import message as message_constants
-from deepstreampy.utils import Undefined
-import sys
-import json
-
-
-def get_message(topic, action, data=None):
-    send_data = [topic, action]
-
-    if data:
-        for param in data:
-            if isinstance(param, dict):
-                value = json.dumps(param,
-                                   separators=(',', ':'),
-                                   sort_keys=True)
-                send_data.append(value)
-            elif isinstance(param, list):
-                value = ("[" +
-                         ",".join('"{0}"'.format(item) for item in param) +
-                         "]")
-                send_data.append(value)
-            else:
-                send_data.append(str(param))
-
-    full_message = (message_constants.MESSAGE_PART_SEPERATOR.join(send_data) +
-                    message_constants.MESSAGE_SEPERATOR)
-    return full_message
-
-
-def typed(value):
-    if value is None:
-        return types.NULL
+from deepstreampy.message import codec as codecs
+from deepstreampy.utils import Undefined, num_types, str_types
 
-    value_type = type(value)
+_PART_SEPERATOR = message_constants.MESSAGE_PART_SEPERATOR.encode()
+_MESSAGE_SEPERATOR = message_constants.MESSAGE_SEPERATOR.encode()
+
+# Encoded "topic|action" of every pair built so far
+_prefixes = {}
+
+
+def build(topic, action, data=None, codec=None, canonical=False):
+    """Build a message as bytes, ready to be sent.
+
+    Args:
+        topic (str): the topic of the message
+        action (str): the action of the message
+        data (list): the data parts. Dicts and lists are written as JSON, str
+            and bytes as they are, an ``EncodedPayload`` in its typed wire
+            form, everything else as its ``str()``.
+        codec (Codec): the codec to write JSON with, by default the one
+            ``codec.get_codec`` picks
+        canonical (bool): whether to write the keys of dicts in sorted order,
+            so equal dicts always give the same message
+
+    Returns:
+        bytes: the message, followed by the message separator
+    """
+    prefix = _prefixes.get((topic, action))
+    if prefix is None:
+        prefix = _prefixes[(topic, action)] = (
+            topic.encode() + _PART_SEPERATOR + action.encode())
+
+    if not data:
+        return prefix + _MESSAGE_SEPERATOR
+
+    parts = [prefix]
+    for param in data:
+        encoder = _encoders.get(type(param), _encode_other)
+        parts.append(encoder(param, codec, canonical))
+    return _PART_SEPERATOR.join(parts) + _MESSAGE_SEPERATOR
+
+
+def prepare(value, codec=None):
+    """Serialize ``value`` once, to send it any number of times.
+
+    Args:
+        value: anything ``typed`` accepts
+        codec (Codec): the codec to write dicts and lists with
+
+    Returns:
+        EncodedPayload
+    """
+    return EncodedPayload(value, codec)
+
+
+class EncodedPayload(object):
+    """A value and its typed wire form, like ``O{"a":1}``.
+
+    Event, RPC and record methods accept it wherever they accept data, and
+    send the wire form without serializing the value again. The value must
+    not be changed afterwards, or the two no longer match.
+
+    The keys of dicts are written in sorted order, so a prepared record value
+    is sent in the same form as the record's own updates.
+
+    Attributes:
+        value: the value
+        typed (str): the typed wire form of the value
+    """
+
+    __slots__ = ('value', 'typed', '_encoded')
+
+    def __init__(self, value, codec=None):
+        self.value = value
+        self.typed = typed(value, codec, canonical=True)
+        self._encoded = self.typed.encode()
+
+    @property
+    def json(self):
+        """bytes: The value as JSON, for dicts and lists only."""
+        if self.typed[:1] != types.OBJECT:
+            raise ValueError('{0!r} is not an object'.format(self.value))
+        return self._encoded[1:]
+
+    def __repr__(self):
+        return 'EncodedPayload({0!r})'.format(self.value)
+
+
+def typed_part(value, codec=None):
+    """Return ``value`` as a typed data part for ``build``: an
+    ``EncodedPayload`` as it is, anything else converted by ``typed``."""
+    if type(value) is EncodedPayload:
+        return value
+    return typed(value, codec)
+
+
+def plain_value(value):
+    """Return the value of an ``EncodedPayload``, or ``value`` itself."""
+    if type(value) is EncodedPayload:
+        return value.value
+    return value
+
+
+def get_message(topic, action, data=None, codec=None):
+    """Build a message as str, with the keys of dicts in sorted order.
 
-    if sys.version_info < (3,):
-        num_types = (int, long, float, complex)
-        str_types = (str, unicode)
-    else:
-        num_types = (int, float, complex)
-        str_types = (str,)
-    obj_types = (dict, list,)
+    See ``build``, which returns the message as bytes.
+    """
+    return build(topic, action, data, codec, canonical=True).decode()
 
-    if value_type in str_types:
-        return types.STRING + value
 
-    if value_type in obj_types:
-        return types.OBJECT + json.dumps(value,
-                                         separators=(',', ':'),
-                                         sort_keys=False)
+def _encode_str(param, codec, canonical):
+    return param.encode()
 
-    if value_type is bool:
-        if value:
-            return types.TRUE
-        else:
-            return types.FALSE
 
-    if value_type in num_types:
-        return types.NUMBER + str(value)
+def _encode_bytes(param, codec, canonical):
+    return param
+
+
+def _encode_payload(param, codec, canonical):
+    return param._encoded
+
+
+def _encode_json(param, codec, canonical):
+    if codec is None:
+        codec = codecs.get_codec()
+    return codec.dumps(param, sort_keys=canonical).encode()
+
+
+def _encode_other(param, codec, canonical):
+    if isinstance(param, (dict, list)):
+        return _encode_json(param, codec, canonical)
+    return str(param).encode()
+
+
+_encoders = {dict: _encode_json, list: _encode_json, bytes: _encode_bytes,
+             EncodedPayload: _encode_payload}
+for _str_type in str_types:
+    if _str_type is not bytes:
+        _encoders[_str_type] = _encode_str
+
+
+def typed(value, codec=None, canonical=False):
+    """Return ``value`` as a typed str like ``N1`` or ``O{"a":1}``.
+
+    Args:
+        value: a str, number, bool, dict, list, None, ``Undefined``, an
+            ``EncodedPayload`` or anything else ``codec`` encodes
+        codec (Codec): the codec to write dicts and lists with
+        canonical (bool): whether to write the keys of dicts in sorted order
+
+    Raises:
+        ValueError: if ``value`` is of any other type
+    """
+    if value is None:
+        return types.NULL
+
+    value_type = type(value)
+    converter = _typed_converters.get(value_type)
+    if converter is not None:
+        return converter(value, codec, canonical)
 
     if value is Undefined:
         return types.UNDEFINED
 
+    # Like NumPy arrays, if the codec was set up for them
+    if codec is not None and codec.encodes(value):
+        return _typed_object(value, codec, canonical)
+
     raise ValueError("Can't serialize type {0}".format(value_type))
+
+
+def _typed_payload(value, codec, canonical):
+    return value.typed
+
+
+def _typed_str(value, codec, canonical):
+    return types.STRING + value
+
+
+def _typed_object(value, codec, canonical):
+    if codec is None:
+        codec = codecs.get_codec()
+    return types.OBJECT + codec.dumps(value, sort_keys=canonical)
+
+
+def _typed_bool(value, codec, canonical):
+    return types.TRUE if value else types.FALSE
+
+
+def _typed_number(value, codec, canonical):
+    return types.NUMBER + str(value)
+
+
+_typed_converters = {dict: _typed_object, list: _typed_object,
+                     bool: _typed_bool, EncodedPayload: _typed_payload}
+for _str_type in str_types:
+    _typed_converters[_str_type] = _typed_str
+for _num_type in num_types:
+    _typed_converters[_num_type] = _typed_number
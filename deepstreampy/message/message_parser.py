@@ -3,9 +3,11 @@ from __future__ import unicode_literals
 
 from deepstreampy.constants import message as message_constants
 from deepstreampy.constants import topic, event, actions, types
+from deepstreampy.utils import num_types
 
-import json
-import sys
+MESSAGE_SEPERATOR_BYTES = message_constants.MESSAGE_SEPERATOR.encode()
+MESSAGE_PART_SEPERATOR_BYTES = (
+    message_constants.MESSAGE_PART_SEPERATOR.encode())
 
 
 def parse(raw_messages, client):
@@ -14,11 +16,21 @@ def parse(raw_messages, client):
     for msg in raw_messages:
         # Ensure msg is not an empty string
         if msg:
-            parsed_messages.append(_parse_message(msg, client))
+            parsed_messages.append(parse_message(msg, client))
     return parsed_messages
 
 
-def _parse_message(message, client):
+def parse_message(message, client):
+    """Parse a single message without its ``MESSAGE_SEPERATOR``.
+
+    Args:
+        message (str): the message's parts joined by
+            ``MESSAGE_PART_SEPERATOR``
+        client: the client to report parse errors to
+
+    Returns:
+        Message: the parsed message, or None if it is malformed
+    """
     parts = message.split(message_constants.MESSAGE_PART_SEPERATOR)
     if len(parts) < 2:
         # A valid message consists of at least 2 parts: action and topic
@@ -32,13 +44,325 @@ def _parse_message(message, client):
                          'Unknown action {0}'.format(parts[1]))
         return
 
-    return {'raw': message,
-            'topic': parts[0],
-            'action': parts[1],
-            'data': parts[2:]}
+    return Message(parts[0], parts[1], parts[2:], message)
+
+
+def parse_bytes(raw_messages, client):
+    """Parse a frame of bytes without splitting it into strings.
+
+    Only the asyncio transport delivers frames as bytes. Tornado decodes text
+    frames to str before the connection sees them, so on the default
+    transport frames are parsed by ``parse``.
+
+    Args:
+        raw_messages (bytes): one or more messages, each terminated or
+            separated by ``MESSAGE_SEPERATOR``
+        client: the client to report parse errors to
+
+    Returns:
+        list: a ``BytesMessage`` for each message in the frame
+    """
+    parsed_messages = []
+    start = 0
+    length = len(raw_messages)
+    while start < length:
+        end = raw_messages.find(MESSAGE_SEPERATOR_BYTES, start)
+        if end == -1:
+            end = length
+        if start < end:
+            parsed_messages.append(
+                parse_message_bytes(raw_messages, start, end, client))
+        start = end + 1
+    return parsed_messages
+
+
+def parse_message_bytes(buffer, start, end, client):
+    """Parse the message at ``buffer[start:end]``.
+
+    Only the separators are located up front. The topic and action are
+    decoded straight away since every message is routed by them, all other
+    parts are decoded the first time a handler reads them.
+
+    Args:
+        buffer (bytes): the frame the message was received in
+        start (int): the offset of the message in ``buffer``
+        end (int): the offset of the message's ``MESSAGE_SEPERATOR``, or
+            the length of ``buffer`` for the last message
+        client: the client to report parse errors to
+
+    Returns:
+        BytesMessage: the parsed message, or None if it is malformed
+    """
+    offsets = [start]
+    separator = buffer.find(MESSAGE_PART_SEPERATOR_BYTES, start, end)
+    while separator != -1:
+        offsets.append(separator + 1)
+        separator = buffer.find(MESSAGE_PART_SEPERATOR_BYTES, separator + 1,
+                                end)
+    offsets.append(end + 1)
+
+    if len(offsets) < 3:
+        client._on_error(topic.ERROR,
+                         event.MESSAGE_PARSE_ERROR,
+                         'Insufficient message parts')
+        return
+
+    message_topic = buffer[offsets[0]:offsets[1] - 1].decode()
+    message_action = buffer[offsets[1]:offsets[2] - 1].decode()
+
+    if not actions.reverse_lookup(message_action):
+        client._on_error(topic.ERROR, event.MESSAGE_PARSE_ERROR,
+                         'Unknown action {0}'.format(message_action))
+        return
+
+    return BytesMessage(memoryview(buffer)[start:end], message_topic,
+                        message_action,
+                        [offset - start for offset in offsets[2:]])
+
+
+def raw_field(message, index):
+    """Return a data part of ``message`` in its received form.
+
+    For messages parsed from bytes this is the undecoded bytes of the part,
+    which can be handed to a codec's ``loads`` without a detour through
+    ``str``.
+    """
+    data = message['data']
+    if isinstance(data, LazyFields):
+        return data.raw(index)
+    return data[index]
+
+
+class LazyFields(object):
+    """The data parts of a ``BytesMessage``.
+
+    Behaves like a list of str, but a part is only decoded when it is read.
+    """
+
+    __slots__ = ('_view', '_offsets', '_decoded', '_replaced')
+
+    def __init__(self, view, offsets):
+        self._view = view
+        # Start offset of every part, followed by the end of the message plus
+        # one, so part i spans offsets[i]:offsets[i + 1] - 1
+        self._offsets = offsets
+        self._decoded = {}
+        self._replaced = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._index(index)
+        if index not in self._decoded:
+            self._decoded[index] = self.view(index).tobytes().decode()
+        return self._decoded[index]
+
+    def __setitem__(self, index, value):
+        index = self._index(index)
+        self._decoded[index] = value
+        if self._replaced is None:
+            self._replaced = set()
+        self._replaced.add(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def view(self, index):
+        """memoryview: The undecoded part at ``index``, without copying."""
+        index = self._index(index)
+        return self._view[self._offsets[index]:self._offsets[index + 1] - 1]
+
+    def raw(self, index):
+        """bytes: The undecoded part at ``index``, or its replacement if one
+        has been assigned."""
+        index = self._index(index)
+        if self._replaced and index in self._replaced:
+            return self._decoded[index]
+        return self.view(index).tobytes()
+
+    def _index(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('data index out of range')
+        return index
+
+
+# Item keys of the dicts messages used to be, and the attributes they map to
+_ITEM_ATTRIBUTES = {'topic': 'topic',
+                    'action': 'action',
+                    'data': 'data',
+                    'raw': 'raw',
+                    'processedError': 'processed_error'}
+
+# Actions whose first data part is a sub-action, so the name comes second
+_NAME_SECOND = frozenset([actions.ACK, actions.ERROR])
+_VERSIONED = frozenset([actions.READ, actions.UPDATE, actions.PATCH])
 
 
-def convert_typed(value, client):
+class Message(object):
+    """A parsed message.
+
+    Handlers read its parts as attributes. For callers written against the
+    dicts messages used to be, the keys ``topic``, ``action``, ``data``,
+    ``raw`` and ``processedError`` are also available as items, and other
+    keys can be set and read as items as well.
+
+    Attributes:
+        topic (str): the topic of the message
+        action (str): the action of the message
+        data (list): the data parts of the message
+        processed_error (bool): set by the handler that dealt with an error
+    """
+
+    __slots__ = ('topic', 'action', 'data', 'processed_error', '_raw',
+                 '_extra')
+
+    def __init__(self, message_topic, message_action, data, raw=None):
+        self.topic = message_topic
+        self.action = message_action
+        self.data = data
+        self.processed_error = False
+        self._raw = raw
+        self._extra = None
+
+    @property
+    def raw(self):
+        """str: The message as received, '' for messages built locally."""
+        return self._raw or ''
+
+    @property
+    def name(self):
+        """str: The name of the record, event, rpc or client the message is
+        about. Acks and errors carry it after the action they refer to."""
+        if self.action in _NAME_SECOND:
+            return self.data[1]
+        return self.data[0]
+
+    @property
+    def version(self):
+        """int: The record version of a read, update or patch, None for
+        other messages."""
+        if self.action in _VERSIONED:
+            return int(self.data[1])
+        return None
+
+    @property
+    def path(self):
+        """str: The path a patch sets, None for other messages."""
+        if self.action == actions.PATCH:
+            return self.data[2]
+        return None
+
+    def typed(self, index, client):
+        """Returns the data part at ``index`` as a ``TypedValue``, None if the
+        message has no such part.
+
+        Args:
+            index (int): the index of the part
+            client: the client to report conversion errors to
+        """
+        if index < len(self.data):
+            return TypedValue(self.data[index], client)
+        return None
+
+    def __getitem__(self, key):
+        attribute = _ITEM_ATTRIBUTES.get(key)
+        if attribute is not None:
+            return getattr(self, attribute)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        attribute = _ITEM_ATTRIBUTES.get(key)
+        if attribute is not None and attribute != 'raw':
+            setattr(self, attribute, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return (key in _ITEM_ATTRIBUTES or
+                bool(self._extra and key in self._extra))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return (self.topic == other.topic and self.action == other.action and
+                list(self.data) == list(other.data))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Message({0!r}, {1!r}, {2!r})'.format(
+            self.topic, self.action, list(self.data))
+
+
+class BytesMessage(Message):
+    """A message parsed by ``parse_bytes``, whose data parts are decoded the
+    first time they are read."""
+
+    __slots__ = ('_view',)
+
+    def __init__(self, view, message_topic, message_action, offsets):
+        super(BytesMessage, self).__init__(message_topic, message_action,
+                                           LazyFields(view, offsets))
+        self._view = view
+
+    @property
+    def raw(self):
+        return self._view.tobytes().decode()
+
+
+def as_message(message):
+    """Returns ``message`` as a ``Message``.
+
+    Dicts with the keys ``action``, ``data`` and optionally ``topic`` and
+    ``raw`` are converted, the data list is shared with the dict.
+    """
+    if isinstance(message, Message):
+        return message
+    converted = Message(message.get('topic'), message['action'],
+                        message['data'], message.get('raw'))
+    for key, value in message.items():
+        if key not in ('topic', 'action', 'data', 'raw'):
+            converted[key] = value
+    return converted
+
+
+def convert_typed(value, client, codec=None):
+    """Return the value of a typed field like ``O{"a":1}``.
+
+    Args:
+        value (str): the typed field
+        client: the client to report conversion errors to
+        codec (Codec): the codec to parse objects with, by default the codec
+            of ``client``
+    """
     value_type = value[0]
 
     if value_type == types.TRUE:
@@ -55,17 +379,12 @@ def convert_typed(value, client):
 
     if value_type == types.OBJECT:
         try:
-            return json.loads(value[1:])
+            return (codec or client.codec).loads(value[1:])
         except ValueError as e:
             client._on_error(topic.ERROR, event.MESSAGE_PARSE_ERROR, str(e))
             return
 
     if value_type == types.NUMBER:
-        if sys.version_info < (3,):
-            num_types = (int, long, float, complex)
-        else:
-            num_types = (int, float, complex)
-
         for num_type in num_types:
             try:
                 return num_type(value[1:])
@@ -74,3 +393,41 @@ def convert_typed(value, client):
 
     client._on_error(topic.ERROR, event.MESSAGE_PARSE_ERROR,
                      'UNKNOWN_TYPE ({0})'.format(value))
+
+
+class TypedValue(object):
+    """A typed value, like ``O{"a":1}``, that is converted the first time it
+    is read.
+
+    The type can be checked without converting the value, and the converted
+    value is cached, so a JSON object is parsed at most once.
+    """
+
+    __slots__ = ('_raw', '_client', '_value', '_converted')
+
+    def __init__(self, raw, client):
+        self._raw = raw
+        self._client = client
+        self._value = None
+        self._converted = False
+
+    @property
+    def raw(self):
+        """str: The value as received."""
+        return self._raw
+
+    @property
+    def type(self):
+        """str: The type prefix of the value, one of ``constants.types``."""
+        return self._raw[:1]
+
+    @property
+    def value(self):
+        """The converted value."""
+        if not self._converted:
+            self._value = convert_typed(self._raw, self._client)
+            self._converted = True
+        return self._value
+
+    def __repr__(self):
+        return 'TypedValue({0!r})'.format(self._raw)
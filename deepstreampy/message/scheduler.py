@@ -0,0 +1,156 @@
+"""Orders outgoing messages by priority class."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.constants import actions
+from deepstreampy.constants import priority
+from deepstreampy.constants import topic as topic_constants
+from deepstreampy.constants import message as message_constants
+
+from collections import deque
+
+_MESSAGE_SEPERATOR = message_constants.MESSAGE_SEPERATOR.encode()
+_PART_SEPERATOR = message_constants.MESSAGE_PART_SEPERATOR.encode()
+
+_CONTROL_TOPICS = (topic_constants.CONNECTION.encode(),
+                   topic_constants.AUTH.encode())
+_ACK = actions.ACK.encode()
+_RECORD = topic_constants.RECORD.encode()
+_BULK_ACTIONS = (actions.UPDATE.encode(), actions.PATCH.encode())
+
+
+def priority_of(raw_message):
+    """Returns the priority class of a message.
+
+    Connection and auth messages, like PONGs, are ``CONTROL``. Acks, like the
+    ack of an RPC request, are ``ACK``. Record UPDATEs and PATCHes are
+    ``BULK``. Everything else, including the other record messages, is
+    ``INTERACTIVE``. Several messages sent together take the class of the
+    first.
+
+    Args:
+        raw_message (bytes): one or more messages
+    """
+    parts = raw_message.split(_PART_SEPERATOR, 2)
+    topic = parts[0]
+    if topic in _CONTROL_TOPICS:
+        return priority.CONTROL
+    if len(parts) < 2:
+        return priority.INTERACTIVE
+    action = parts[1].split(_MESSAGE_SEPERATOR, 1)[0]
+    if action == _ACK:
+        return priority.ACK
+    if topic == _RECORD and action in _BULK_ACTIONS:
+        return priority.BULK
+    return priority.INTERACTIVE
+
+
+def _record_name(raw_message):
+    parts = raw_message.split(_PART_SEPERATOR, 3)
+    if parts[0] != _RECORD or len(parts) < 3:
+        return None
+    return parts[2].split(_MESSAGE_SEPERATOR, 1)[0]
+
+
+class OutboundQueue(object):
+    """Queued ``(raw_message, future)`` pairs, a FIFO queue per priority
+    class.
+
+    Messages are taken from the most urgent class that has any, so messages
+    of the same class keep their order and a message is never queued behind
+    a less urgent one. The exception are messages about a record with queued
+    UPDATEs or PATCHes, which are bulk until those are sent, so the messages
+    of a record keep their order too.
+    """
+
+    def __init__(self, items=()):
+        self._queues = [deque() for _ in priority.CLASSES]
+        # Record name to the number of its messages in the bulk queue
+        self._bulk_records = {}
+        for item in items:
+            self.append(item)
+
+    def priority_of(self, raw_message):
+        """Returns the class ``raw_message`` is queued in, see
+        ``priority_of`` and the exception above."""
+        message_priority = priority_of(raw_message)
+        if (message_priority != priority.BULK and self._bulk_records and
+                _record_name(raw_message) in self._bulk_records):
+            return priority.BULK
+        return message_priority
+
+    def append(self, item):
+        self._queue_for(item[0]).append(item)
+
+    def appendleft(self, item):
+        self._queue_for(item[0]).appendleft(item)
+
+    def extendleft(self, items):
+        for item in items:
+            self.appendleft(item)
+
+    def popleft(self):
+        """Removes and returns the next message to send."""
+        for queue in self._queues:
+            if queue:
+                return self._pop(queue)
+        raise IndexError('pop from an empty queue')
+
+    def pop_oldest(self):
+        """Removes and returns the oldest message of the least urgent class.
+
+        Only ``INTERACTIVE`` and ``BULK`` messages are taken, connection
+        messages and acks are never given up on.
+        """
+        for queue in reversed(self._queues[priority.INTERACTIVE:]):
+            if queue:
+                return self._pop(queue)
+        raise IndexError('pop from an empty queue')
+
+    def has_droppable(self):
+        """Whether ``pop_oldest`` has a message to return."""
+        return any(self._queues[priority.INTERACTIVE:])
+
+    def next_priority(self):
+        """int: The class of the next message to send, None if empty."""
+        for priority_class, queue in enumerate(self._queues):
+            if queue:
+                return priority_class
+        return None
+
+    def blocks(self, priority_class):
+        """Whether a message of ``priority_class`` has to wait for queued
+        ones."""
+        return any(self._queues[:priority_class + 1])
+
+    def clear(self):
+        for queue in self._queues:
+            queue.clear()
+        self._bulk_records.clear()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues)
+
+    def __iter__(self):
+        """Iterates over the messages in the order they'll be sent."""
+        for queue in self._queues:
+            for item in queue:
+                yield item
+
+    def _queue_for(self, raw_message):
+        message_priority = self.priority_of(raw_message)
+        if message_priority == priority.BULK:
+            name = _record_name(raw_message)
+            if name is not None:
+                self._bulk_records[name] = self._bulk_records.get(name, 0) + 1
+        return self._queues[message_priority]
+
+    def _pop(self, queue):
+        item = queue.popleft()
+        if queue is self._queues[priority.BULK]:
+            name = _record_name(item[0])
+            count = self._bulk_records.pop(name, 0) - 1
+            if count > 0:
+                self._bulk_records[name] = count
+        return item
@@ -0,0 +1,223 @@
+"""Keeps a second, authenticated connection ready to take over."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy import constants
+from deepstreampy.message import connection
+from deepstreampy.constants import connection_state
+
+from tornado import concurrent
+
+# States in which the active connection can't carry traffic
+_LOST_STATES = (connection_state.ERROR, connection_state.RECONNECTING)
+
+
+class StandbyConnection(object):
+    """A connection with a hot standby that stands in for a single
+    ``Connection``.
+
+    Once the active connection is authenticated, a standby connection is
+    opened and authenticated with the same parameters. It carries no traffic
+    besides heartbeats. When the active connection is lost while the standby
+    is open, the standby becomes the active connection right away: the
+    messages queued on the lost connection are sent over it, the connection
+    state goes through ``RECONNECTING`` to ``OPEN`` so subscriptions are
+    restored on it, and a new standby is opened in the background. If the
+    standby isn't open either, the active connection reconnects as usual.
+
+    Options:
+        hotStandby (bool): whether to keep a standby connection
+        standbyUrl: the url or list of urls of the standby, by default the
+            url of the client. Pointing it at another server of the cluster
+            protects against that server going down.
+        standbyRetryInterval (float): seconds to wait before opening a new
+            standby after one gave up reconnecting, by default
+            ``maxReconnectInterval``
+    """
+
+    def __init__(self, client, url, **options):
+        if options.get('offlineJournal'):
+            raise ValueError("offlineJournal can't be used with hotStandby")
+
+        self._client = client
+        self._options = options
+        self._standby_url = options.get('standbyUrl', url)
+        self._retry_interval = options.get(
+            'standbyRetryInterval', options.get('maxReconnectInterval', 18))
+
+        self._active = self._create(url)
+        self._standby = None
+        self._io_loop = self._active.io_loop
+        self._auth_params = None
+        self._state = connection_state.CLOSED
+        self._closing = False
+        self._failing_over = False
+        self._standby_timeout = None
+
+    def connect(self, callback=None):
+        self._closing = False
+        return self._active.connect(callback)
+
+    def close(self):
+        self._closing = True
+        if self._standby_timeout is not None:
+            self._io_loop.remove_timeout(self._standby_timeout)
+            self._standby_timeout = None
+        if self._standby is not None:
+            self._standby.close()
+            self._standby = None
+        self._active.close()
+
+    def authenticate(self, auth_params):
+        self._auth_params = auth_params
+        return self._active.authenticate(auth_params)
+
+    def send_message(self, topic, action, data):
+        return self._active.send_message(topic, action, data)
+
+    def send(self, raw_message, resubscribe=False):
+        return self._active.send(raw_message, resubscribe)
+
+    def drain(self):
+        return self._active.drain()
+
+    @property
+    def outbound_queue_depth(self):
+        return self._active.outbound_queue_depth
+
+    @property
+    def inbound_queue_depth(self):
+        return self._active.inbound_queue_depth
+
+    @property
+    def round_trip_time(self):
+        return self._active.round_trip_time
+
+    @property
+    def dead_peer_timeout(self):
+        return self._active.dead_peer_timeout
+
+    @property
+    def dispatch_stats(self):
+        return self._active.dispatch_stats
+
+    @property
+    def state(self):
+        """str: The state of the active connection."""
+        return self._state
+
+    @property
+    def io_loop(self):
+        return self._io_loop
+
+    @property
+    def active(self):
+        """Connection: The connection that carries the traffic."""
+        return self._active
+
+    @property
+    def standby(self):
+        """Connection: The standby connection, None while there is none."""
+        return self._standby
+
+    def _create(self, url):
+        standby_client = _StandbyClient(self._client, self)
+        standby_client.connection = connection.Connection(
+            standby_client, url, **self._options)
+        return standby_client.connection
+
+    def _set_state(self, state):
+        self._state = state
+        self._client.emit(constants.event.CONNECTION_STATE_CHANGED, state)
+
+    def _on_state_changed(self, source, state):
+        if source is self._standby:
+            if state == connection_state.CLOSED and not self._closing:
+                # The standby gave up reconnecting, try again later
+                self._standby = None
+                self._schedule_standby()
+            return
+        if source is not self._active:
+            return
+
+        self._set_state(state)
+        if state == connection_state.OPEN:
+            if self._standby is None and self._standby_timeout is None:
+                self._open_standby()
+        elif (state in _LOST_STATES and not self._failing_over and
+              self._standby is not None and
+              self._standby.state == connection_state.OPEN):
+            # Fail over once the connection is done handling the loss
+            self._failing_over = True
+            self._io_loop.add_callback(self._fail_over)
+
+    def _schedule_standby(self):
+        if self._standby_timeout is None:
+            self._standby_timeout = self._io_loop.call_later(
+                self._retry_interval, self._open_standby)
+
+    def _open_standby(self):
+        self._standby_timeout = None
+        if self._closing or self._auth_params is None:
+            return
+
+        self._standby = self._create(self._standby_url)
+        self._standby.connect()
+        self._standby.authenticate(self._auth_params)
+
+    def _fail_over(self):
+        self._failing_over = False
+        lost = self._active
+        standby = self._standby
+        if (self._closing or lost.state not in _LOST_STATES or
+                standby is None or standby.state != connection_state.OPEN):
+            return
+
+        lost.close()
+        self._active = standby
+        self._standby = None
+        for raw_message, future in lost.take_queued_messages():
+            concurrent.chain_future(standby.send(raw_message), future)
+
+        # Subscriptions are restored on the new connection on the way to OPEN
+        if self._state != connection_state.RECONNECTING:
+            self._set_state(connection_state.RECONNECTING)
+        self._client.emit(constants.event.CONNECTION_FAILOVER,
+                          lost.url, standby.url)
+        self._set_state(connection_state.OPEN)
+        self._open_standby()
+
+
+class _StandbyClient(object):
+    """Stands in for the client towards one of the connections.
+
+    Everything coming from the active connection is passed on to the client,
+    except for connection state changes which go through the
+    ``StandbyConnection`` first. Everything else is dropped.
+    """
+
+    def __init__(self, client, standby):
+        self._client = client
+        self._standby = standby
+        self.connection = None
+
+    def emit(self, event, *args):
+        if event == constants.event.CONNECTION_STATE_CHANGED:
+            self._standby._on_state_changed(self.connection, *args)
+        elif self._is_active():
+            self._client.emit(event, *args)
+
+    def _on_message(self, message):
+        if self._is_active():
+            self._client._on_message(message)
+
+    def _on_error(self, topic, event, msg=None):
+        if self._is_active():
+            self._client._on_error(topic, event, msg)
+
+    def _is_active(self):
+        return self.connection is self._standby.active
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
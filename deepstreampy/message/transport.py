@@ -0,0 +1,184 @@
+"""Websocket transports a ``Connection`` can run on."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.utils import str_types
+
+from tornado import concurrent, ioloop, websocket
+
+import weakref
+
+TORNADO = 'tornado'
+ASYNCIO = 'asyncio'
+
+
+def get_transport(transport=None, uvloop=False, compression=False,
+                  compressionThreshold=None, compressionContextTakeover=True,
+                  **options):
+    """Return the transport a connection should use.
+
+    Args:
+        transport: ``'tornado'`` (the default), ``'asyncio'`` or an instance
+            of ``Transport``
+        uvloop (bool): whether the asyncio transport should create a uvloop
+            event loop if there is no current loop
+        compression (bool): whether permessage-deflate is negotiated
+        compressionThreshold (int): the size in bytes below which messages
+            are sent uncompressed
+        compressionContextTakeover (bool): whether the compression context is
+            kept between messages
+        **options: the remaining client options
+
+    Raises:
+        ValueError: for compression with a threshold or without context
+            takeover on the tornado transport, which can't apply either
+    """
+    if transport is None or transport == TORNADO:
+        if compression and compressionThreshold is not None:
+            raise ValueError('compressionThreshold requires the asyncio '
+                             'transport')
+        if compression and not compressionContextTakeover:
+            raise ValueError('compressionContextTakeover=False requires the '
+                             'asyncio transport')
+        return TornadoTransport()
+
+    if transport == ASYNCIO:
+        from deepstreampy.message.asyncio_transport import AsyncioTransport
+        return AsyncioTransport(use_uvloop=uvloop)
+
+    if isinstance(transport, str_types):
+        raise ValueError("Unknown transport {0}".format(transport))
+
+    return transport
+
+
+class Transport(object):
+    """Opens websockets and schedules timers for a connection.
+
+    A websocket returned by a transport provides ``write_message(bytes)``,
+    which returns a future resolved once the message is written, ``close()``
+    and ``stream.closed()``.
+
+    The ``io_loop`` of a transport is used by the connection and all handlers
+    to schedule callbacks. It provides ``call_later(delay, callback)``,
+    ``remove_timeout(handle)``, ``add_callback(callback)``, ``time()``,
+    ``start()`` and ``stop()`` with the same meaning as on a tornado
+    ``IOLoop``.
+    """
+
+    @property
+    def io_loop(self):
+        raise NotImplementedError
+
+    def connect(self, url, on_open, on_message, compression=None):
+        """Open a websocket.
+
+        Args:
+            url (str): the url to connect to
+            on_open (callable): called with the future returned by this method
+                once the websocket is open or failed to open
+            on_message (callable): called with every message received, and
+                with None once the websocket is closed. Messages are passed
+                as the transport read them: bytes, whose data parts the
+                connection only decodes once they're read, or str if the
+                transport decoded them already.
+            compression (dict): if given, permessage-deflate is negotiated with
+                the ``level``, ``threshold`` and ``context_takeover`` in it.
+                Transports may apply only some of them, see
+                ``TornadoTransport``.
+
+        Returns:
+            A future that resolves with the websocket.
+        """
+        raise NotImplementedError
+
+    def pause_reading(self, websocket_handler):
+        """Stop reading from a websocket opened by this transport until
+        ``resume_reading`` is called.
+
+        The message that is being read at the time may still be delivered.
+        Transports that can't pause keep reading.
+        """
+
+    def resume_reading(self, websocket_handler):
+        """Continue reading from a websocket after ``pause_reading``."""
+
+
+class TornadoTransport(Transport):
+    """Runs connections on tornado's websocket client and IOLoop.
+
+    Compression is negotiated through tornado's ``compression_options``,
+    which only take the compression level: once permessage-deflate is agreed
+    on, every message is compressed whatever its size, and the compression
+    context is kept unless the server asks for ``client_no_context_takeover``.
+    ``get_transport`` rejects the ``compressionThreshold`` and
+    ``compressionContextTakeover`` options with tornado rather than ignore
+    them, the asyncio transport applies both.
+
+    Tornado decodes text frames to str, which are passed on as they are and
+    parsed as str. Encoding them again would cost more than the byte parser
+    saves.
+    """
+
+    def __init__(self):
+        self._io_loop = ioloop.IOLoop.current()
+        self._gates = weakref.WeakKeyDictionary()
+
+    @property
+    def io_loop(self):
+        return self._io_loop
+
+    def connect(self, url, on_open, on_message, compression=None):
+        connect_options = {}
+        if compression is not None:
+            connect_options['compression_options'] = {
+                'compression_level': compression['level']}
+
+        def on_connected(f):
+            if not f.exception():
+                self._gates[f.result()] = _ReadGate(f.result())
+            on_open(f)
+
+        return websocket.websocket_connect(url,
+                                           callback=on_connected,
+                                           on_message_callback=on_message,
+                                           **connect_options)
+
+    def pause_reading(self, websocket_handler):
+        gate = self._gates.get(websocket_handler)
+        if gate is not None:
+            gate.close()
+
+    def resume_reading(self, websocket_handler):
+        gate = self._gates.get(websocket_handler)
+        if gate is not None:
+            gate.open()
+
+
+class _ReadGate(object):
+    """Holds back tornado's frame loop while closed.
+
+    The loop waits for the future returned by ``on_message`` before it reads
+    the next frame, so the gate hands it one until it is opened again. The
+    message callback itself still runs for every frame that was read.
+    """
+
+    def __init__(self, websocket_handler):
+        self._future = None
+        self._on_message = websocket_handler.on_message
+        websocket_handler.on_message = self._deliver
+
+    def close(self):
+        if self._future is None:
+            self._future = concurrent.Future()
+
+    def open(self):
+        future = self._future
+        self._future = None
+        if future is not None:
+            future.set_result(None)
+
+    def _deliver(self, message):
+        self._on_message(message)
+        return self._future
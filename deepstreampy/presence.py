@@ -4,14 +4,13 @@ from __future__ import unicode_literals
 from deepstreampy.constants import topic as topic_constants
 from deepstreampy.constants import actions as action_constants
 from deepstreampy.constants import event as event_constants
+from deepstreampy.message import message_parser
 from deepstreampy.utils import AckTimeoutRegistry
-from deepstreampy.utils import ResubscribeNotifier
+from deepstreampy.routing import DispatchTable
 
 from tornado import concurrent
 from tornado import gen
 
-import json
-
 
 class PresenceHandler(object):
     def __init__(self, connection, client, **options):
@@ -23,8 +22,8 @@ class PresenceHandler(object):
         subscription_timeout = options.get("subscriptionTimeout", 15)
         self._ack_timeout_registry = AckTimeoutRegistry(
             client, topic_constants.PRESENCE, subscription_timeout)
-        self._resubscribe_notifier = ResubscribeNotifier(
-            client, self._resubscribe)
+        self._routes = DispatchTable()
+        self.register_routes(self._routes)
 
     @gen.coroutine
     def get_all(self):
@@ -53,6 +52,9 @@ class PresenceHandler(object):
             users_str = ",".join(users)
 
         self._ack_timeout_registry.add(action_constants.SUBSCRIBE, users_str)
+        self._client.resubscriptions.add(topic_constants.PRESENCE,
+                                         action_constants.SUBSCRIBE,
+                                         action_constants.SUBSCRIBE)
 
         return self._connection.send_message(
             topic_constants.PRESENCE, action_constants.SUBSCRIBE, users_str)
@@ -68,51 +70,69 @@ class PresenceHandler(object):
             users_str = ",".join(users)
 
         self._ack_timeout_registry.add(action_constants.UNSUBSCRIBE, users_str)
+        if not self._callbacks:
+            self._client.resubscriptions.remove(topic_constants.PRESENCE,
+                                                action_constants.SUBSCRIBE,
+                                                action_constants.SUBSCRIBE)
 
         return self._connection.send_message(
             topic_constants.PRESENCE, action_constants.UNSUBSCRIBE, users_str)
 
+    def register_routes(self, routes):
+        """Registers the methods handling incoming presence messages.
+
+        Args:
+            routes (DispatchTable): the table to register them with
+        """
+        presence = topic_constants.PRESENCE
+        routes.register(presence, action_constants.ERROR,
+                        self._on_message_denied,
+                        event_constants.MESSAGE_DENIED)
+        routes.register(presence, action_constants.ACK,
+                        self._ack_timeout_registry.clear)
+        routes.register(presence, action_constants.PRESENCE_JOIN,
+                        self._on_join)
+        routes.register(presence, action_constants.PRESENCE_LEAVE,
+                        self._on_leave)
+        routes.register(presence, action_constants.QUERY, self._on_query)
+        routes.register_fallback(presence, self._on_unsolicited)
+
     def handle(self, message):
-        action = message['action']
-        data = message['data']
-        if (action == action_constants.ERROR
-                and data[0] == event_constants.MESSAGE_DENIED):
-            self._ack_timeout_registry.remove(topic_constants.PRESENCE,
-                                              data[1])
-            message['processedError'] = True
-            self._client._on_error(topic_constants.PRESENCE,
-                                   event_constants.MESSAGE_DENIED, data[1])
-        elif action == action_constants.ACK:
-            self._ack_timeout_registry.clear(message)
-        elif action == action_constants.PRESENCE_JOIN:
-            user = data[0]
-            if user in self._callbacks.keys():
-                self._callbacks[user](user, True)
-            if topic_constants.PRESENCE in self._callbacks:
-                self._callbacks[topic_constants.PRESENCE](user, True)
-        elif action == action_constants.PRESENCE_LEAVE:
-            user = data[0]
-            if user in self._callbacks.keys():
-                self._callbacks[user](user, False)
-            if topic_constants.PRESENCE in self._callbacks:
-                self._callbacks[topic_constants.PRESENCE](user, False)
-        elif action == action_constants.QUERY:
-            parsed = self._parse_query_response(data)
-            if self._query_future:
-                self._query_future.set_result(parsed)
-                self._query_future = None
-        else:
-            self._client._on_error(topic_constants.PRESENCE,
-                                   event_constants.UNSOLICITED_MESSAGE, action)
+        self._routes.dispatch(message_parser.as_message(message),
+                              topic_constants.PRESENCE)
+
+    def _on_message_denied(self, message):
+        data = message.data
+        self._ack_timeout_registry.remove(topic_constants.PRESENCE, data[1])
+        message.processed_error = True
+        self._client._on_error(topic_constants.PRESENCE,
+                               event_constants.MESSAGE_DENIED, data[1])
+
+    def _on_join(self, message):
+        self._notify(message.data[0], True)
+
+    def _on_leave(self, message):
+        self._notify(message.data[0], False)
+
+    def _notify(self, user, logged_in):
+        if user in self._callbacks:
+            self._callbacks[user](user, logged_in)
+        if topic_constants.PRESENCE in self._callbacks:
+            self._callbacks[topic_constants.PRESENCE](user, logged_in)
+
+    def _on_query(self, message):
+        parsed = self._parse_query_response(message.data)
+        if self._query_future:
+            self._query_future.set_result(parsed)
+            self._query_future = None
+
+    def _on_unsolicited(self, message):
+        self._client._on_error(topic_constants.PRESENCE,
+                               event_constants.UNSOLICITED_MESSAGE,
+                               message.action)
 
     def _parse_query_response(self, response):
         if response and response[0].isdigit():
-            data = json.loads(response[1])
+            data = self._client.codec.loads(response[1])
             return data
         return response
-
-    def _resubscribe(self):
-        if self._callbacks:
-            self._connection.send_message(topic_constants.PRESENCE,
-                                          action_constants.SUBSCRIBE,
-                                          [action_constants.SUBSCRIBE])
@@ -5,16 +5,16 @@ from deepstreampy.constants import topic as topic_constants
 from deepstreampy.constants import actions as action_constants
 from deepstreampy.constants import event as event_constants
 from deepstreampy.constants import connection_state
-from deepstreampy.message import message_parser, message_builder
-from deepstreampy.utils import ResubscribeNotifier, SingleNotifier, Listener
+from deepstreampy.message import compaction, message_parser, message_builder
+from deepstreampy.utils import SingleNotifier, Listener
 from deepstreampy.utils import str_types
 from deepstreampy.constants import merge_strategies
 from deepstreampy import jsonpath
+from deepstreampy.routing import DispatchTable
 
 from pyee import EventEmitter
 from tornado import gen, concurrent
 
-import json
 from functools import partial
 from copy import deepcopy
 
@@ -51,15 +51,15 @@ class Record(EventEmitter, object):
         if 'merge_strategy' in options:
             self.merge_strategy = options['merge_strategy']
 
-        self._resubscribe_notifier = ResubscribeNotifier(client,
-                                                         self._send_read)
+        client.resubscriptions.add(topic_constants.RECORD,
+                                   action_constants.CREATEORREAD, name)
         record_read_ack_timeout = options.get("recordReadAckTimeout", 15)
-        self._read_ack_timeout = client.io_loop.call_later(
+        self._read_ack_timeout = client.timeouts.call_later(
             record_read_ack_timeout,
             partial(self._on_timeout, event_constants.ACK_TIMEOUT))
 
         record_read_timeout = options.get("recordReadTimeout", 15)
-        self._read_timeout = client.io_loop.call_later(
+        self._read_timeout = client.timeouts.call_later(
             record_read_timeout,
             partial(self._on_timeout, event_constants.RESPONSE_TIMEOUT))
 
@@ -96,10 +96,11 @@ class Record(EventEmitter, object):
         If the new data is equal to the current data, nothing happens.
 
         Args:
-            data: the new value of the data
+            data: the new value of the data, or an ``EncodedPayload`` of it
             path (str, optional): a JSON path
             callback (callable)
         """
+        value = message_builder.plain_value(data)
         config = {}
         if callback:
             state = self._client.connection_state
@@ -113,7 +114,7 @@ class Record(EventEmitter, object):
                 config['writeSuccess'] = True
                 self._set_up_callback(self.version, callback)
 
-        if path is None and not isinstance(data, (dict, list)):
+        if path is None and not isinstance(value, (dict, list)):
             raise ValueError(
                 "Invalid record data {0}: Record data must be a dict or list.")
 
@@ -127,7 +128,7 @@ class Record(EventEmitter, object):
 
         old_value = self._data
         deep_copy = self._options.get('recordDeepCopy', True)
-        new_value = jsonpath.set(old_value, path, data, deep_copy)
+        new_value = jsonpath.set(old_value, path, value, deep_copy)
 
         if new_value == old_value:
             if callback:
@@ -200,7 +201,7 @@ class Record(EventEmitter, object):
 
             if self.usages <= 0:
                 self.emit('destroyPending')
-                self._discard_timeout = self._client.io_loop.call_later(
+                self._discard_timeout = self._client.timeouts.call_later(
                     1, partial(self._on_timeout, event_constants.ACK_TIMEOUT))
 
                 send_future = self._connection.send_message(
@@ -224,7 +225,7 @@ class Record(EventEmitter, object):
 
         def ready_callback(record):
             self.emit('destroyPending')
-            self._delete_ack_timeout = self._client.io_loop.call_later(
+            self._delete_ack_timeout = self._client.timeouts.call_later(
                 self._record_delete_timeout,
                 partial(self._on_timeout, event_constants.DELETE_TIMEOUT))
 
@@ -242,48 +243,67 @@ class Record(EventEmitter, object):
         else:
             self.once('ready', partial(callback, self))
 
+    def _on_writes_compacted(self, dropped_versions):
+        """Renumbers the local version after writes of this record were
+        dropped from the offline queue."""
+        self._version = compaction.compacted_version(self._version,
+                                                     dropped_versions)
+        self._write_callbacks = dict(
+            (compaction.compacted_version(version, dropped_versions), callback)
+            for version, callback in self._write_callbacks.items())
+
     def _set_up_callback(self, current_version, callback):
         new_version = (current_version or 0) + 1
         self._write_callbacks[new_version] = callback
 
     def _on_message(self, message):
-        action = message['action']
-
-        if action == action_constants.READ:
-            if self.version is None:
-                self._client.io_loop.remove_timeout(self._read_timeout)
-                self._on_read(message)
-            else:
-                self._apply_update(message)
-
-        elif action == action_constants.ACK:
-            self._process_ack_message(message)
+        message = message_parser.as_message(message)
+        handler = self._MESSAGE_HANDLERS.get(message.action)
+        if handler is not None:
+            getattr(self, handler)(message)
 
-        elif action in (action_constants.UPDATE, action_constants.PATCH):
+    def _on_read_message(self, message):
+        if self.version is None:
+            self._client.timeouts.remove_timeout(self._read_timeout)
+            self._on_read(message)
+        else:
             self._apply_update(message)
 
-        elif action == action_constants.WRITE_ACKNOWLEDGEMENT:
-            versions = json.loads(message['data'][1])
-            for version in versions:
-                if version in self._write_callbacks:
-                    callback = self._write_callbacks[version]
-                    callback(message_parser.convert_typed(message['data'][2],
-                                                          self._client))
-                    del self._write_callbacks[version]
-
-        elif message['data'][0] == event_constants.VERSION_EXISTS:
-            self._recover_record(message['data'][2],
-                                 json.loads(message['data'][3]),
+    def _on_write_ack(self, message):
+        versions = self._client.codec.loads(message.data[1])
+        error = message.typed(2, self._client)
+        for version in versions:
+            if version in self._write_callbacks:
+                callback = self._write_callbacks[version]
+                callback(error.value)
+                del self._write_callbacks[version]
+
+    def _on_error_message(self, message):
+        if message.data[0] == event_constants.VERSION_EXISTS:
+            self._recover_record(message.data[2],
+                                 self._client.codec.loads(message.data[3]),
                                  message)
 
-        elif action == event_constants.MESSAGE_DENIED:
-            self._clear_timeouts()
+    def _on_message_denied(self, message):
+        self._clear_timeouts()
 
-        elif action == action_constants.SUBSCRIPTION_HAS_PROVIDER:
-            has_provider = message_parser.convert_typed(message['data'][1],
-                                                        self._client)
-            self._has_provider = has_provider
-            self.emit('hasProviderChanged', has_provider)
+    def _on_has_provider(self, message):
+        has_provider = message_parser.convert_typed(message.data[1],
+                                                    self._client)
+        self._has_provider = has_provider
+        self.emit('hasProviderChanged', has_provider)
+
+    # Names rather than functions, so subclasses can override the methods
+    _MESSAGE_HANDLERS = {
+        action_constants.READ: '_on_read_message',
+        action_constants.ACK: '_process_ack_message',
+        action_constants.UPDATE: '_apply_update',
+        action_constants.PATCH: '_apply_update',
+        action_constants.WRITE_ACKNOWLEDGEMENT: '_on_write_ack',
+        action_constants.ERROR: '_on_error_message',
+        event_constants.MESSAGE_DENIED: '_on_message_denied',
+        action_constants.SUBSCRIPTION_HAS_PROVIDER: '_on_has_provider',
+    }
 
     def _recover_record(self, remote_version, remote_data, message):
         if self.merge_strategy:
@@ -320,8 +340,8 @@ class Record(EventEmitter, object):
 
                 return
 
-            config = message['data'][4] if len(message['data']) >= 5 else None
-            if config and json.loads(config)['writeSuccess']:
+            config = message.data[4] if len(message.data) >= 5 else None
+            if config and self._client.codec.loads(config)['writeSuccess']:
                 callback = self._write_callbacks[old_version]
                 del self._write_callbacks[old_version]
                 self._set_up_callback(self.version, callback)
@@ -334,10 +354,10 @@ class Record(EventEmitter, object):
                           remote_version, self.version))
 
     def _process_ack_message(self, message):
-        acknowledge_action = message['data'][0]
+        acknowledge_action = message.data[0]
 
         if acknowledge_action == action_constants.SUBSCRIBE:
-            self._client.io_loop.remove_timeout(self._read_ack_timeout)
+            self._client.timeouts.remove_timeout(self._read_ack_timeout)
 
         elif acknowledge_action == action_constants.DELETE:
             self.emit('delete')
@@ -348,29 +368,37 @@ class Record(EventEmitter, object):
             self._destroy()
 
     def _apply_update(self, message):
-        version = int(message['data'][1])
-        if message['action'] == action_constants.PATCH:
-            data = message_parser.convert_typed(
-                message['data'][3], self._client)
-        else:
-            data = json.loads(message['data'][2])
+        version = message.version
+        is_patch = message.action == action_constants.PATCH
 
         if self.version is None:
             self._version = version
         elif self.version + 1 != version:
-            if message['action'] == action_constants.PATCH:
+            if is_patch:
+                # The snapshot replaces the patch, so its value isn't needed
                 self._connection.send_message(topic_constants.RECORD,
                                               action_constants.SNAPSHOT,
                                               [self.name])
             else:
-                self._recover_record(version, data, message)
+                self._recover_record(
+                    version,
+                    self._client.codec.loads(
+                        message_parser.raw_field(message, 2)),
+                    message)
 
             return
 
+        if is_patch:
+            data = message_parser.convert_typed(
+                message.data[3], self._client)
+        else:
+            data = self._client.codec.loads(
+                message_parser.raw_field(message, 2))
+
         self._begin_change()
         self._version = version
-        if message['action'] == action_constants.PATCH:
-            jsonpath.set(self._data, message['data'][2], data, False)
+        if is_patch:
+            jsonpath.set(self._data, message.path, data, False)
         else:
             self._data = data
 
@@ -379,6 +407,11 @@ class Record(EventEmitter, object):
     def _send_update(self, path, data, config):
         self._version += 1
         if not path:
+            # Keys in sorted order, so equal values are sent alike
+            if isinstance(data, message_builder.EncodedPayload):
+                data = data.json
+            else:
+                data = self._client.codec.dumps(data, sort_keys=True)
             if config:
                 msg_data = [self.name, self.version, data, config]
             else:
@@ -387,12 +420,11 @@ class Record(EventEmitter, object):
                                           action_constants.UPDATE,
                                           msg_data)
         else:
+            typed_data = message_builder.typed_part(data, self._client.codec)
             if config:
-                msg_data = [self.name, self.version, path,
-                            message_builder.typed(data), config]
+                msg_data = [self.name, self.version, path, typed_data, config]
             else:
-                msg_data = [self.name, self.version, path,
-                            message_builder.typed(data)]
+                msg_data = [self.name, self.version, path, typed_data]
             self._connection.send_message(topic_constants.RECORD,
                                           action_constants.PATCH,
                                           msg_data)
@@ -424,8 +456,9 @@ class Record(EventEmitter, object):
 
     def _on_read(self, message):
         self._begin_change()
-        self._version = int(message['data'][1])
-        self._data = json.loads(message['data'][2])
+        self._version = message.version
+        self._data = self._client.codec.loads(
+            message_parser.raw_field(message, 2))
         self._complete_change()
         self._set_ready()
 
@@ -487,11 +520,11 @@ class Record(EventEmitter, object):
 
     def _clear_timeouts(self):
         if self._read_ack_timeout:
-            self._client.io_loop.remove_timeout(self._read_ack_timeout)
+            self._client.timeouts.remove_timeout(self._read_ack_timeout)
         if self._discard_timeout:
-            self._client.io_loop.remove_timeout(self._discard_timeout)
+            self._client.timeouts.remove_timeout(self._discard_timeout)
         if self._delete_ack_timeout:
-            self._client.io_loop.remove_timeout(self._delete_ack_timeout)
+            self._client.timeouts.remove_timeout(self._delete_ack_timeout)
 
     def _check_destroyed(self, method_name):
         if self._is_destroyed:
@@ -510,7 +543,9 @@ class Record(EventEmitter, object):
     def _destroy(self):
         self._clear_timeouts()
         self._emitter.remove_all_listeners()
-        self._resubscribe_notifier.destroy()
+        self._client.resubscriptions.remove(topic_constants.RECORD,
+                                            action_constants.CREATEORREAD,
+                                            self.name)
         self._is_destroyed = True
         self._is_ready = False
         self._client = None
@@ -641,11 +676,11 @@ class List(Record):
         super(List, self).unsubscribe(callback)
 
     def _apply_update(self, message):
-        if message['action'] == action_constants.PATCH:
+        if message.action == action_constants.PATCH:
             raise ValueError('PATCH is not supported for Lists')
 
-        if message['data'][2][0] != '[':
-            message['data'][2] = '[]'
+        if message.data[2][0] != '[':
+            message.data[2] = '[]'
 
         self._before_change()
         super(List, self)._apply_update(message)
@@ -740,6 +775,12 @@ class RecordHandler(EventEmitter, object):
                                                  action_constants.SNAPSHOT,
                                                  record_read_timeout)
 
+        client.on(event_constants.OUTBOUND_QUEUE_COMPACTED,
+                  self._on_queue_compacted)
+
+        self._routes = DispatchTable()
+        self.register_routes(self._routes)
+
     @gen.coroutine
     def get_record(self, name, record_options=None):
         """
@@ -895,16 +936,16 @@ class RecordHandler(EventEmitter, object):
         return future
 
     def _process_message(self, message, name):
-        action = message['action']
-        data = message['data']
+        action = message.action
+        data = message.data
         processed = False
 
         if (action == action_constants.READ and
                 self._snapshot_registry.has_request(name)):
             processed = True
-            self._snapshot_registry.receive(name,
-                                            None,
-                                            json.loads(data[2]))
+            snapshot = self._client.codec.loads(
+                message_parser.raw_field(message, 2))
+            self._snapshot_registry.receive(name, None, snapshot)
 
         if (action == action_constants.HAS and
                 self._has_registry.has_request(name)):
@@ -929,40 +970,54 @@ class RecordHandler(EventEmitter, object):
 
         return processed
 
+    def register_routes(self, routes):
+        """Registers the methods handling incoming record messages.
+
+        Args:
+            routes (DispatchTable): the table to register them with
+        """
+        record = topic_constants.RECORD
+        ack = action_constants.ACK
+        error = action_constants.ERROR
+
+        routes.register(record, error, self._on_record_error_message)
+        routes.register(record, error, self._on_record_message,
+                        event_constants.VERSION_EXISTS)
+        routes.register(record, ack, self._on_record_message)
+        for sub_action in (action_constants.DELETE,
+                           action_constants.UNSUBSCRIBE):
+            routes.register(record, ack, self._on_destroy_ack, sub_action)
+        for action in (ack, error):
+            for sub_action in (action_constants.SNAPSHOT,
+                               action_constants.HAS):
+                routes.register(record, action, self._on_snapshot_error,
+                                sub_action)
+        routes.register_fallback(record, self._on_record_message)
+
     def handle(self, message):
-        action = message['action']
-        data = message['data']
-
-        if (action == action_constants.ERROR and
-                data[0] not in (event_constants.VERSION_EXISTS,
-                                action_constants.SNAPSHOT,
-                                action_constants.HAS)):
-            message['processedError'] = True
-            self._client._on_error(topic_constants.RECORD,
-                                   message['data'][0], message['data'][1])
-            return
+        self._routes.dispatch(message_parser.as_message(message),
+                              topic_constants.RECORD)
 
-        if action in (action_constants.ACK, action_constants.ERROR):
-            name = data[1]
+    def _on_record_error_message(self, message):
+        message.processed_error = True
+        self._client._on_error(topic_constants.RECORD,
+                               message.data[0], message.data[1])
 
-            if data[0] in (action_constants.DELETE,
-                           action_constants.UNSUBSCRIBE):
-                name = message['data'][1]
-                self._destroy_emitter.emit('destroy_ack_' + name, message)
+    def _on_destroy_ack(self, message):
+        data = message.data
+        name = data[1]
+        self._destroy_emitter.emit('destroy_ack_' + name, message)
 
-                if (message['data'][0] == action_constants.DELETE and
-                        name in self._records):
-                    self._records[name]._on_message(message)
-                return
+        if data[0] == action_constants.DELETE and name in self._records:
+            self._records[name]._on_message(message)
 
-            if data[0] in (action_constants.SNAPSHOT, action_constants.HAS):
-                message['processedError'] = True
-                error = message['data'][2]
-                self._snapshot_registry.receive(name, error, None)
-                return
-        else:
-            name = message['data'][0]
+    def _on_snapshot_error(self, message):
+        message.processed_error = True
+        data = message.data
+        self._snapshot_registry.receive(data[1], data[2], None)
 
+    def _on_record_message(self, message):
+        name = message.name
         processed = False
 
         if name in self._records:
@@ -980,6 +1035,22 @@ class RecordHandler(EventEmitter, object):
         message = "No ACK message received in time for {}".format(record_name)
         self._client._on_error(topic_constants.RECORD, error, message)
 
+    def _on_queue_compacted(self, versions, unsubscribed):
+        for name, dropped_versions in versions.items():
+            record = self._records.get(name) or self._lists.get(name)
+            if record is not None:
+                record._on_writes_compacted(dropped_versions)
+
+        for topic, name in unsubscribed:
+            if topic == topic_constants.RECORD:
+                # The discard was dropped along with the read, so there won't
+                # be an ack for it
+                self._destroy_emitter.emit(
+                    'destroy_ack_' + name,
+                    message_parser.Message(
+                        topic_constants.RECORD, action_constants.ACK,
+                        [action_constants.UNSUBSCRIBE, name]))
+
     def _on_destroy_pending(self, record_name):
         on_message = self._records[record_name]._on_message
         self._destroy_emitter.once('destroy_ack_' + record_name, on_message)
@@ -0,0 +1,159 @@
+"""Restores a client's subscriptions after the connection was lost."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.constants import connection_state
+from deepstreampy.constants import event as event_constants
+from deepstreampy.message import message_builder
+
+from tornado.log import app_log
+
+from collections import OrderedDict
+from functools import partial
+
+
+class ResubscribeManager(object):
+    """Keeps track of everything the client is subscribed to.
+
+    Records, event subscriptions, RPC providers and listeners are added to a
+    table per topic and action while they're active. Once the connection is
+    open again after it was lost, the subscription messages in the tables are
+    sent again in batches of ``resubscribeBatchSize``, each written as a
+    single frame. The next batch is sent once the outbound queue has drained
+    and ``resubscribeInterval`` seconds have passed. The client emits
+    ``resubscribeProgress`` with the number of messages sent and the total
+    after every batch.
+
+    Things that can't be expressed as a single message can ``register`` a
+    callback instead, which is called as soon as the connection is open.
+    """
+
+    def __init__(self, client, connection, **options):
+        """
+        Args:
+            client: the client to emit progress on
+            connection: the connection or lanes to send the messages with
+            **options: the client options
+        """
+        self._client = client
+        self._connection = connection
+        self._batch_size = options.get('resubscribeBatchSize', 100)
+        self._interval = options.get('resubscribeInterval', 0)
+
+        self._tables = OrderedDict()
+        self._callbacks = []
+        self._is_reconnecting = False
+
+        self._pending = None
+        self._sent = 0
+        self._total = 0
+        self._next_batch = None
+        self._generation = 0
+
+        client.on(event_constants.CONNECTION_STATE_CHANGED,
+                  self._on_connection_state_changed)
+
+    def add(self, topic, action, name):
+        """Resubscribe ``name`` with ``action`` after every reconnect."""
+        key = (topic, action)
+        if key not in self._tables:
+            self._tables[key] = OrderedDict()
+        self._tables[key][name] = None
+
+    def remove(self, topic, action, name):
+        """Stop resubscribing ``name``, does nothing if it wasn't added."""
+        names = self._tables.get((topic, action))
+        if names is not None:
+            names.pop(name, None)
+
+    def register(self, callback):
+        """Call ``callback`` without arguments after every reconnect."""
+        self._callbacks.append(callback)
+
+    def unregister(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def __len__(self):
+        return sum(len(names) for names in self._tables.values())
+
+    @property
+    def progress(self):
+        """tuple: The messages sent and the total of the last resubscription,
+        equal once it's complete."""
+        return self._sent, self._total
+
+    @property
+    def is_resubscribing(self):
+        return self._pending is not None
+
+    def _on_connection_state_changed(self, state):
+        if state == connection_state.OPEN:
+            if self._is_reconnecting:
+                self._is_reconnecting = False
+                self._resubscribe()
+        elif state == connection_state.RECONNECTING:
+            self._is_reconnecting = True
+            self._cancel()
+
+    def _resubscribe(self):
+        self._cancel()
+
+        for callback in list(self._callbacks):
+            try:
+                callback()
+            except Exception:
+                app_log.error("Exception in resubscribe callback %r",
+                              callback, exc_info=True)
+
+        # Taken up front, so subscriptions made during the resubscription
+        # aren't sent twice
+        self._pending = [(topic, action, name)
+                         for (topic, action), names in self._tables.items()
+                         for name in names]
+        self._pending.reverse()
+        self._sent = 0
+        self._total = len(self._pending)
+        self._send_batch()
+
+    def _send_batch(self):
+        self._next_batch = None
+        pending = self._pending
+        if pending is None:
+            return
+
+        batch = []
+        while pending and len(batch) < self._batch_size:
+            topic, action, name = pending.pop()
+            # Skip what was unsubscribed in the meantime
+            if name in self._tables[(topic, action)]:
+                batch.append(message_builder.build(topic, action, [name]))
+            self._sent += 1
+
+        if batch:
+            self._connection.send(b''.join(batch), resubscribe=True)
+
+        self._client.emit(event_constants.RESUBSCRIBE_PROGRESS, self._sent,
+                          self._total)
+
+        if not pending:
+            self._pending = None
+            return
+
+        self._connection.drain().add_done_callback(
+            partial(self._on_drained, self._generation))
+
+    def _on_drained(self, generation, future):
+        # The connection may have been lost and regained since
+        if generation != self._generation:
+            return
+        self._next_batch = self._connection.io_loop.call_later(
+            self._interval, self._send_batch)
+
+    def _cancel(self):
+        self._pending = None
+        self._generation += 1
+        if self._next_batch is not None:
+            self._connection.io_loop.remove_timeout(self._next_batch)
+            self._next_batch = None
@@ -0,0 +1,72 @@
+"""Routing of incoming messages to the methods that handle them."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.constants import actions
+
+# Actions whose first data field names what they are about, like the action
+# an ack acknowledges or the kind of an error
+_SUB_ACTIONS = frozenset([actions.ACK, actions.ERROR])
+
+
+class DispatchTable(object):
+    """Maps ``(topic, action)``, and for acks and errors
+    ``(topic, action, sub_action)``, to a handler.
+
+    Handlers register their methods once, after that routing a message takes a
+    single lookup, or two for an ack or error without a route of its own
+    sub-action. Messages without any route go to the fallback of their topic.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._fallbacks = {}
+
+    def register(self, topic, action, handler, sub_action=None):
+        """Routes messages of ``topic`` and ``action`` to ``handler``.
+
+        Args:
+            topic (str): the topic of the messages
+            action (str): the action of the messages
+            handler (callable): called with every such message
+            sub_action (str): if given, only acks or errors with this first
+                data field are routed to ``handler``
+        """
+        if sub_action is None:
+            self._routes[(topic, action)] = handler
+        else:
+            self._routes[(topic, action, sub_action)] = handler
+
+    def register_fallback(self, topic, handler):
+        """Routes messages of ``topic`` without a route of their own to
+        ``handler``."""
+        self._fallbacks[topic] = handler
+
+    def route(self, topic, action, data):
+        """Returns the handler of a message, None if there is none."""
+        if action in _SUB_ACTIONS and data:
+            handler = self._routes.get((topic, action, data[0]))
+            if handler is not None:
+                return handler
+        handler = self._routes.get((topic, action))
+        if handler is None:
+            return self._fallbacks.get(topic)
+        return handler
+
+    def dispatch(self, message, topic=None):
+        """Hands a message to its handler.
+
+        Args:
+            message: the parsed message
+            topic (str): routes the message as if it had this topic
+
+        Returns:
+            bool: whether the message had a handler
+        """
+        handler = self.route(topic or message.topic, message.action,
+                             message.data)
+        if handler is None:
+            return False
+        handler(message)
+        return True
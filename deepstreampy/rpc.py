@@ -9,6 +9,7 @@ from deepstreampy.constants import event as event_constants
 from deepstreampy.message import message_builder
 from deepstreampy.message import message_parser
 from deepstreampy import utils
+from deepstreampy.routing import DispatchTable
 
 from tornado import concurrent
 from tornado import gen
@@ -23,14 +24,16 @@ class RPCResponse(object):
         auto_ack (bool): Specifies whether requests should be auto acknowledged
     """
 
-    def __init__(self, connection, name, correlation_id):
+    def __init__(self, connection, name, correlation_id, codec=None):
         """
         Args:
             connection (deepstreampy.client._Connection): The current connection
             name (str): The name of the RPC
             correlation_id (str): Correlation ID of the RPC
+            codec (Codec): Serializes the response data
         """
         self._connection = connection
+        self._codec = codec
         self._name = name
         self._correletaion_id = correlation_id
         self._is_acknowledged = False
@@ -82,13 +85,14 @@ class RPCResponse(object):
         """Complete the request by sending the response data to the server.
 
         Args:
-            data: JSON serializable data to send to the server.
+            data: JSON serializable data to send to the server, or an
+                ``EncodedPayload`` of it.
         """
         if self._is_complete:
             raise ValueError('RPC {0} already completed'.format(self._name))
         self.ack()
 
-        typed_data = message_builder.typed(data)
+        typed_data = message_builder.typed_part(data, self._codec)
         self._is_complete = True
 
         return self._connection.send_message(
@@ -130,20 +134,31 @@ class RPC(object):
         self._client = client
         self._connection = client._connection
 
-        self._ack_timeout = self._connection._io_loop.call_later(
+        self._ack_timeout = client.timeouts.call_later(
             options.get('rpcAckTimeout', 6),
             partial(self.error, event_constants.ACK_TIMEOUT))
 
-        self._response_timeout = self._connection._io_loop.call_later(
+        self._response_timeout = client.timeouts.call_later(
             options.get('rpcResponseTimeout', 6),
             partial(self.error, event_constants.RESPONSE_TIMEOUT))
 
     def ack(self):
-        self._connection._io_loop.remove_timeout(self._ack_timeout)
+        self._client.timeouts.remove_timeout(self._ack_timeout)
 
     def respond(self, data):
-        converted_data = message_parser.convert_typed(data, self._client)
-        self._future.set_result(converted_data)
+        """Completes the RPC with the response data.
+
+        Args:
+            data (TypedValue): the typed data of the response, only converted
+                if the caller still waits for it. None for a response without
+                data.
+        """
+        if not self._future.done():
+            if isinstance(data, message_parser.TypedValue):
+                data = data.value
+            elif data is not None:
+                data = message_parser.convert_typed(data, self._client)
+            self._future.set_result(data)
         self._complete()
 
     def error(self, error_msg):
@@ -151,8 +166,8 @@ class RPC(object):
         self._complete()
 
     def _complete(self):
-        self._connection._io_loop.remove_timeout(self._ack_timeout)
-        self._connection._io_loop.remove_timeout(self._response_timeout)
+        self._client.timeouts.remove_timeout(self._ack_timeout)
+        self._client.timeouts.remove_timeout(self._response_timeout)
 
 
 class RPCHandler(object):
@@ -168,8 +183,10 @@ class RPCHandler(object):
         subscription_timeout = options.get("subscriptionTimeout", 15)
         self._ack_timeout_registry = utils.AckTimeoutRegistry(
             client, topic_constants.RPC, subscription_timeout)
-        self._resubscribe_notifier = utils.ResubscribeNotifier(
-            client, self._reprovide)
+        client.on(event_constants.OUTBOUND_QUEUE_COMPACTED,
+                  self._on_queue_compacted)
+        self._routes = DispatchTable()
+        self.register_routes(self._routes)
 
     def provide(self, name, callback):
         if not name:
@@ -183,6 +200,8 @@ class RPCHandler(object):
 
         self._ack_timeout_registry.add(name, actions.SUBSCRIBE)
         self._providers[name] = callback
+        self._client.resubscriptions.add(topic_constants.RPC,
+                                         actions.SUBSCRIBE, name)
 
         return self._connection.send_message(topic_constants.RPC,
                                              actions.SUBSCRIBE,
@@ -194,6 +213,8 @@ class RPCHandler(object):
 
         if name in self._providers:
             del self._providers[name]
+            self._client.resubscriptions.remove(topic_constants.RPC,
+                                                actions.SUBSCRIBE, name)
             self._ack_timeout_registry.add(name, actions.UNSUBSCRIBE)
             future = self._connection.send_message(topic_constants.RPC,
                                                    actions.UNSUBSCRIBE,
@@ -209,7 +230,7 @@ class RPCHandler(object):
         f = concurrent.Future()
 
         uid = utils.get_uid()
-        typed_data = message_builder.typed(data)
+        typed_data = message_builder.typed_part(data, self._client.codec)
 
         self._rpcs[uid] = RPC(f, self._client, **self._options)
 
@@ -230,69 +251,90 @@ class RPCHandler(object):
         return rpc
 
     def _respond_to_rpc(self, message):
-        name = message['data'][0]
-        correlation_id = message['data'][1]
-
-        if message['data'][2]:
-            data = message_parser.convert_typed(message['data'][2],
-                                                self._client)
+        name = message.data[0]
+        correlation_id = message.data[1]
 
         if name in self._providers:
-            response = RPCResponse(self._connection, name, correlation_id)
+            # Requests nobody provides are rejected without converting them
+            data = None
+            if message.data[2]:
+                data = message_parser.convert_typed(message.data[2],
+                                                    self._client)
+            response = RPCResponse(self._connection, name, correlation_id,
+                                   self._client.codec)
             self._providers[name](data, response)
         else:
             self._connection.send_message(topic_constants.RPC,
                                           actions.REJECTION,
                                           [name, correlation_id])
 
-    def handle(self, message):
-        action = message['action']
-        data = message['data']
-        if action == actions.REQUEST:
-            self._respond_to_rpc(message)
-            return
+    def register_routes(self, routes):
+        """Registers the methods handling incoming RPC messages.
 
-        if (action == actions.ACK and
-                (data[0] in (actions.SUBSCRIBE, actions.UNSUBSCRIBE))):
-            self._ack_timeout_registry.clear(message)
-            return
+        Args:
+            routes (DispatchTable): the table to register them with
+        """
+        rpc = topic_constants.RPC
+        routes.register(rpc, actions.REQUEST, self._respond_to_rpc)
+        routes.register(rpc, actions.RESPONSE, self._on_response)
+        routes.register(rpc, actions.ACK, self._on_rpc_ack)
+        for action in (actions.SUBSCRIBE, actions.UNSUBSCRIBE):
+            routes.register(rpc, actions.ACK, self._ack_timeout_registry.clear,
+                            action)
+        routes.register(rpc, actions.ERROR, self._on_rpc_error)
+        routes.register(rpc, actions.ERROR, self._on_message_denied,
+                        event_constants.MESSAGE_DENIED)
+        routes.register(rpc, actions.ERROR, _ignore,
+                        event_constants.MESSAGE_PERMISSION_ERROR)
+        routes.register_fallback(rpc, self._on_unknown_action)
 
-        if action == actions.ERROR:
-            if data[0] == event_constants.MESSAGE_PERMISSION_ERROR:
-                return
-
-            if (data[0] == event_constants.MESSAGE_DENIED and
-                    data[2] == actions.SUBSCRIBE):
-                self._ack_timeout_registry.remove(data[1], actions.SUBSCRIBE)
-                return
-
-        if action in (actions.ERROR, actions.ACK):
-            if (data[0] == event_constants.MESSAGE_DENIED and
-                    data[2] == actions.REQUEST):
-                correlation_id = data[3]
-            else:
-                correlation_id = data[2]
-            rpc_name = data[1]
+    def handle(self, message):
+        self._routes.dispatch(message_parser.as_message(message),
+                              topic_constants.RPC)
+
+    def _on_response(self, message):
+        data = message.data
+        rpc = self._get_rpc(data[1], data[0], message.raw)
+        if rpc is not None:
+            rpc.respond(message.typed(2, self._client))
+            del self._rpcs[data[1]]
+
+    def _on_rpc_ack(self, message):
+        data = message.data
+        rpc = self._get_rpc(data[2], data[1], message.raw)
+        if rpc is not None:
+            rpc.ack()
+
+    def _on_message_denied(self, message):
+        data = message.data
+        if data[2] == actions.SUBSCRIBE:
+            self._ack_timeout_registry.remove(data[1], actions.SUBSCRIBE)
+        elif data[2] == actions.REQUEST:
+            self._fail_rpc(data[3], message)
         else:
-            rpc_name = data[0]
-            correlation_id = data[1]
+            self._fail_rpc(data[2], message)
 
-        rpc = self._get_rpc(correlation_id, rpc_name, message.get('raw', ''))
-        if rpc is None:
-            return
+    def _on_rpc_error(self, message):
+        self._fail_rpc(message.data[2], message)
 
-        if action == actions.ACK:
-            rpc.ack()
-        elif action == actions.RESPONSE:
-            rpc.respond(data[2])
-            del self._rpcs[correlation_id]
-        elif action == actions.ERROR:
-            message['processedError'] = True
+    def _fail_rpc(self, correlation_id, message):
+        data = message.data
+        rpc = self._get_rpc(correlation_id, data[1], message.raw)
+        if rpc is not None:
+            message.processed_error = True
             rpc.error(data[0])
             del self._rpcs[correlation_id]
 
-    def _reprovide(self):
-        for rpc_name in self._providers:
-            self._connection.send_message(topic_constants.RPC,
-                                          actions.SUBSCRIBE,
-                                          [rpc_name])
+    def _on_unknown_action(self, message):
+        data = message.data
+        self._get_rpc(data[1], data[0], message.raw)
+
+    def _on_queue_compacted(self, versions, unsubscribed):
+        for topic, name in unsubscribed:
+            if topic == topic_constants.RPC:
+                self._ack_timeout_registry.remove(name, actions.SUBSCRIBE)
+                self._ack_timeout_registry.remove(name, actions.UNSUBSCRIBE)
+
+
+def _ignore(message):
+    pass
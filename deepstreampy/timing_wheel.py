@@ -0,0 +1,195 @@
+"""Deadline scheduling for the many timeouts a client keeps track of."""
+
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from tornado.log import app_log
+
+import math
+
+
+class Timeout(object):
+    """A pending callback of a ``TimingWheel``."""
+
+    __slots__ = ('expiration', 'callback', 'bucket')
+
+    def __init__(self, expiration, callback):
+        self.expiration = expiration
+        self.callback = callback
+        self.bucket = None
+
+    def cancel(self):
+        self.callback = None
+        if self.bucket is not None:
+            del self.bucket[self]
+            self.bucket = None
+            return True
+        return False
+
+
+class _Level(object):
+
+    __slots__ = ('tick', 'interval', 'buckets')
+
+    def __init__(self, tick, size):
+        self.tick = tick
+        self.interval = tick * size
+        self.buckets = [{} for _ in range(size)]
+
+
+class TimingWheel(object):
+    """A hierarchical timing wheel.
+
+    Timeouts are kept in buckets of ``resolution`` seconds on the first level
+    of the wheel, and in coarser buckets on the levels above it. A timeout is
+    added to or removed from its bucket in constant time, and moves down a
+    level whenever the bucket it's in comes due. The wheel only wakes the
+    IOLoop when a bucket is due and fires everything in it at once, so
+    thousands of timeouts cost a handful of IOLoop timeouts rather than one
+    each.
+
+    Has the ``call_later`` and ``remove_timeout`` methods of an IOLoop. A
+    timeout fires no earlier than its delay and at most ``resolution`` seconds
+    after it.
+    """
+
+    def __init__(self, client, resolution=0.01, size=256, level_size=64):
+        """
+        Args:
+            client: the client whose IOLoop wakes the wheel up
+            resolution (float): seconds per bucket on the first level
+            size (int): number of buckets on the first level
+            level_size (int): number of buckets on the levels above
+        """
+        self._client = client
+        self._resolution = resolution
+        self._level_size = level_size
+        self._levels = [_Level(1, size)]
+        self._current = None
+        self._count = 0
+        self._wakeup = None
+        self._wakeup_tick = None
+
+    def call_later(self, delay, callback):
+        """Runs ``callback`` after ``delay`` seconds.
+
+        Returns:
+            Timeout: a handle that can be passed to ``remove_timeout``
+        """
+        now = self._client.io_loop.time()
+        if self._count == 0:
+            self._current = int(now / self._resolution)
+
+        expiration = max(int(math.ceil((now + delay) / self._resolution)),
+                         self._current + 1)
+        timeout = Timeout(expiration, callback)
+        self._add(timeout)
+        self._count += 1
+
+        if self._wakeup_tick is None or expiration < self._wakeup_tick:
+            self._schedule(expiration)
+
+        return timeout
+
+    def remove_timeout(self, timeout):
+        """Cancels a timeout returned by ``call_later``.
+
+        Does nothing if the timeout is None, already fired or cancelled.
+        """
+        if timeout is not None and timeout.cancel():
+            self._count -= 1
+
+    def __len__(self):
+        return self._count
+
+    def _add(self, timeout, due=None):
+        expiration = timeout.expiration
+        if expiration <= self._current:
+            due.append(timeout)
+            return
+
+        for level in self._levels:
+            current = self._current - self._current % level.tick
+            if expiration < current + level.interval:
+                bucket = level.buckets[(expiration // level.tick) %
+                                       len(level.buckets)]
+                bucket[timeout] = None
+                timeout.bucket = bucket
+                return
+
+        self._levels.append(_Level(self._levels[-1].interval,
+                                   self._level_size))
+        self._add(timeout, due)
+
+    def _next_tick(self):
+        """Return the next tick at which a bucket is due, or None."""
+        next_tick = None
+        for level in self._levels:
+            size = len(level.buckets)
+            slot = self._current // level.tick
+            for offset in range(1, size):
+                if level.buckets[(slot + offset) % size]:
+                    tick = (slot + offset) * level.tick
+                    if next_tick is None or tick < next_tick:
+                        next_tick = tick
+                    break
+        return next_tick
+
+    def _schedule(self, tick):
+        io_loop = self._client.io_loop
+        if self._wakeup is not None:
+            io_loop.remove_timeout(self._wakeup)
+            self._wakeup = None
+        self._wakeup_tick = tick
+        if tick is not None:
+            delay = max(tick * self._resolution - io_loop.time(), 0)
+            self._wakeup = io_loop.call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        # The clock can read a hair short of the tick it woke up for, like
+        # 10205.06 / 0.01 == 1020505.99..., which must still count as due
+        now = max(int(self._client.io_loop.time() / self._resolution),
+                  self._wakeup_tick)
+        self._wakeup_tick = None
+
+        next_tick = self._next_tick()
+        while next_tick is not None and next_tick <= now:
+            self._expire(next_tick)
+            next_tick = self._next_tick()
+
+        if self._count:
+            self._current = max(self._current, now)
+        self._schedule(self._next_tick() if self._count else None)
+
+    def _expire(self, tick):
+        self._current = tick
+        due = []
+        for level in reversed(self._levels):
+            if tick % level.tick:
+                continue
+            bucket = level.buckets[(tick // level.tick) % len(level.buckets)]
+            if not bucket:
+                continue
+            timeouts = list(bucket)
+            bucket.clear()
+            for timeout in timeouts:
+                timeout.bucket = None
+                if level.tick == 1:
+                    due.append(timeout)
+                else:
+                    self._add(timeout, due)
+
+        for timeout in due:
+            callback = timeout.callback
+            self._count -= 1
+            if callback is None:
+                # Cancelled by an earlier callback after it left its bucket,
+                # which ``remove_timeout`` didn't count
+                continue
+            timeout.callback = None
+            try:
+                callback()
+            except Exception:
+                app_log.error("Exception in timeout callback %r", callback,
+                              exc_info=True)
@@ -3,7 +3,6 @@ from __future__ import unicode_literals
 
 from deepstreampy.constants import actions as action_constants
 from deepstreampy.constants import event as event_constants
-from deepstreampy.constants import connection_state
 
 from pyee import EventEmitter
 from tornado import concurrent
@@ -45,7 +44,7 @@ class SingleNotifier(object):
             future = concurrent.Future()
             future.set_result()
 
-        response_timeout = self._client.io_loop.call_later(
+        response_timeout = self._client.timeouts.call_later(
             self._timeout_duration, partial(self._on_response_timeout, name))
         self._requests[name].append({
             'timeout': response_timeout,
@@ -57,7 +56,7 @@ class SingleNotifier(object):
     def receive(self, name, error, data):
         entries = self._requests[name]
         for entry in entries:
-            self._client.io_loop.remove_timeout(entry['timeout'])
+            self._client.timeouts.remove_timeout(entry['timeout'])
             entry['callback'](error, data)
         del self._requests[name]
 
@@ -68,9 +67,8 @@ class SingleNotifier(object):
                                msg)
 
     def _resend_requests(self):
-        for request in self._requests:
-            self._connection.send_message(self._topic, self._action,
-                                          [self._requests[request]])
+        for name in self._requests:
+            self._connection.send_message(self._topic, self._action, [name])
 
 
 CallbackResponse = namedtuple('CallbackResponse', 'accept reject')
@@ -88,10 +86,10 @@ class Listener(object):
         self._send_future = None
 
         subscription_timeout = options.get("subscriptionTimeout", 15)
-        self._ack_timeout = connection._io_loop.call_later(
+        self._ack_timeout = client.timeouts.call_later(
             subscription_timeout, self._on_ack_timeout)
-        self._resubscribe_notifier = ResubscribeNotifier(
-            client, self._send_listen)
+        client.resubscriptions.add(listener_type, action_constants.LISTEN,
+                                   pattern)
         self._send_listen()
         self._destroy_pending = False
 
@@ -99,7 +97,9 @@ class Listener(object):
         self._destroy_pending = True
         future = self._connection.send_message(
             self._type, action_constants.UNLISTEN, [self._pattern])
-        self._resubscribe_notifier.destroy()
+        self._client.resubscriptions.remove(self._type,
+                                            action_constants.LISTEN,
+                                            self._pattern)
         return future
 
     def destroy(self):
@@ -118,14 +118,14 @@ class Listener(object):
 
     def _create_callback_response(self, message):
         return CallbackResponse(
-            accept=partial(self.accept, message['data'][1]),
-            reject=partial(self.reject, message['data'][1]))
+            accept=partial(self.accept, message.data[1]),
+            reject=partial(self.reject, message.data[1]))
 
     def _on_message(self, message):
-        action = message['action']
-        data = message['data']
+        action = message.action
+        data = message.data
         if action == action_constants.ACK:
-            self._connection._io_loop.remove_timeout(self._ack_timeout)
+            self._client.timeouts.remove_timeout(self._ack_timeout)
         elif action == action_constants.SUBSCRIPTION_FOR_PATTERN_FOUND:
             # TODO: Show deprecated message
             self._callback(data[1], True,
@@ -133,9 +133,9 @@ class Listener(object):
         elif action == action_constants.SUBSCRIPTION_FOR_PATTERN_REMOVED:
             self._callback(data[1], False)
         else:
-            is_found = (message['action'] ==
+            is_found = (message.action ==
                         action_constants.SUBSCRIPTION_FOR_PATTERN_FOUND)
-            self._callback(message['data'][1], is_found)
+            self._callback(message.data[1], is_found)
 
     def _send_listen(self):
         self._send_future = self._connection.send_message(
@@ -157,13 +157,12 @@ class Listener(object):
 
 class ResubscribeNotifier(object):
     """
-    Makes sure that all functionality is resubscribed on reconnect. Subscription
-    is called when the connection drops - which seems counterintuitive, but in
-    fact just means that the re-subscription message will be added to the queue
-    of messages that need re-sending as soon as the connection is
-    re-established.
+    Makes sure that all functionality is resubscribed on reconnect.
 
-    Resubscribe logic should only occur once per connection loss.
+    Registers the callback with the client's ``ResubscribeManager``, which
+    calls it once per connection loss as soon as the connection is
+    re-established. Plain subscriptions should be added to the manager's
+    tables instead, so they are resent in batches.
     """
 
     def __init__(self, client, resubscribe):
@@ -174,23 +173,12 @@ class ResubscribeNotifier(object):
         """
         self._client = client
         self._resubscribe = resubscribe
-
-        self._is_reconnecting = False
-        self._client.on(event_constants.CONNECTION_STATE_CHANGED,
-                        self._handle_connection_state_changes)
+        self._client.resubscriptions.register(self._resubscribe)
 
     def destroy(self):
-        self._client.remove_listener(event_constants.CONNECTION_STATE_CHANGED,
-                                     self._handle_connection_state_changes)
+        self._client.resubscriptions.unregister(self._resubscribe)
         self._client = None
 
-    def _handle_connection_state_changes(self, state):
-        if state == connection_state.RECONNECTING and not self._is_reconnecting:
-            self._is_reconnecting = True
-        elif state == connection_state.OPEN and self._is_reconnecting:
-            self._is_reconnecting = False
-            self._resubscribe()
-
 
 class AckTimeoutRegistry(EventEmitter):
     def __init__(self, client, topic, timeout_duration):
@@ -204,27 +192,28 @@ class AckTimeoutRegistry(EventEmitter):
         unique_name = (action or "") + name
 
         self.remove(unique_name, action)
-        timeout = self._client.io_loop.call_later(self._timeout_duration,
-                                                  partial(
-                                                      self._on_timeout,
-                                                      unique_name, name))
+        timeout = self._client.timeouts.call_later(self._timeout_duration,
+                                                   partial(
+                                                       self._on_timeout,
+                                                       unique_name, name))
         self._register[unique_name] = timeout
 
     def remove(self, name, action=None):
         unique_name = (action or "") + name
         if unique_name in self._register:
-            self.clear({'data': [action, name]})
+            self._clear(unique_name, '')
 
     def clear(self, message):
-        unique_name = "".join(message['data'][:2])
+        self._clear("".join(message.data[:2]), message.raw)
 
+    def _clear(self, unique_name, raw_message):
         if unique_name in self._register:
             timeout = self._register[unique_name]
-            self._client.io_loop.remove_timeout(timeout)
+            self._client.timeouts.remove_timeout(timeout)
         else:
             self._client._on_error(self._topic,
                                    event_constants.UNSOLICITED_MESSAGE,
-                                   message.get('raw', ''))
+                                   raw_message)
 
     def _on_timeout(self, unique_name, name):
         del self._register[unique_name]
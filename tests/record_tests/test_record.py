@@ -58,6 +58,34 @@ class RecordTest(testing.AsyncTestCase):
                     .format(chr(31), chr(30)).encode())
         self.handler.write_message.assert_called_with(expected)
 
+    def test_send_prepared_data(self):
+        payload = self.client.prepare({'firstname': 'John'})
+        self.record.set(payload)
+        expected = ("R{0}U{0}testRecord{0}1{0}{{\"firstname\":\"John\"}}{1}"
+                    .format(chr(31), chr(30)).encode())
+        self.handler.write_message.assert_called_with(expected)
+        self.assertEqual(self.record.get(), {'firstname': 'John'})
+
+        self.record.set(self.client.prepare('Smith'), 'lastname')
+        expected = ("R{0}P{0}testRecord{0}2{0}lastname{0}SSmith{1}"
+                    .format(chr(31), chr(30)).encode())
+        self.handler.write_message.assert_called_with(expected)
+        self.assertEqual(self.record.get('lastname'), 'Smith')
+
+    def test_updates_are_canonical(self):
+        self.record.set(
+            self.client.prepare({'lastname': 'Smith', 'firstname': 'John'}))
+        expected = ('R{0}U{0}testRecord{0}1{0}'
+                    '{{"firstname":"John","lastname":"Smith"}}{1}'
+                    .format(chr(31), chr(30)).encode())
+        self.handler.write_message.assert_called_with(expected)
+
+        self.record.set({'lastname': 'Doe', 'firstname': 'Jane'})
+        expected = ('R{0}U{0}testRecord{0}2{0}'
+                    '{{"firstname":"Jane","lastname":"Doe"}}{1}'
+                    .format(chr(31), chr(30)).encode())
+        self.handler.write_message.assert_called_with(expected)
+
     def test_delete_value(self):
         self.record.set({'firstname': 'John', 'lastname': 'Smith'})
         self.record.set(Undefined, 'lastname')
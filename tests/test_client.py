@@ -5,10 +5,14 @@ respective callbacks are made, and events triggered.
 from __future__ import absolute_import, division, print_function, with_statement
 from __future__ import unicode_literals
 
-from deepstreampy.message import connection
+from deepstreampy.message import (connection, endpoints, message_parser,
+                                  scheduler)
+from deepstreampy import client
 from deepstreampy import constants
+from deepstreampy.constants import overflow_policy, priority
+from tests.util import msg
 
-from tornado import testing
+from tornado import testing, concurrent, gen
 import unittest
 
 import sys
@@ -137,6 +141,15 @@ class ConnectionTest(unittest.TestCase):
                       .format(chr(31), chr(30)))
         self.assertTrue(conn._too_many_auth_attempts)
 
+    def test_dispatches_every_message(self):
+        conn = connection.Connection(self.client, URL)
+        conn._on_data('E{0}EVT{0}a{1}E{0}EVT{0}'.format(chr(31), chr(30)))
+        conn._on_data('b{0}N1{1}'.format(chr(31), chr(30)))
+        self.assertEqual(
+            [call_args[0][0]['data']
+             for call_args in self.client._on_message.call_args_list],
+            [['a'], ['b', 'N1']])
+
 
 class TestHeartbeat(testing.AsyncTestCase):
 
@@ -187,5 +200,591 @@ class TestHeartbeat(testing.AsyncTestCase):
                          constants.connection_state.ERROR)
 
 
+class LatencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.client = mock.Mock()
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=False)
+        self._connection(heartbeatInterval=30)
+
+    def test_round_trips(self):
+        self.assertEqual(self.conn.round_trip_time, (None, None, 0))
+        self.conn.send_message('E', 'S', ['event1'])
+        self.conn.send_message('R', 'CR', ['record1'])
+        self.now += 0.2
+        self.conn._on_data(msg('E|A|S|event1+R|A|S|record1+'))
+        rtt = self.conn.round_trip_time
+        self.assertAlmostEqual(rtt.smoothed, 0.2)
+        self.assertEqual(rtt.samples, 2)
+
+        # Unsolicited acks aren't samples
+        self.conn._on_data(msg('E|A|S|event1+'))
+        self.assertEqual(self.conn.round_trip_time.samples, 2)
+
+    def _measure_round_trips(self, count, rtt):
+        for _ in range(count):
+            self.conn.send_message('E', 'S', ['event1'])
+            self.now += rtt
+            self.conn._on_data(msg('E|A|S|event1+'))
+
+    def test_dead_peer_timeout(self):
+        self.assertEqual(self.conn.dead_peer_timeout, 60)
+
+        for _ in range(3):
+            self.conn._on_data(msg('C|PI+'))
+            self.now += 10
+        self.assertEqual(self.conn.dead_peer_timeout, 40)
+
+        # Fast round trips shorten the grace down to five seconds
+        self._measure_round_trips(8, 0.1)
+        self.assertEqual(self.conn.dead_peer_timeout, 15)
+
+    def test_dead_peer_timeout_defaults(self):
+        self._connection()
+        self.assertEqual(self.conn.dead_peer_timeout, 200)
+        self._measure_round_trips(7, 0.1)
+        self.assertEqual(self.conn.dead_peer_timeout, 200)
+        self._measure_round_trips(1, 0.1)
+        self.assertEqual(self.conn.dead_peer_timeout, 105)
+
+    def test_dead_peer_min_timeout(self):
+        self._connection(heartbeatInterval=30, deadPeerMinTimeout=1)
+
+        # Without samples the grace is the heartbeat interval
+        self.assertEqual(self.conn.dead_peer_timeout, 60)
+
+        # Too few samples to go by
+        self._measure_round_trips(7, 0.1)
+        self.assertEqual(self.conn.dead_peer_timeout, 60)
+
+        self._measure_round_trips(1, 0.1)
+        self.assertEqual(self.conn.dead_peer_timeout, 31)
+
+    def _connection(self, **options):
+        self.conn = connection.Connection(self.client, URL, **options)
+        self.conn._io_loop = mock.Mock()
+        self.conn._io_loop.time = mock.Mock(side_effect=lambda: self.now)
+        self.conn._websocket_handler = self.handler
+        self.conn._state = constants.connection_state.OPEN
+
+
+class EndpointsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.client = mock.Mock()
+        self.urls = ["ws://a:6020/deepstream", "ws://b:6020/deepstream"]
+        self.conn = connection.Connection(self.client, self.urls)
+        self.conn._io_loop = mock.Mock()
+        self.conn._io_loop.time = mock.Mock(side_effect=lambda: self.now)
+        self.conn._transport = mock.Mock()
+
+    def _probes(self):
+        self.conn._try_open()
+        return dict((call_args[0][0], call_args[0][1:3]) for call_args in
+                    self.conn._transport.connect.call_args_list)
+
+    def _opened(self, handler):
+        future = concurrent.Future()
+        future.set_result(handler)
+        return future
+
+    def _failed(self):
+        future = concurrent.Future()
+        future.set_exception(IOError(errno.ECONNREFUSED, 'refused'))
+        return future
+
+    def test_endpoint_order(self):
+        endpoint_set = endpoints.EndpointSet(['a', 'b', 'c'])
+        self.assertEqual(endpoint_set.best, 'a')
+        endpoint_set.add_sample('b', 0.2)
+        endpoint_set.add_sample('c', 0.1)
+        self.assertEqual(endpoint_set.ordered(), ['c', 'b', 'a'])
+        endpoint_set.add_failure('c')
+        self.assertEqual(endpoint_set.ordered(), ['b', 'a', 'c'])
+        endpoint_set.add_sample('c', 0.1)
+        self.assertEqual(endpoint_set.best, 'c')
+        self.assertRaises(ValueError, endpoints.EndpointSet, [])
+
+    def test_jitter(self):
+        backoff = endpoints.DecorrelatedJitter(1, 5)
+        delay = backoff.next_delay()
+        self.assertTrue(0 <= delay <= 1)
+        for _ in range(20):
+            delay = backoff.next_delay()
+            self.assertTrue(1 <= delay <= 5)
+        backoff.reset()
+        self.assertTrue(0 <= backoff.next_delay() <= 1)
+
+    def test_fastest_probe_wins(self):
+        probes = self._probes()
+        self.assertEqual(sorted(probes), self.urls)
+
+        winner, loser = mock.Mock(), mock.Mock()
+        on_open, on_message = probes[self.urls[1]]
+        on_message(msg('C|CH+'))
+        self.now += 0.1
+        on_open(self._opened(winner))
+        self.assertEqual(self.conn._url, self.urls[1])
+        self.assertIs(self.conn._websocket_handler, winner)
+        self.assertEqual(self.conn.state,
+                         constants.connection_state.CHALLENGING)
+
+        self.now += 0.2
+        probes[self.urls[0]][0](self._opened(loser))
+        loser.close.assert_called_once_with()
+        self.assertIs(self.conn._websocket_handler, winner)
+
+        self.assertEqual(self.conn._endpoints.ordered(),
+                         [self.urls[1], self.urls[0]])
+
+    def test_all_probes_fail(self):
+        probes = self._probes()
+        probes[self.urls[0]][0](self._failed())
+        self.assertEqual(self.conn.state, constants.connection_state.CLOSED)
+        probes[self.urls[1]][0](self._failed())
+        self.assertEqual(self.conn.state,
+                         constants.connection_state.RECONNECTING)
+
+    def test_late_failure_ignored(self):
+        probes = self._probes()
+        probes[self.urls[0]][0](self._opened(mock.Mock()))
+        probes[self.urls[1]][0](self._failed())
+        self.assertEqual(self.conn.state,
+                         constants.connection_state.AWAITING_CONNECTION)
+        self.assertEqual(self.conn._endpoints.ordered(), self.urls)
+
+
+def _done_future(result=None):
+    future = concurrent.Future()
+    future.set_result(result)
+    return future
+
+
+class TestBatching(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestBatching, self).setUp()
+        self.connection = connection.Connection(
+            mock.Mock(), URL, batchMessages=True, maxMessagesPerPacket=3)
+        self.connection._io_loop = self.io_loop
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=False)
+        self.handler.write_message = mock.Mock(
+            side_effect=lambda message: _done_future())
+        self.connection._websocket_handler = self.handler
+        self.connection._state = constants.connection_state.OPEN
+
+    @testing.gen_test
+    def test_same_tick(self):
+        first = self.connection.send_message('E', 'EVT', ['a', 'N1'])
+        second = self.connection.send_message('E', 'EVT', ['b', 'N2'])
+        self.handler.write_message.assert_not_called()
+        yield [first, second]
+        self.handler.write_message.assert_called_once_with(
+            'E{0}EVT{0}a{0}N1{1}E{0}EVT{0}b{0}N2{1}'.format(
+                chr(31), chr(30)).encode())
+
+    @testing.gen_test
+    def test_max_messages(self):
+        futures = [self.connection.send_message('E', 'EVT', [str(i)])
+                   for i in range(4)]
+        self.assertEqual(self.handler.write_message.call_count, 1)
+        yield futures
+        self.assertEqual(self.handler.write_message.call_count, 2)
+
+
+class TestBackpressure(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestBackpressure, self).setUp()
+        self.client = mock.Mock()
+        self.write_futures = []
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=False)
+        self.handler.write_message = mock.Mock(
+            side_effect=self._write_message)
+
+    def _write_message(self, message):
+        future = concurrent.Future()
+        self.write_futures.append(future)
+        return future
+
+    def _connection(self, policy):
+        conn = connection.Connection(self.client, URL,
+                                     outboundHighWaterMessages=2,
+                                     outboundOverflowPolicy=policy)
+        conn._websocket_handler = self.handler
+        conn._state = constants.connection_state.OPEN
+        return conn
+
+    @testing.gen_test
+    def test_block(self):
+        conn = self._connection(overflow_policy.BLOCK)
+        conn.send_message('E', 'EVT', ['a'])
+        conn.send_message('E', 'EVT', ['b'])
+        blocked = conn.send_message('E', 'EVT', ['c'])
+        drained = conn.drain()
+        self.assertEqual(self.handler.write_message.call_count, 2)
+        self.assertEqual(conn.outbound_queue_depth.messages, 3)
+        self.assertFalse(blocked.done())
+
+        self.write_futures[0].set_result(None)
+        yield gen.moment
+        self.assertEqual(self.handler.write_message.call_count, 3)
+        self.assertFalse(drained.done())
+        self.write_futures[1].set_result(None)
+        yield drained
+        self.write_futures[2].set_result(None)
+        yield blocked
+        self.assertEqual(conn.outbound_queue_depth, (0, 0))
+
+    def test_drop(self):
+        self.handler.stream.closed.return_value = True
+        conn = self._connection(overflow_policy.DROP_OLDEST)
+        oldest = conn.send_message('E', 'EVT', ['a'])
+        conn.send_message('E', 'EVT', ['b'])
+        conn.send_message('E', 'EVT', ['c'])
+        self.assertFalse(oldest.result())
+        self.assertEqual([message for message, _ in conn._queued_messages],
+                         [msg('E|EVT|b+'), msg('E|EVT|c+')])
+
+        conn = self._connection(overflow_policy.DROP_NEWEST)
+        conn.send_message('E', 'EVT', ['a'])
+        conn.send_message('E', 'EVT', ['b'])
+        self.assertFalse(conn.send_message('E', 'EVT', ['c']).result())
+        self.assertEqual(len(conn._queued_messages), 2)
+
+    def test_raise(self):
+        conn = self._connection(overflow_policy.RAISE)
+        conn.send_message('E', 'EVT', ['a'])
+        conn.send_message('E', 'EVT', ['b'])
+        self.assertRaises(connection.OutboundQueueFull, conn.send_message,
+                          'E', 'EVT', ['c'])
+
+    def test_ping_while_full(self):
+        for policy in (overflow_policy.BLOCK, overflow_policy.DROP_OLDEST,
+                       overflow_policy.DROP_NEWEST, overflow_policy.RAISE):
+            self.handler.write_message.reset_mock()
+            conn = self._connection(policy)
+            conn.send_message('E', 'EVT', ['a'])
+            conn.send_message('E', 'EVT', ['b'])
+            conn._on_data(msg('C|PI+'))
+            self.handler.write_message.assert_called_with(msg('C|PO+'))
+            self.assertEqual(conn.outbound_queue_depth.messages, 3)
+
+    def test_drop_oldest_keeps_acks(self):
+        self.handler.stream.closed.return_value = True
+        conn = self._connection(overflow_policy.DROP_OLDEST)
+        conn.send_message('E', 'A', ['S', 'a'])
+        conn.send_message('P', 'A', ['S', 'b'])
+        self.assertFalse(conn.send_message('E', 'EVT', ['c']).result())
+        self.assertEqual([message for message, _ in conn._queued_messages],
+                         [msg('E|A|S|a+'), msg('P|A|S|b+')])
+
+
+class PriorityTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(PriorityTest, self).setUp()
+        self.write_futures = []
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=False)
+        self.handler.write_message = mock.Mock(
+            side_effect=self._write_message)
+        self.conn = connection.Connection(mock.Mock(), URL,
+                                          bulkInFlightBytes=20)
+        self.conn._websocket_handler = self.handler
+        self.conn._state = constants.connection_state.OPEN
+
+    def _write_message(self, message):
+        future = concurrent.Future()
+        self.write_futures.append(future)
+        return future
+
+    def _written(self):
+        return [call_args[0][0]
+                for call_args in self.handler.write_message.call_args_list]
+
+    def test_priority_of(self):
+        self.assertEqual(scheduler.priority_of(msg('C|PO+')),
+                         priority.CONTROL)
+        self.assertEqual(scheduler.priority_of(msg('A|REQ|{}+')),
+                         priority.CONTROL)
+        self.assertEqual(scheduler.priority_of(msg('P|A|REQ|rpc|1+')),
+                         priority.ACK)
+        self.assertEqual(scheduler.priority_of(msg('R|U|rec|1|{}+')),
+                         priority.BULK)
+        self.assertEqual(scheduler.priority_of(msg('R|CR|rec+')),
+                         priority.INTERACTIVE)
+        self.assertEqual(scheduler.priority_of(msg('R|D|rec+')),
+                         priority.INTERACTIVE)
+        self.assertEqual(scheduler.priority_of(msg('E|EVT|event|Sa+')),
+                         priority.INTERACTIVE)
+
+    def test_queue_order(self):
+        queue = scheduler.OutboundQueue(
+            (raw, None) for raw in (msg('R|U|rec|1|{}+'), msg('E|S|a+'),
+                                    msg('R|U|rec|2|{}+'), msg('P|A|S|b+')))
+        self.assertEqual(queue.next_priority(), priority.ACK)
+        self.assertEqual([raw for raw, _ in queue],
+                         [msg('P|A|S|b+'), msg('E|S|a+'),
+                          msg('R|U|rec|1|{}+'), msg('R|U|rec|2|{}+')])
+        self.assertFalse(queue.blocks(priority.CONTROL))
+        self.assertTrue(queue.blocks(priority.INTERACTIVE))
+        self.assertEqual(queue.pop_oldest()[0], msg('R|U|rec|1|{}+'))
+        self.assertEqual(queue.popleft()[0], msg('P|A|S|b+'))
+        self.assertEqual(len(queue), 2)
+
+    @testing.gen_test
+    def test_control_bypasses_bulk(self):
+        for version in range(1, 5):
+            self.conn.send_message('R', 'U', ['rec', str(version), '{}'])
+        self.assertEqual(self._written(), [msg('R|U|rec|1|{}+'),
+                                           msg('R|U|rec|2|{}+')])
+
+        self.conn.send_message('C', 'PO', [])
+        self.conn.send_message('P', 'A', ['REQ', 'rpc', '1'])
+        self.conn.send_message('E', 'EVT', ['event', 'Sa'])
+        self.assertEqual(self._written()[2:], [msg('C|PO+'),
+                                               msg('P|A|REQ|rpc|1+'),
+                                               msg('E|EVT|event|Sa+')])
+
+        self.write_futures[0].set_result(None)
+        yield gen.moment
+        self.assertEqual(self._written()[5:], [msg('R|U|rec|3|{}+')])
+        self.write_futures[1].set_result(None)
+        yield gen.moment
+        self.assertEqual(self._written()[6:], [msg('R|U|rec|4|{}+')])
+
+    @testing.gen_test
+    def test_record_order(self):
+        self.conn.send_message('R', 'CR', ['rec'])
+        for version in range(1, 4):
+            self.conn.send_message('R', 'U', ['rec', str(version), '{}'])
+        self.conn.send_message('R', 'D', ['rec'])
+        self.assertEqual(self._written(), [msg('R|CR|rec+'),
+                                           msg('R|U|rec|1|{}+'),
+                                           msg('R|U|rec|2|{}+')])
+
+        # Other records don't wait behind the updates, the delete does
+        self.conn.send_message('R', 'CR', ['other'])
+        self.assertEqual(self._written()[3:], [msg('R|CR|other+')])
+
+        self.write_futures[1].set_result(None)
+        self.write_futures[2].set_result(None)
+        yield gen.moment
+        self.assertEqual(self._written()[4:], [msg('R|U|rec|3|{}+'),
+                                               msg('R|D|rec+')])
+        self.assertEqual(len(self.conn._queued_messages), 0)
+
+        # Once the updates are out, the record's messages are interactive
+        self.conn.send_message('R', 'CR', ['rec'])
+        self.assertEqual(self._written()[6:], [msg('R|CR|rec+')])
+
+
+class DispatchTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(DispatchTest, self).setUp()
+        self.client = mock.Mock()
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=False)
+        self.handler.write_message = mock.Mock(return_value=_done_future())
+        self.conn = connection.Connection(self.client, URL,
+                                          dispatchSliceTime=0)
+        self.conn._websocket_handler = self.handler
+        self.conn._state = constants.connection_state.OPEN
+
+    def _dispatched(self):
+        return [call_args[0][0]['data'][0]
+                for call_args in self.client._on_message.call_args_list]
+
+    @testing.gen_test
+    def test_slices(self):
+        self.conn._on_data(msg('E|EVT|a|Sx+E|EVT|b|Sy+C|PI+E|EVT|c|Sz+'))
+        self.assertEqual(self._dispatched(), ['a'])
+        self.handler.write_message.assert_called_once_with(msg('C|PO+'))
+        self.assertEqual(self.conn.dispatch_stats.pending, 2)
+
+        while self.conn.dispatch_stats.pending:
+            yield gen.moment
+        self.assertEqual(self._dispatched(), ['a', 'b', 'c'])
+        stats = self.conn.dispatch_stats
+        self.assertEqual((stats.slices, stats.messages), (3, 3))
+        self.assertTrue(stats.longest >= stats.last >= 0)
+
+    @testing.gen_test
+    def test_keeps_order_across_frames(self):
+        self.conn._on_data(msg('E|EVT|a|Sx+E|EVT|b|Sy+'))
+        self.conn._on_data(msg('E|EVT|c|Sz+'))
+        self.assertEqual(self._dispatched(), ['a'])
+
+        while self.conn.dispatch_stats.pending:
+            yield gen.moment
+        self.assertEqual(self._dispatched(), ['a', 'b', 'c'])
+
+    def test_disabled(self):
+        conn = connection.Connection(self.client, URL)
+        conn._websocket_handler = self.handler
+        conn._on_data(msg('E|EVT|a|Sx+E|EVT|b|Sy+'))
+        self.assertEqual(self._dispatched(), ['a', 'b'])
+        self.assertIsNone(conn.dispatch_stats)
+
+
+class InboundBackpressureTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(InboundBackpressureTest, self).setUp()
+        self.client = mock.Mock()
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=False)
+        self.conn = connection.Connection(self.client, URL,
+                                          dispatchSliceTime=0,
+                                          inboundHighWaterMessages=3)
+        self.conn._transport = mock.Mock()
+        self.conn._websocket_handler = self.handler
+        self.conn._state = constants.connection_state.OPEN
+
+    def _emitted(self, event):
+        return [call_args[0][1:]
+                for call_args in self.client.emit.call_args_list
+                if call_args[0][0] == event]
+
+    @testing.gen_test
+    def test_pauses_reading(self):
+        self.conn._on_data(msg('E|EVT|a|Sx+E|EVT|b|Sx+E|EVT|c|Sx+'))
+        self.conn._transport.pause_reading.assert_not_called()
+        self.conn._on_data(msg('E|EVT|d|Sx+E|EVT|e|Sx+'))
+        self.conn._transport.pause_reading.assert_called_once_with(
+            self.handler)
+        self.assertEqual(
+            self._emitted(constants.event.INBOUND_QUEUE_OVERFLOW),
+            [(connection.QueueDepth(4, 40),)])
+
+        # Heartbeats don't time out while pings wait unread
+        self.conn._last_heartbeat = self.conn.io_loop.time() - 1000
+        self.conn._check_heartbeat()
+        self.assertEqual(self.conn.state, constants.connection_state.OPEN)
+
+        while self.conn.inbound_queue_depth.messages > 2:
+            yield gen.moment
+        self.conn._transport.resume_reading.assert_not_called()
+        yield gen.moment
+        self.conn._transport.resume_reading.assert_called_once_with(
+            self.handler)
+        self.assertEqual(self._emitted(constants.event.INBOUND_QUEUE_DRAINED),
+                         [(connection.QueueDepth(1, 10),)])
+        self.assertEqual(self.conn.inbound_queue_depth, (1, 10))
+
+    def test_budget_implies_slices(self):
+        conn = connection.Connection(self.client, URL,
+                                     inboundHighWaterBytes=1024)
+        self.assertIsNotNone(conn.dispatch_stats)
+
+
+class PreAuthTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(PreAuthTest, self).setUp()
+        self.write_future = concurrent.Future()
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=False)
+        self.handler.write_message = mock.Mock(
+            return_value=self.write_future)
+        self.conn = connection.Connection(mock.Mock(), URL)
+        self.conn._websocket_handler = self.handler
+        self.conn._state = constants.connection_state.AWAITING_AUTHENTICATION
+
+    @testing.gen_test
+    def test_flushes_after_auth(self):
+        futures = [self.conn.send_message('E', 'S', ['event1']),
+                   self.conn.send_message('R', 'CR', ['record1'])]
+        self.conn.send_message('C', 'PO', [])
+        self.handler.write_message.assert_called_once_with(msg('C|PO+'))
+
+        self.conn._handle_auth_response(
+            message_parser.Message('A', 'A', []))
+        self.handler.write_message.assert_called_with(
+            msg('E|S|event1+R|CR|record1+'))
+        self.assertEqual(self.handler.write_message.call_count, 2)
+
+        self.write_future.set_result(None)
+        yield futures
+
+
+class LanesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = client.Client(URL, connectionLanes=2)
+        self.handlers = []
+        for lane in self.client._connection.lanes:
+            handler = mock.Mock()
+            handler.stream.closed = mock.Mock(return_value=False)
+            lane._websocket_handler = handler
+            lane._state = constants.connection_state.OPEN
+            self.handlers.append(handler)
+        self.client._connection._state = constants.connection_state.OPEN
+
+    def test_route_by_topic(self):
+        self.client.record.get_record('record1')
+        self.client.rpc.provide('rpc1', mock.Mock())
+        self.client.event.subscribe('event1', mock.Mock())
+        self.assertEqual(
+            [call_args[0][0]
+             for call_args in self.handlers[0].write_message.call_args_list],
+            [msg('R|CR|record1+'), msg('E|S|event1+')])
+        self.handlers[1].write_message.assert_called_once_with(
+            msg('P|S|rpc1+'))
+
+    def test_resubscribe_reconnected_lane(self):
+        self.client.event.subscribe('event1', mock.Mock())
+        self.client.rpc.provide('rpc1', mock.Mock())
+        for handler in self.handlers:
+            handler.reset_mock()
+
+        rpc_lane = self.client._connection.lanes[1]
+        rpc_lane._set_state(constants.connection_state.RECONNECTING)
+        self.assertEqual(self.client.connection_state,
+                         constants.connection_state.RECONNECTING)
+        rpc_lane._set_state(constants.connection_state.OPEN)
+        self.assertEqual(self.client.connection_state,
+                         constants.connection_state.OPEN)
+
+        self.handlers[0].write_message.assert_not_called()
+        self.handlers[1].write_message.assert_called_once_with(
+            msg('P|S|rpc1+'))
+
+    def test_send_result(self):
+        for handler in self.handlers:
+            handler.write_message = mock.Mock(return_value=_done_future())
+        lanes = self.client._connection
+
+        # Whether the messages go to one lane or several, the result is the
+        # same kind of future
+        single = lanes.send(msg('R|CR|record1+'))
+        multi = lanes.send(msg('R|CR|record2+P|S|rpc1+'))
+        self.assertIsNone(lanes.io_loop.run_sync(lambda: single))
+        self.assertIsNone(lanes.io_loop.run_sync(lambda: multi))
+        for handler in self.handlers:
+            self.assertTrue(handler.write_message.called)
+
+    def test_route_raw_by_name(self):
+        lanes = self.client._connection
+        lanes._route = lanes._route_by_name
+        names = ['record{0}'.format(index) for index in range(8)]
+        for name in names:
+            lanes.send(msg('R|U|{0}|1|{{}}+'.format(name)))
+
+        # Raw messages take the lane send_message would pick
+        for name in names:
+            lane = lanes._lane_for('R', 'U', [name, '1', '{}'])
+            handler = self.handlers[lanes.lanes.index(lane)]
+            self.assertIn(mock.call(msg('R|U|{0}|1|{{}}+'.format(name))),
+                          handler.write_message.call_args_list)
+
+
 if __name__ == '__main__':
     testing.unittest.main()
@@ -0,0 +1,164 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.message import compaction, message_parser
+from deepstreampy import client
+from deepstreampy.constants import connection_state
+from tests.util import msg
+
+from tornado import testing, concurrent, gen
+
+import json
+import sys
+import unittest
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+URL = "ws://localhost:7777/deepstream"
+
+
+def _compact(*messages):
+    queued = [(msg(message), concurrent.Future()) for message in messages]
+    return compaction.compact(queued, mock.Mock())
+
+
+class CompactTest(unittest.TestCase):
+
+    def _messages(self, result):
+        return [raw for raw, _ in result.messages]
+
+    def test_update_supersedes_writes(self):
+        result = _compact('R|P|rec|1|a|N1+',
+                          'R|U|rec|2|{"a":2}+',
+                          'R|U|rec|3|{"a":3}+',
+                          'E|EVT|event|Sa+',
+                          'R|U|rec|4|{"a":4}+')
+        self.assertEqual(self._messages(result),
+                         [msg('E|EVT|event|Sa+'), msg('R|U|rec|1|{"a":4}+')])
+        self.assertEqual(result.versions, {'rec': [1, 2, 3]})
+        self.assertEqual(len(result.superseded), 3)
+
+    def test_patches_of_the_same_path(self):
+        result = _compact('R|P|rec|5|a|N1+',
+                          'R|P|rec|6|b|N1+',
+                          'R|P|rec|7|a|N2+')
+        self.assertEqual(self._messages(result),
+                         [msg('R|P|rec|5|b|N1+'), msg('R|P|rec|6|a|N2+')])
+
+    def test_patches_fold_into_update(self):
+        result = _compact('R|U|rec|1|{"a":{"b":1}}+',
+                          'R|P|rec|2|a.c|N2+',
+                          'R|P|rec|3|d|Sx+')
+        self.assertEqual(len(result.messages), 1)
+        raw = result.messages[0][0].decode()
+        self.assertEqual(raw.split(chr(31))[:3], ['R', 'U', 'rec'])
+        self.assertEqual(raw.split(chr(31))[3], '1')
+        self.assertEqual(json.loads(raw.split(chr(31))[4][:-1]),
+                         {'a': {'b': 1, 'c': 2}, 'd': 'x'})
+        self.assertEqual(
+            compaction.compacted_version(3, result.versions['rec']), 1)
+
+    def test_barriers(self):
+        result = _compact('R|U|rec|1|{}+',
+                          'R|SN|rec+',
+                          'R|U|rec|2|{}+',
+                          'R|U|rec|3|{}|{"writeSuccess":true}+',
+                          'R|U|rec|4|{}+')
+        self.assertEqual(len(result.messages), 5)
+        self.assertEqual(result.versions, {})
+
+    def test_renumbers_later_writes(self):
+        result = _compact('R|U|rec|1|{}+',
+                          'R|U|rec|2|{}+',
+                          'R|D|rec+',
+                          'R|P|rec|3|a|N1+',
+                          'R|U|rec|4|{}|{"writeSuccess":true}+')
+        self.assertEqual(self._messages(result),
+                         [msg('R|U|rec|1|{}+'),
+                          msg('R|D|rec+'),
+                          msg('R|P|rec|2|a|N1+'),
+                          msg('R|U|rec|3|{}|{"writeSuccess":true}+')])
+
+    def test_subscription_pairs(self):
+        result = _compact('E|S|event1+',
+                          'P|S|rpc1+',
+                          'E|S|event2+',
+                          'E|EVT|event2|Sa+',
+                          'E|US|event1+',
+                          'E|US|event2+',
+                          'P|US|rpc1+')
+        self.assertEqual(self._messages(result),
+                         [msg('E|S|event2+'), msg('E|EVT|event2|Sa+'),
+                          msg('E|US|event2+')])
+        self.assertEqual(result.unsubscribed,
+                         [('E', 'event1'), ('P', 'rpc1')])
+        self.assertEqual(len(result.cancelled), 4)
+
+    def test_unsubscribe_then_subscribe_kept(self):
+        result = _compact('E|US|event1+', 'E|S|event1+')
+        self.assertEqual(len(result.messages), 2)
+
+    def test_packets_are_barriers(self):
+        result = _compact('R|U|rec|1|{}+',
+                          'R|U|rec|2|{}+R|U|rec|3|{}+',
+                          'R|U|rec|4|{}+')
+        self.assertEqual(len(result.messages), 3)
+
+
+class ConnectionCompactionTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(ConnectionCompactionTest, self).setUp()
+        self.client = client.Client(URL, compactOfflineQueue=True)
+        self.connection = self.client._connection
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=True)
+        future = concurrent.Future()
+        future.set_result(None)
+        self.handler.write_message = mock.Mock(return_value=future)
+        self.connection._websocket_handler = self.handler
+        self.connection._state = connection_state.RECONNECTING
+
+    def _authenticate(self):
+        self.handler.stream.closed.return_value = False
+        self.connection._handle_auth_response(
+            message_parser.Message('A', 'A', []))
+
+    @testing.gen_test
+    def test_compacts_on_flush(self):
+        self.client.record.get_record('rec')
+        record = self.client.record._records['rec']
+        record._on_read(message_parser.Message('R', 'R', ['rec', '1', '{}']))
+
+        record.set({'a': 1})
+        first = list(self.connection._queued_messages)[-1][1]
+        record.set(2, 'a')
+        record.set(3, 'a')
+        self.assertEqual(record.version, 4)
+        self.assertEqual(self.connection.outbound_queue_depth.messages, 4)
+
+        self._authenticate()
+        written = [call_args[0][0]
+                   for call_args in self.handler.write_message.call_args_list]
+        self.assertEqual(written, [msg('R|CR|rec+R|U|rec|2|{"a":3}+')])
+        self.assertEqual(record.version, 2)
+
+        yield gen.moment
+        yield gen.moment
+        self.assertTrue(first.done())
+        self.assertEqual(self.connection.outbound_queue_depth, (0, 0))
+
+    def test_clears_ack_timeouts(self):
+        callback = mock.Mock()
+        self.client.event.subscribe('event1', callback)
+        self.client.event.unsubscribe('event1', callback)
+        self.assertEqual(len(self.client.timeouts), 2)
+
+        self._authenticate()
+        self.assertEqual(len(self.client.timeouts), 0)
+        self.assertFalse(any(
+            call_args[0][0] in (msg('E|S|event1+'), msg('E|US|event1+'))
+            for call_args in self.handler.write_message.call_args_list))
@@ -69,6 +69,60 @@ class EventsTest(unittest.TestCase):
                                                'UNSOLICITED_MESSAGE',
                                                'E')
 
+    def test_skips_conversion_without_subscribers(self):
+        self.client.on('error', self.error_callback)
+        self.client.event.handle({'topic': 'EVENT',
+                                  'action': 'EVT',
+                                  'data': ['myEvent', 'notTypes']})
+        self.error_callback.assert_not_called()
+
+        self.client.event.subscribe('myEvent', self.event_callback)
+        self.client.event.handle({'topic': 'EVENT',
+                                  'action': 'EVT',
+                                  'data': ['myEvent', 'notTypes']})
+        self.error_callback.assert_called_with('UNKNOWN_TYPE (notTypes)',
+                                               'MESSAGE_PARSE_ERROR',
+                                               'X')
+
+    def test_converts_once_for_all_subscribers(self):
+        other_callback = mock.Mock()
+        self.client.event.subscribe('myEvent', self.event_callback)
+        self.client.event.subscribe('myEvent', other_callback)
+        with mock.patch.object(self.client.codec, 'loads',
+                               wraps=self.client.codec.loads) as loads:
+            self.client.event.handle({'topic': 'EVENT',
+                                      'action': 'EVT',
+                                      'data': ['myEvent', 'O{"a":1}']})
+        self.assertEqual(loads.call_count, 1)
+        self.event_callback.assert_called_once_with({'a': 1})
+        other_callback.assert_called_once_with({'a': 1})
+
+    def test_callback_unsubscribes_itself(self):
+        def unsubscribe(data):
+            self.client.event.unsubscribe('myEvent', unsubscribe)
+
+        other_callback = mock.Mock()
+        self.client.event.subscribe('myEvent', unsubscribe)
+        self.client.event.subscribe('myEvent', other_callback)
+        self.client.event.handle({'topic': 'EVENT',
+                                  'action': 'EVT',
+                                  'data': ['myEvent', 'N1']})
+        other_callback.assert_called_once_with(1)
+
+    def test_emit_prepared_data(self):
+        self.client.event.subscribe('event2', self.event_callback)
+        with mock.patch.object(self.client.codec, 'dumps',
+                               wraps=self.client.codec.dumps) as dumps:
+            payload = self.client.prepare({'a': 1})
+            self.client.event.emit('event1', payload)
+            self.handler.write_message.assert_called_with(
+                msg('E|EVT|event1|O{"a":1}+'))
+            self.client.event.emit('event2', payload)
+            self.handler.write_message.assert_called_with(
+                msg('E|EVT|event2|O{"a":1}+'))
+        self.assertEqual(dumps.call_count, 1)
+        self.event_callback.assert_called_once_with({'a': 1})
+
     def test_accept(self):
         def listen_callback(data, is_subscribed, response):
             response.accept()
@@ -0,0 +1,234 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.message import connection, journal
+from deepstreampy import constants
+from tests.util import msg
+
+from tornado import testing, concurrent, gen
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+URL = "ws://localhost:7777/deepstream"
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _segments(self):
+        return [name for name in os.listdir(self.directory)
+                if name.endswith('.seg')]
+
+    def test_replay_unacknowledged(self):
+        log = journal.Journal(self.directory)
+        first = log.append(b'one')
+        log.append(b'two')
+        log.append(b'three')
+        log.ack(first)
+        log.sync()
+        self.assertEqual(log.pending, 2)
+        log.close()
+
+        log = journal.Journal(self.directory)
+        self.assertEqual([payload for _, payload in log.replay()],
+                         [b'two', b'three'])
+        self.assertEqual(log.replay(), [])
+        self.assertEqual(log.append(b'four'), 3)
+        log.close()
+
+    def test_out_of_order_ack(self):
+        log = journal.Journal(self.directory)
+        entries = [log.append(payload) for payload in (b'a', b'b', b'c')]
+        log.ack(entries[1])
+        log.sync()
+        log.close()
+
+        log = journal.Journal(self.directory)
+        self.assertEqual([payload for _, payload in log.replay()],
+                         [b'a', b'c'])
+        self.assertEqual(log.pending, 2)
+        log.close()
+
+    def test_unacknowledged_entry_holds_only_its_segment(self):
+        log = journal.Journal(self.directory, segment_size=64)
+        entries = [log.append(b'x' * 40) for _ in range(200)]
+        for entry_id in entries[2:]:
+            log.ack(entry_id)
+        log.sync()
+        # The segments of the unacknowledged entries and the one being
+        # appended to are kept
+        self.assertEqual(len(self._segments()), 3)
+        log.close()
+
+        log = journal.Journal(self.directory)
+        self.assertEqual([entry_id for entry_id, _ in log.replay()],
+                         entries[:2])
+        log.ack(entries[1])
+        log.sync()
+        log.close()
+
+        log = journal.Journal(self.directory)
+        self.assertEqual([entry_id for entry_id, _ in log.replay()],
+                         [entries[0]])
+        self.assertEqual(log.pending, 1)
+        self.assertEqual(log.append(b'next'), entries[-1] + 1)
+        log.close()
+
+    def test_removes_acknowledged_segments(self):
+        log = journal.Journal(self.directory, segment_size=64)
+        entries = [log.append(b'x' * 40) for _ in range(3)]
+        self.assertEqual(len(self._segments()), 3)
+
+        log.ack(entries[0])
+        log.ack(entries[1])
+        log.sync()
+        self.assertEqual(len(self._segments()), 1)
+        log.close()
+
+        log = journal.Journal(self.directory)
+        self.assertEqual([entry_id for entry_id, _ in log.replay()],
+                         [entries[2]])
+        log.close()
+
+    def test_torn_append(self):
+        log = journal.Journal(self.directory)
+        log.append(b'complete')
+        log.append(b'torn')
+        log.close()
+
+        path = os.path.join(self.directory, self._segments()[0])
+        with open(path, 'r+b') as segment:
+            segment.seek(2 * journal._HEADER.size + len(b'complete') + 1)
+            segment.write(b'X')
+
+        log = journal.Journal(self.directory)
+        self.assertEqual([payload for _, payload in log.replay()],
+                         [b'complete'])
+        log.close()
+
+    def test_damaged_checkpoint(self):
+        log = journal.Journal(self.directory)
+        entries = [log.append(payload) for payload in (b'a', b'b', b'c')]
+        log.ack(entries[0])
+        log.ack(entries[2])
+        log.close()
+
+        path = os.path.join(self.directory, 'checkpoint')
+        with open(path, 'rb') as checkpoint:
+            data = checkpoint.read()
+        # Empty, torn and corrupted checkpoints replay everything
+        for damaged in (b'', data[:10], data[:-1], b'X' + data[1:]):
+            with open(path, 'wb') as checkpoint:
+                checkpoint.write(damaged)
+            log = journal.Journal(self.directory)
+            self.assertEqual([payload for _, payload in log.replay()],
+                             [b'a', b'b', b'c'])
+            log.close()
+
+        os.remove(path)
+        log = journal.Journal(self.directory)
+        self.assertEqual(len(log.replay()), 3)
+        self.assertEqual(log.append(b'd'), 3)
+        log.close()
+
+    def test_is_journaled(self):
+        self.assertTrue(journal.is_journaled(msg('R|U|record|1|{}+')))
+        self.assertTrue(journal.is_journaled(msg('E|EVT|event|Sa+')))
+        self.assertFalse(journal.is_journaled(msg('R|CR|record+')))
+        self.assertFalse(journal.is_journaled(msg('C|PO+')))
+
+
+class ConnectionJournalTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(ConnectionJournalTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ConnectionJournalTest, self).tearDown()
+
+    def _connection(self):
+        conn = connection.Connection(mock.Mock(), URL,
+                                     offlineJournal=self.directory)
+        conn._websocket_handler = self.handler
+        return conn
+
+    @testing.gen_test
+    def test_replays_queued_writes(self):
+        conn = self._connection()
+        conn.send_message('E', 'EVT', ['event1', 'Sa'])
+        conn.send_message('E', 'S', ['event1'])
+        conn.send_message('R', 'P', ['record1', '2', 'a', 'Sb'])
+        conn._sync_journal()
+        conn._journal.close()
+
+        conn = self._connection()
+        self.assertEqual([message for message, _ in conn._queued_messages],
+                         [msg('E|EVT|event1|Sa+'),
+                          msg('R|P|record1|2|a|Sb+')])
+        self.assertEqual(conn.outbound_queue_depth.messages, 2)
+
+        write_future = concurrent.Future()
+        write_future.set_result(None)
+        self.handler.write_message = mock.Mock(return_value=write_future)
+        self.handler.stream.closed.return_value = False
+        conn._state = constants.connection_state.OPEN
+        conn._send_queued_messages()
+        yield gen.moment
+        yield gen.moment
+        self.assertEqual(conn._journal.pending, 0)
+        conn._sync_journal()
+        conn._journal.close()
+
+        conn = self._connection()
+        self.assertEqual(len(conn._queued_messages), 0)
+        conn._journal.close()
+
+    def test_survives_redirect(self):
+        conn = self._connection()
+        conn._transport = mock.Mock()
+        self.handler.close = mock.Mock(side_effect=conn._on_close)
+        conn._heartbeat_callback = self.io_loop.call_later(60, mock.Mock())
+        conn._on_data(msg('C|RED|ws://other:6020/deepstream+'))
+        conn._transport.connect.assert_called_once_with(
+            'ws://other:6020/deepstream', conn._on_open, conn._on_data, None)
+
+        conn.send_message('E', 'EVT', ['event1', 'Sa'])
+        self.assertEqual(conn._journal.pending, 1)
+        conn.close()
+
+    def test_close_releases_files(self):
+        conn = self._connection()
+        conn.send_message('E', 'EVT', ['event1', 'Sa'])
+        log = conn._journal
+        conn.close()
+        self.assertIsNone(conn._journal)
+        self.assertIsNone(log._segment)
+        self.assertIsNone(log._segment_file)
+
+        # What was queued is still there for the next process
+        conn = self._connection()
+        self.assertEqual([message for message, _ in conn._queued_messages],
+                         [msg('E|EVT|event1|Sa+')])
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
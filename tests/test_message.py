@@ -2,17 +2,32 @@
 from __future__ import absolute_import, division, print_function, with_statement
 from __future__ import unicode_literals
 
-from deepstreampy.message import message_builder, message_parser
+from deepstreampy.message import arrays, codec, message_builder, message_parser
+from deepstreampy.message.framer import MessageFramer
 from deepstreampy.constants import topic, actions, types
 from deepstreampy.constants import topic as topic_constants
 from deepstreampy.constants import event as event_constants
 from deepstreampy import client
+from tests.util import msg
 
 import json
+import math
+import sys
 import unittest
 
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 URL = "ws://localhost:7777/deepstream"
 
+
 class MessageTest(unittest.TestCase):
 
     def setUp(self):
@@ -53,6 +68,28 @@ class MessageTest(unittest.TestCase):
         self.assertEqual(message['action'], actions.READ)
         self.assertEqual(message['data'], data)
 
+    def test_build_bytes(self):
+        """Test building messages as bytes."""
+        self.assertEqual(message_builder.build(topic.CONNECTION, actions.PONG),
+                         msg('C|PO+'))
+        data = {'b': 1, 'a': [2]}
+        self.assertEqual(
+            message_builder.build(topic.RECORD, actions.UPDATE,
+                                  ['rec', 1, data], canonical=True),
+            msg('R|U|rec|1|{"a":[2],"b":1}+'))
+        self.assertEqual(
+            message_builder.build(topic.RECORD, actions.UPDATE,
+                                  ['rec', 1, data]),
+            msg('R|U|rec|1|{"b":1,"a":[2]}+'))
+        self.assertEqual(
+            message_builder.build(topic.EVENT, actions.EVENT,
+                                  ['ev', b'N1', ['x', 'y"']]),
+            msg('E|EVT|ev|N1|["x","y\\""]+'))
+        self.assertEqual(
+            message_builder.get_message(topic.RECORD, actions.UPDATE,
+                                        ['rec', 1, data]),
+            'R{0}U{0}rec{0}1{0}{{"a":[2],"b":1}}{1}'.format(chr(31), chr(30)))
+
     def test_wrong_action(self):
         """Test parsing message with an action that doesn't exist."""
         self.assertRaises(ValueError,
@@ -67,6 +104,90 @@ class MessageTest(unittest.TestCase):
                           topic.AUTH + chr(30),
                           self.client)
 
+    def test_parse_bytes(self):
+        """Test parsing a frame of bytes."""
+        frame = 'R{0}U{0}rec{0}2{0}{{"a":1}}{1}E{0}EVT{0}ev{1}'.format(
+            chr(31), chr(30)).encode()
+        messages = message_parser.parse_bytes(frame, self.client)
+        self.assertEqual(len(messages), 2)
+        update = messages[0]
+        self.assertEqual(update['topic'], topic.RECORD)
+        self.assertEqual(update['action'], actions.UPDATE)
+        self.assertEqual(len(update['data']), 3)
+        self.assertEqual(update['data'][0], 'rec')
+        self.assertEqual(update['data'][1:], ['2', '{"a":1}'])
+        self.assertEqual(message_parser.raw_field(update, 2), b'{"a":1}')
+        self.assertEqual(json.loads(message_parser.raw_field(update, 2)),
+                         {'a': 1})
+        update['data'][2] = '[]'
+        self.assertEqual(message_parser.raw_field(update, 2), '[]')
+        self.assertEqual(messages[1]['data'], ['ev'])
+        self.assertEqual(messages[1]['raw'], 'E{0}EVT{0}ev'.format(chr(31)))
+
+        messages[1]['processedError'] = True
+        self.assertTrue(messages[1].get('processedError'))
+
+    def test_message_fields(self):
+        """Test the attributes and typed fields of parsed messages."""
+        frame = 'R{0}P{0}rec{0}3{0}a.b{0}N1{1}R{0}A{0}D{0}rec{1}'.format(
+            chr(31), chr(30))
+        for messages in (message_parser.parse(frame, self.client),
+                         message_parser.parse_bytes(frame.encode(),
+                                                    self.client)):
+            patch, ack = messages
+            self.assertIsInstance(patch, message_parser.Message)
+            self.assertEqual(patch.topic, topic.RECORD)
+            self.assertEqual(patch.action, actions.PATCH)
+            self.assertEqual(patch.name, 'rec')
+            self.assertEqual(patch.version, 3)
+            self.assertEqual(patch.path, 'a.b')
+            self.assertEqual(ack.name, 'rec')
+            self.assertIsNone(ack.version)
+            self.assertIsNone(ack.path)
+            self.assertEqual(ack.raw, 'R{0}A{0}D{0}rec'.format(chr(31)))
+            self.assertFalse(hasattr(ack, '__dict__'))
+
+    def test_message_items(self):
+        """Test reading and setting message parts as dict items."""
+        message = message_parser.parse(
+            'E{0}EVT{0}ev{1}'.format(chr(31), chr(30)), self.client)[0]
+        self.assertEqual(message['topic'], topic.EVENT)
+        self.assertEqual(message['data'], ['ev'])
+        message['processedError'] = True
+        self.assertTrue(message.processed_error)
+        message['custom'] = 1
+        self.assertEqual(message.get('custom'), 1)
+        self.assertIsNone(message.get('missing'))
+
+        converted = message_parser.as_message(
+            {'topic': 'E', 'action': 'EVT', 'data': ['ev'], 'custom': 1})
+        self.assertEqual(converted, message)
+        self.assertEqual(converted['custom'], 1)
+        self.assertIs(message_parser.as_message(message), message)
+
+    def test_typed_value(self):
+        """Test converting typed values on first access."""
+        message = message_parser.parse(
+            'P{0}RES{0}rpc{0}1{0}O{{"a":1}}{1}'.format(chr(31), chr(30)),
+            self.client)[0]
+        value = message.typed(2, self.client)
+        self.assertEqual(value.type, types.OBJECT)
+        self.assertEqual(value.raw, 'O{"a":1}')
+        self.assertEqual(value.value, {'a': 1})
+        self.assertIs(value.value, value.value)
+        self.assertIsNone(message.typed(3, self.client))
+
+    def test_parse_bytes_errors(self):
+        """Test parsing malformed bytes."""
+        self.assertRaises(ValueError,
+                          message_parser.parse_bytes,
+                          (topic.AUTH + chr(31) + 'F' + chr(30)).encode(),
+                          self.client)
+        self.assertRaises(ValueError,
+                          message_parser.parse_bytes,
+                          (topic.AUTH + chr(30)).encode(),
+                          self.client)
+
     def test_to_typed(self):
         """Test convert to typed."""
         self.assertEqual(message_builder.typed("somestring"),
@@ -111,5 +232,174 @@ class MessageTest(unittest.TestCase):
         self.assertEqual(topic, topic_constants.ERROR)
         self.assertEqual(event, event_constants.MESSAGE_PARSE_ERROR)
 
+
+class FramerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.framer = MessageFramer()
+
+    def test_multiple_messages(self):
+        frame = 'E{0}EVT{0}a{1}E{0}EVT{0}b{1}'.format(chr(31), chr(30))
+        self.assertEqual(list(self.framer.feed(frame)),
+                         ['E{0}EVT{0}a'.format(chr(31)),
+                          'E{0}EVT{0}b'.format(chr(31))])
+        self.assertEqual(self.framer.pending, 0)
+
+    def test_split_message(self):
+        self.assertEqual(list(self.framer.feed('R{0}R{0}re'.format(chr(31)))),
+                         [])
+        self.assertEqual(list(self.framer.feed('cord')), [])
+        self.assertEqual(self.framer.pending, 10)
+        self.assertEqual(
+            list(self.framer.feed('{0}{1}C'.format(chr(31), chr(30)))),
+            ['R{0}R{0}record{0}'.format(chr(31))])
+        self.assertEqual(self.framer.pending, 1)
+        self.framer.reset()
+        self.assertEqual(self.framer.pending, 0)
+
+    def test_bytes(self):
+        frame = 'C{0}PI{1}C{0}A'.format(chr(31), chr(30)).encode()
+        self.assertEqual(list(self.framer.feed(frame)),
+                         ['C{0}PI'.format(chr(31)).encode()])
+        self.assertEqual(list(self.framer.feed(chr(30).encode())),
+                         ['C{0}A'.format(chr(31)).encode()])
+
+
+class CountingCodec(codec.JsonCodec):
+
+    def __init__(self):
+        self.dumped = 0
+        self.loaded = 0
+
+    def dumps(self, value, sort_keys=False, default=None):
+        self.dumped += 1
+        return super(CountingCodec, self).dumps(value, sort_keys, default)
+
+    def loads(self, data, object_hook=None):
+        self.loaded += 1
+        return super(CountingCodec, self).loads(data, object_hook)
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_default(self):
+        expected = codec.JsonCodec if orjson is None else codec.OrjsonCodec
+        self.assertIsInstance(codec.get_codec(), expected)
+        self.assertIs(codec.get_codec(), codec.get_codec())
+        self.assertIsInstance(codec.get_codec('json'), codec.JsonCodec)
+        self.assertRaises(ValueError, codec.get_codec, 'unknown')
+
+    def test_codecs_agree(self):
+        value = {'b': [1, 2.5, None, True], 'a': {'c': 'd'}}
+        codecs = [codec.get_codec('json')]
+        try:
+            codecs.append(codec.get_codec('orjson'))
+        except ImportError:
+            pass
+        for json_codec in codecs:
+            self.assertEqual(json_codec.dumps(value, sort_keys=True),
+                             '{"a":{"c":"d"},"b":[1,2.5,null,true]}')
+            self.assertEqual(json_codec.loads(b'{"a":[1]}'), {'a': [1]})
+            self.assertEqual(json_codec.loads('{"a":[1]}'), {'a': [1]})
+            self.assertRaises(ValueError, json_codec.loads, '{')
+            self.assertRaises(TypeError, json_codec.dumps, object())
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_matches_stdlib(self):
+        stdlib = codec.get_codec(codec.STDLIB)
+        fast = codec.get_codec(codec.ORJSON)
+        for data in ('{"a":"\\u00e9","b":[1,-2.5e-3,null,false]}',
+                     '"\u00e9\u20ac"', '[123456789012345678901234567890]',
+                     '[-9223372036854775809]', '{"a":Infinity,"b":-Infinity}',
+                     '1e400'):
+            self.assertEqual(fast.loads(data), stdlib.loads(data))
+            self.assertEqual(fast.loads(data.encode()), stdlib.loads(data))
+        self.assertTrue(math.isnan(fast.loads('[NaN]')[0]))
+        for data in ('{', '{"a":1,}', "{'a':1}", '[1] x', ''):
+            self.assertRaises(ValueError, stdlib.loads, data)
+            self.assertRaises(ValueError, fast.loads, data)
+
+        for value in ({'b': [1, 2.5, None], 'a': '\u00e9'}, [2 ** 64],
+                      {1: 'a'}):
+            self.assertEqual(
+                stdlib.loads(fast.dumps(value, sort_keys=True)),
+                stdlib.loads(stdlib.dumps(value, sort_keys=True)))
+        self.assertEqual(fast.dumps([2 ** 64]), stdlib.dumps([2 ** 64]))
+        self.assertRaises(TypeError, fast.dumps, object())
+
+    def test_registered_codec(self):
+        counting = CountingCodec()
+        codec.register_codec('counting', lambda: counting)
+        self.addCleanup(codec._codecs.pop, 'counting', None)
+        self.addCleanup(codec._factories.pop, 'counting', None)
+        ds_client = client.Client(URL, jsonCodec='counting')
+        self.assertIs(ds_client.codec, counting)
+        self.assertIs(ds_client._connection._codec, counting)
+
+        message_builder.typed({'a': 1}, ds_client.codec)
+        message_parser.convert_typed('O{"a":1}', ds_client)
+        self.assertEqual((counting.dumped, counting.loaded), (1, 1))
+
+
+@unittest.skipIf(arrays.numpy is None, 'NumPy is not installed')
+class ArrayCodecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = client.Client(URL, numpyArrays=True)
+        self.numpy = arrays.numpy
+
+    def test_round_trip(self):
+        frame = self.numpy.arange(12, dtype='<f4').reshape(3, 4)
+        typed = message_builder.typed(frame, self.client.codec)
+        self.assertTrue(typed.startswith(types.OBJECT))
+        self.assertIn('"__ndarray__"', typed)
+        self.assertIn('"dtype":"<f4"', typed)
+
+        received = message_parser.convert_typed(typed, self.client)
+        self.assertEqual(received.dtype, frame.dtype)
+        self.assertEqual(received.shape, (3, 4))
+        self.assertTrue((received == frame).all())
+
+    def test_nested_arrays(self):
+        value = {'id': 1, 'vectors': [self.numpy.arange(3)[::2]]}
+        received = self.client.codec.loads(
+            self.client.codec.dumps(value).encode())
+        self.assertEqual(received['id'], 1)
+        self.assertEqual(received['vectors'][0].tolist(), [0, 2])
+
+    def test_hooks(self):
+        array_codec = arrays.ArrayCodec(codec.get_codec(codec.STDLIB))
+        value = {'b': (1, 2), 'a': self.numpy.arange(2, dtype='<i2')}
+        self.assertEqual(
+            array_codec.dumps(value, sort_keys=True),
+            '{"a":{"__ndarray__":"AAABAA==","dtype":"<i2","shape":[2]},'
+            '"b":[1,2]}')
+        self.assertRaises(TypeError, array_codec.dumps, object())
+
+        # Without arrays the wrapped codec parses the JSON without a hook
+        with mock.patch.object(array_codec._codec, 'loads',
+                               return_value={}) as loads:
+            array_codec.loads('{"a":{"b":1}}')
+        loads.assert_called_once_with('{"a":{"b":1}}', None)
+
+        hooked = array_codec.loads(array_codec.dumps(value),
+                                   lambda obj: dict(obj, hooked=True))
+        self.assertTrue(hooked['hooked'])
+        self.assertEqual(hooked['a'].tolist(), [0, 1])
+
+    def test_unsupported_arrays(self):
+        self.assertRaises(ValueError, message_builder.typed,
+                          self.numpy.array([object()]), self.client.codec)
+        self.assertRaises(ValueError, message_builder.typed,
+                          self.numpy.arange(3), codec.get_codec())
+
+
+@unittest.skipUnless(arrays.numpy is None, 'NumPy is installed')
+class ArrayCodecWithoutNumpyTest(unittest.TestCase):
+
+    def test_requires_numpy(self):
+        self.assertRaises(ImportError, client.Client, URL, numpyArrays=True)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,97 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy import client
+from deepstreampy.constants import connection_state
+from deepstreampy.constants import event as event_constants
+from tests.util import msg
+
+from tornado import testing, concurrent, gen
+
+import sys
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+URL = "ws://localhost:7777/deepstream"
+
+
+class ResubscribeManagerTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(ResubscribeManagerTest, self).setUp()
+        self.client = client.Client(URL, resubscribeBatchSize=2)
+        self.handler = mock.Mock()
+        self.handler.stream.closed = mock.Mock(return_value=False)
+        future = concurrent.Future()
+        future.set_result(None)
+        self.handler.write_message = mock.Mock(return_value=future)
+        self.client._connection._websocket_handler = self.handler
+        self.client._connection._state = connection_state.OPEN
+
+        self.progress = mock.Mock()
+        self.client.on(event_constants.RESUBSCRIBE_PROGRESS, self.progress)
+
+    def _reconnect(self):
+        self.handler.write_message.reset_mock()
+        self.client._connection._set_state(connection_state.RECONNECTING)
+        self.client._connection._set_state(connection_state.OPEN)
+
+    def _written(self):
+        return [call_args[0][0]
+                for call_args in self.handler.write_message.call_args_list]
+
+    @testing.gen_test
+    def test_batches(self):
+        for name in ('event1', 'event2', 'event3'):
+            self.client.event.subscribe(name, mock.Mock())
+        self.client.rpc.provide('rpc1', mock.Mock())
+        self.client.event.unsubscribe('event2',
+                                      self.client.event._emitter.listeners(
+                                          'event2')[0])
+        self.assertEqual(len(self.client.resubscriptions), 3)
+
+        self._reconnect()
+        self.assertEqual(self._written(),
+                         [msg('E|S|event1+E|S|event3+')])
+        self.progress.assert_called_once_with(2, 3)
+
+        yield gen.sleep(0.01)
+        self.assertEqual(self._written(),
+                         [msg('E|S|event1+E|S|event3+'), msg('P|S|rpc1+')])
+        self.progress.assert_called_with(3, 3)
+        self.assertFalse(self.client.resubscriptions.is_resubscribing)
+
+    @testing.gen_test
+    def test_skips_removed(self):
+        for name in ('event1', 'event2', 'event3'):
+            self.client.event.subscribe(name, mock.Mock())
+        self._reconnect()
+        self.client.resubscriptions.remove('E', 'S', 'event3')
+
+        yield gen.sleep(0.01)
+        self.assertEqual(self._written(), [msg('E|S|event1+E|S|event2+')])
+        self.assertEqual(self.client.resubscriptions.progress, (3, 3))
+
+    @testing.gen_test
+    def test_restarts_on_reconnect(self):
+        for name in ('event1', 'event2', 'event3'):
+            self.client.event.subscribe(name, mock.Mock())
+        self._reconnect()
+        self.client._connection._set_state(connection_state.RECONNECTING)
+        self.assertFalse(self.client.resubscriptions.is_resubscribing)
+
+        yield gen.sleep(0.01)
+        self.assertEqual(self._written(), [msg('E|S|event1+E|S|event2+')])
+
+    def test_registered_callback(self):
+        callback = mock.Mock()
+        self.client.resubscriptions.register(callback)
+        self._reconnect()
+        callback.assert_called_once_with()
+
+        self.client.resubscriptions.unregister(callback)
+        self._reconnect()
+        self.assertEqual(callback.call_count, 1)
@@ -0,0 +1,55 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.message.message_parser import Message
+from deepstreampy.routing import DispatchTable
+
+import sys
+import unittest
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+
+class DispatchTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.routes = DispatchTable()
+        self.ack = mock.Mock()
+        self.unlisten_ack = mock.Mock()
+        self.fallback = mock.Mock()
+        self.routes.register('E', 'A', self.ack)
+        self.routes.register('E', 'A', self.unlisten_ack, 'UL')
+        self.routes.register_fallback('E', self.fallback)
+
+    def test_routes_sub_action(self):
+        message = Message('E', 'A', ['UL', 'a'])
+        self.assertTrue(self.routes.dispatch(message))
+        self.unlisten_ack.assert_called_once_with(message)
+        self.ack.assert_not_called()
+
+    def test_routes_action_without_sub_action_route(self):
+        message = Message('E', 'A', ['S', 'a'])
+        self.assertTrue(self.routes.dispatch(message))
+        self.ack.assert_called_once_with(message)
+
+    def test_routes_unknown_action_to_fallback(self):
+        message = Message('E', 'SP', ['a'])
+        self.assertTrue(self.routes.dispatch(message))
+        self.fallback.assert_called_once_with(message)
+
+    def test_routes_as_other_topic(self):
+        message = Message('X', 'A', ['S', 'a'])
+        self.assertTrue(self.routes.dispatch(message, 'E'))
+        self.ack.assert_called_once_with(message)
+
+    def test_unknown_topic(self):
+        message = Message('X', 'A', ['S', 'a'])
+        self.assertFalse(self.routes.dispatch(message))
+        self.assertEqual(self.routes.route('X', 'A', []), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
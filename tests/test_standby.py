@@ -0,0 +1,134 @@
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy import client
+from deepstreampy.constants import connection_state
+from deepstreampy.constants import event as event_constants
+from deepstreampy.message import transport
+from tests.util import msg
+
+from tornado import testing, concurrent, gen, ioloop
+
+import sys
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+URL = "ws://localhost:7777/deepstream"
+STANDBY_URL = "ws://localhost:7778/deepstream"
+
+
+class FakeTransport(transport.Transport):
+
+    def __init__(self):
+        self.sockets = []
+
+    @property
+    def io_loop(self):
+        return ioloop.IOLoop.current()
+
+    def connect(self, url, on_open, on_message, compression=None):
+        future = concurrent.Future()
+        self.sockets.append((url, on_open, on_message, future))
+        return future
+
+
+class StandbyTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(StandbyTest, self).setUp()
+        self.transport = FakeTransport()
+        self.handlers = []
+        self.client = client.Client(URL, hotStandby=True,
+                                    standbyUrl=STANDBY_URL,
+                                    transport=self.transport)
+        self.failover = mock.Mock()
+        self.client.on(event_constants.CONNECTION_FAILOVER, self.failover)
+        self.client.connect()
+        self.client.login({'username': 'alice'})
+
+    def _open(self, index):
+        url, on_open, on_message, future = self.transport.sockets[index]
+        handler = mock.Mock()
+        handler.stream.closed = mock.Mock(return_value=False)
+        written = concurrent.Future()
+        written.set_result(None)
+        handler.write_message = mock.Mock(return_value=written)
+        self.handlers.append(handler)
+        future.set_result(handler)
+        on_open(future)
+        on_message(msg('C|A+'))
+        on_message(msg('A|A+'))
+        return handler
+
+    def _written(self, handler):
+        return [call_args[0][0]
+                for call_args in handler.write_message.call_args_list]
+
+    def _lose(self, index):
+        self.handlers[index].stream.closed.return_value = True
+        self.transport.sockets[index][2](None)
+
+    def test_opens_standby(self):
+        self._open(0)
+        self.assertEqual(self.client.connection_state, connection_state.OPEN)
+        self.assertEqual(len(self.transport.sockets), 2)
+        self.assertEqual(self.transport.sockets[1][0], STANDBY_URL)
+
+        standby = self._open(1)
+        self.assertEqual(self._written(standby),
+                         [msg('A|REQ|{"username":"alice"}+')])
+        self.assertEqual(self.client._connection.standby.state,
+                         connection_state.OPEN)
+
+    def test_close(self):
+        active = self._open(0)
+        standby = self._open(1)
+        self.client.close()
+        active.close.assert_called_once_with()
+        standby.close.assert_called_once_with()
+        self.assertIsNone(self.client._connection.standby)
+
+    @testing.gen_test
+    def test_fails_over(self):
+        active = self._open(0)
+        standby = self._open(1)
+        lost = self.client._connection.active
+        callback = mock.Mock()
+        self.client.event.subscribe('event1', callback)
+        self.assertIn(msg('E|S|event1+'), self._written(active))
+
+        states = []
+        self.client.on(event_constants.CONNECTION_STATE_CHANGED,
+                       states.append)
+        self._lose(0)
+        self.client.event.emit('event2', 'x')
+
+        yield gen.moment
+        self.failover.assert_called_once_with(URL, STANDBY_URL)
+        self.assertEqual(states, [connection_state.RECONNECTING,
+                                  connection_state.OPEN])
+        self.assertEqual(self.client.connection_state, connection_state.OPEN)
+        self.assertEqual(self._written(standby)[1:],
+                         [msg('E|EVT|event2|Sx+'), msg('E|S|event1+')])
+
+        # A new standby is on its way, the lost connection stays closed
+        self.assertEqual(len(self.transport.sockets), 3)
+        self.assertEqual(self.transport.sockets[2][0], STANDBY_URL)
+        self.assertIsNone(lost._reconnect_timeout)
+        self.assertNotIn(msg('E|EVT|event2|Sx+'), self._written(active))
+
+        self.transport.sockets[1][2](msg('E|EVT|event1|Sy+'))
+        callback.assert_called_once_with('y')
+
+    @testing.gen_test
+    def test_reconnects_without_standby(self):
+        self._open(0)
+        self._lose(0)
+
+        yield gen.moment
+        self.failover.assert_not_called()
+        self.assertEqual(self.client.connection_state,
+                         connection_state.RECONNECTING)
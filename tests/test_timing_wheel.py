@@ -0,0 +1,121 @@
+"""Tests for scheduling timeouts on the timing wheel."""
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.timing_wheel import TimingWheel
+
+from tornado import testing, gen
+
+import sys
+import unittest
+
+if sys.version_info[0] < 3:
+    import mock
+else:
+    from unittest import mock
+
+
+class TimingWheelTest(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TimingWheelTest, self).setUp()
+        client = mock.Mock()
+        client.io_loop = self.io_loop
+        # Small levels, so that longer timeouts have to cascade down
+        self.wheel = TimingWheel(client, resolution=0.01, size=4,
+                                 level_size=4)
+        self.fired = []
+
+    def _callback(self, name):
+        return lambda: self.fired.append((name, self.io_loop.time()))
+
+    @testing.gen_test
+    def test_fires_in_order(self):
+        start = self.io_loop.time()
+        self.wheel.call_later(0.3, self._callback('c'))
+        self.wheel.call_later(0.02, self._callback('a'))
+        self.wheel.call_later(0.1, self._callback('b'))
+        self.assertEqual(len(self.wheel), 3)
+        self.assertEqual(len(self.wheel._levels), 3)
+
+        yield gen.sleep(0.4)
+        self.assertEqual([name for name, _ in self.fired], ['a', 'b', 'c'])
+        for (name, fired_at), delay in zip(self.fired, (0.02, 0.1, 0.3)):
+            self.assertGreaterEqual(fired_at - start, delay - 0.001)
+        self.assertEqual(len(self.wheel), 0)
+
+    @testing.gen_test
+    def test_remove_timeout(self):
+        timeout = self.wheel.call_later(0.05, self._callback('a'))
+        self.wheel.call_later(0.06, self._callback('b'))
+        self.wheel.remove_timeout(timeout)
+        self.wheel.remove_timeout(timeout)
+        self.wheel.remove_timeout(None)
+        self.assertEqual(len(self.wheel), 1)
+
+        yield gen.sleep(0.1)
+        self.assertEqual([name for name, _ in self.fired], ['b'])
+
+    @testing.gen_test
+    def test_remove_timeout_due_in_same_tick(self):
+        def remove_other():
+            self.fired.append(('a', self.io_loop.time()))
+            self.wheel.remove_timeout(other)
+
+        now = self.io_loop.time()
+        with mock.patch.object(self.io_loop, 'time', return_value=now):
+            self.wheel.call_later(0.02, remove_other)
+            other = self.wheel.call_later(0.02, self._callback('b'))
+
+        yield gen.sleep(0.05)
+        self.assertEqual([name for name, _ in self.fired], ['a'])
+        self.assertEqual(len(self.wheel), 0)
+
+    @testing.gen_test
+    def test_schedule_from_callback(self):
+        def reschedule():
+            self.fired.append(('a', self.io_loop.time()))
+            self.wheel.call_later(0.03, self._callback('b'))
+
+        self.wheel.call_later(0.02, reschedule)
+        yield gen.sleep(0.1)
+        self.assertEqual([name for name, _ in self.fired], ['a', 'b'])
+        self.assertEqual(len(self.wheel), 0)
+
+
+class FakeIOLoop(object):
+
+    def __init__(self, now):
+        self.now = now
+        self.timeouts = []
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, callback):
+        timeout = (self.now + delay, callback)
+        self.timeouts.append(timeout)
+        return timeout
+
+    def remove_timeout(self, timeout):
+        self.timeouts.remove(timeout)
+
+
+class TimingWheelRoundingTest(unittest.TestCase):
+
+    def test_wakes_up_on_badly_rounding_time(self):
+        io_loop = FakeIOLoop(10205.05)
+        client = mock.Mock()
+        client.io_loop = io_loop
+        wheel = TimingWheel(client, resolution=0.01)
+        callback = mock.Mock()
+        wheel.call_later(0.01, callback)
+
+        # int(10205.06 / 0.01) is 1020505, a tick short of the wakeup
+        deadline, on_wakeup = io_loop.timeouts.pop()
+        io_loop.now = 10205.06
+        on_wakeup()
+
+        callback.assert_called_once_with()
+        self.assertEqual(len(wheel), 0)
+        self.assertEqual(io_loop.timeouts, [])
@@ -0,0 +1,326 @@
+"""Tests for the websocket transports."""
+from __future__ import absolute_import, division, print_function, with_statement
+from __future__ import unicode_literals
+
+from deepstreampy.message import connection, message_parser, transport
+from deepstreampy import constants
+
+from tornado import testing, web, websocket, gen
+import unittest
+import sys
+
+if sys.version_info[0] < 3:
+    import mock
+    asyncio_transport = None
+else:
+    from unittest import mock
+    from deepstreampy.message import asyncio_transport
+    import asyncio
+
+
+class EchoHandler(websocket.WebSocketHandler):
+
+    def get_compression_options(self):
+        return {}
+
+    def on_message(self, message):
+        self.application.received.append(message)
+        self.write_message(message)
+
+
+class GreetingHandler(EchoHandler):
+    """Asks for the login as soon as the websocket is open."""
+
+    def open(self):
+        self.write_message('C\x1fA\x1e')
+
+
+class DispatchMixin(object):
+    """Runs a connection on ``TRANSPORT`` against the echo server."""
+
+    TRANSPORT = None
+    MESSAGE_TYPE = None
+
+    @testing.gen_test
+    def test_dispatch(self):
+        client = mock.Mock()
+        conn = connection.Connection(
+            client, self.get_url('/deepstream').replace('http', 'ws'),
+            transport=self.TRANSPORT)
+        yield conn.connect()
+
+        # Frames are parsed as the transport delivers them
+        conn._state = constants.connection_state.OPEN
+        conn.send_message('E', 'EVT', ['event', 'N1'])
+        while not client._on_message.called:
+            yield gen.sleep(0.01)
+        message = client._on_message.call_args[0][0]
+        self.assertIs(type(message), self.MESSAGE_TYPE)
+        self.assertEqual(message.data, ['event', 'N1'])
+        conn.close()
+
+
+class TornadoTransportTest(unittest.TestCase):
+
+    def test_get_transport(self):
+        self.assertIsInstance(transport.get_transport(),
+                              transport.TornadoTransport)
+        custom = transport.TornadoTransport()
+        self.assertIs(transport.get_transport(custom), custom)
+        self.assertRaises(ValueError, transport.get_transport, 'carrier')
+
+    def test_compression_options(self):
+        self.assertIsInstance(
+            transport.get_transport(compression=True),
+            transport.TornadoTransport)
+        self.assertIsInstance(
+            transport.get_transport(compressionThreshold=100),
+            transport.TornadoTransport)
+        self.assertRaises(ValueError, transport.get_transport,
+                          compression=True, compressionThreshold=100)
+        self.assertRaises(ValueError, transport.get_transport,
+                          compression=True, compressionContextTakeover=False)
+        self.assertRaises(ValueError, connection.Connection, mock.Mock(),
+                          'ws://localhost', compression=True,
+                          compressionThreshold=100)
+
+
+@unittest.skipIf(asyncio_transport is None, 'asyncio requires Python 3')
+class AsyncioTransportTest(DispatchMixin, testing.AsyncHTTPTestCase):
+
+    TRANSPORT = transport.ASYNCIO
+    MESSAGE_TYPE = message_parser.BytesMessage
+
+    def get_app(self):
+        app = web.Application([('/deepstream', EchoHandler),
+                               ('/greeting', GreetingHandler)])
+        app.received = []
+        return app
+
+    def _connect(self, compression=None):
+        self.messages = []
+        self.transport = asyncio_transport.AsyncioTransport()
+        return self.transport.connect(
+            self.get_url('/deepstream').replace('http', 'ws'),
+            mock.Mock(), self.messages.append, compression)
+
+    @gen.coroutine
+    def _await_messages(self, count):
+        while len(self.messages) < count:
+            yield gen.sleep(0.01)
+
+    @testing.gen_test
+    def test_round_trip(self):
+        socket = yield self._connect()
+        self.assertFalse(socket.stream.closed())
+        yield socket.write_message(b'E\x1fEVT\x1fa\x1e')
+        yield socket.write_message(b'x' * 70000)
+        yield self._await_messages(2)
+        self.assertEqual(self.messages, [b'E\x1fEVT\x1fa\x1e', b'x' * 70000])
+
+        socket.close()
+        yield self._await_messages(3)
+        self.assertIsNone(self.messages[2])
+        self.assertTrue(socket.stream.closed())
+
+    @testing.gen_test
+    def test_compression(self):
+        socket = yield self._connect(
+            {'level': 6, 'threshold': 100, 'context_takeover': False})
+        self.assertIsNotNone(socket._deflate)
+        yield socket.write_message(b'short')
+        yield socket.write_message(b'{"a":1}' * 1000)
+        yield self._await_messages(2)
+        self.assertEqual(self.messages, [b'short', b'{"a":1}' * 1000])
+        self.assertEqual(self._app.received, ['short', '{"a":1}' * 1000])
+
+    @testing.gen_test
+    def test_corrupt_deflate(self):
+        reader = asyncio.StreamReader()
+        writer = mock.Mock()
+        messages = []
+        socket = asyncio_transport.AsyncioWebSocket(
+            reader, writer, messages.append,
+            asyncio_transport._Deflate(6, 0, True, True, 15, 15))
+
+        # A compressed text frame that isn't valid deflate data
+        reader.feed_data(b'\xc1\x04\xff\xff\xff\xff')
+        yield socket._read_frames()
+        self.assertEqual(messages, [None])
+        self.assertTrue(socket.stream.closed())
+
+        header, payload = [call_args[0][0]
+                           for call_args in writer.write.call_args_list]
+        self.assertEqual(header[0], 0x88)
+        self.assertEqual(asyncio_transport._apply_mask(payload, header[-4:]),
+                         b'\x03\xef')
+        writer.close.assert_called_once_with()
+
+    @testing.gen_test
+    def test_compressed_frame_without_deflate(self):
+        reader = asyncio.StreamReader()
+        writer = mock.Mock()
+        messages = []
+        socket = asyncio_transport.AsyncioWebSocket(reader, writer,
+                                                    messages.append)
+
+        reader.feed_data(b'\xc1\x04\xff\xff\xff\xff')
+        yield socket._read_frames()
+        self.assertEqual(messages, [None])
+        self.assertTrue(socket.stream.closed())
+
+        header, payload = [call_args[0][0]
+                           for call_args in writer.write.call_args_list]
+        self.assertEqual(asyncio_transport._apply_mask(payload, header[-4:]),
+                         b'\x03\xea')
+        writer.close.assert_called_once_with()
+
+    @testing.gen_test
+    def test_handshake_timeout(self):
+        # Accepts the connection but never answers the upgrade
+        server = yield asyncio.start_server(
+            lambda reader, writer: None, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        self.transport = asyncio_transport.AsyncioTransport()
+        with mock.patch.object(asyncio_transport, '_HANDSHAKE_TIMEOUT', 0.05):
+            with self.assertRaises(asyncio_transport.HandshakeError):
+                yield self.transport.connect(
+                    'ws://127.0.0.1:{0}/deepstream'.format(port), mock.Mock(),
+                    mock.Mock())
+        server.close()
+
+    def test_current_loop(self):
+        self.assertIs(asyncio_transport._current_loop(False),
+                      self.io_loop.asyncio_loop)
+
+    @testing.gen_test
+    def test_connection(self):
+        client = mock.Mock()
+        conn = connection.Connection(
+            client, self.get_url('/deepstream').replace('http', 'ws'),
+            transport=transport.ASYNCIO)
+        self.assertIsInstance(conn.io_loop, asyncio_transport.AsyncioLoop)
+        yield conn.connect()
+        self.assertEqual(conn.state,
+                         constants.connection_state.AWAITING_CONNECTION)
+
+        # The echo server plays back the client's messages
+        conn._state = constants.connection_state.OPEN
+        conn.send_message('E', 'EVT', ['event', 'N1'])
+        yield gen.sleep(0.05)
+        message = client._on_message.call_args[0][0]
+        self.assertEqual(message['data'], ['event', 'N1'])
+
+    @testing.gen_test
+    def test_server_speaks_first(self):
+        client = mock.Mock()
+        conn = connection.Connection(
+            client, self.get_url('/greeting').replace('http', 'ws'),
+            transport=transport.ASYNCIO)
+        conn._auth_params = {'user': 'a'}
+        yield conn.connect()
+        while not self._app.received:
+            yield gen.sleep(0.01)
+        self.assertEqual(self._app.received, ['A\x1fREQ\x1f{"user":"a"}\x1e'])
+        self.assertEqual(conn.state,
+                         constants.connection_state.AUTHENTICATING)
+        conn.close()
+
+    @testing.gen_test
+    def test_failing_message_callback(self):
+        messages = []
+
+        def on_message(message):
+            messages.append(message)
+            if message == b'a':
+                raise ValueError('bad handler')
+
+        self.transport = asyncio_transport.AsyncioTransport()
+        socket = yield self.transport.connect(
+            self.get_url('/deepstream').replace('http', 'ws'), mock.Mock(),
+            on_message)
+        yield socket.write_message(b'a')
+        yield socket.write_message(b'b')
+        while len(messages) < 2:
+            yield gen.sleep(0.01)
+        self.assertEqual(messages, [b'a', b'b'])
+        socket.close()
+
+    @testing.gen_test
+    def test_handshake_error(self):
+        self.transport = asyncio_transport.AsyncioTransport()
+        on_open = mock.Mock()
+        with self.assertRaises(asyncio_transport.HandshakeError):
+            yield self.transport.connect(
+                self.get_url('/missing').replace('http', 'ws'), on_open,
+                mock.Mock())
+        self.assertTrue(on_open.called)
+
+    @testing.gen_test
+    def test_pause_reading(self):
+        socket = yield self._connect()
+        # Let the read loop start waiting for a frame
+        yield gen.moment
+
+        # The frame being read when pausing is still delivered
+        self.transport.pause_reading(socket)
+        yield socket.write_message(b'a')
+        yield socket.write_message(b'b')
+        yield gen.sleep(0.05)
+        self.assertEqual(self.messages, [b'a'])
+
+        self.transport.resume_reading(socket)
+        yield self._await_messages(2)
+        self.assertEqual(self.messages, [b'a', b'b'])
+
+
+class TornadoTransportReadTest(DispatchMixin, testing.AsyncHTTPTestCase):
+
+    TRANSPORT = transport.TORNADO
+    MESSAGE_TYPE = message_parser.Message
+
+    def get_app(self):
+        app = web.Application([('/deepstream', EchoHandler)])
+        app.received = []
+        return app
+
+    @testing.gen_test
+    def test_pause_reading(self):
+        messages = []
+        tornado_transport = transport.TornadoTransport()
+        socket = yield tornado_transport.connect(
+            self.get_url('/deepstream').replace('http', 'ws'), mock.Mock(),
+            messages.append)
+
+        # The frame being read when pausing is still delivered
+        tornado_transport.pause_reading(socket)
+        yield socket.write_message('a')
+        yield socket.write_message('b')
+        yield gen.sleep(0.05)
+        self.assertEqual(messages, ['a'])
+
+        tornado_transport.resume_reading(socket)
+        while len(messages) < 2:
+            yield gen.sleep(0.01)
+        self.assertEqual(messages, ['a', 'b'])
+
+    @testing.gen_test
+    def test_compression(self):
+        messages = []
+        socket = yield transport.TornadoTransport().connect(
+            self.get_url('/deepstream').replace('http', 'ws'), mock.Mock(),
+            messages.append,
+            {'level': 9, 'threshold': 100, 'context_takeover': True})
+        self.assertIn('permessage-deflate',
+                      socket.headers.get('Sec-WebSocket-Extensions', ''))
+
+        yield socket.write_message(b'short')
+        yield socket.write_message(b'{"a":1}' * 1000)
+        while len(messages) < 2:
+            yield gen.sleep(0.01)
+        self.assertEqual(messages, ['short', '{"a":1}' * 1000])
+        self.assertEqual(self._app.received, ['short', '{"a":1}' * 1000])
+
+
+if __name__ == '__main__':
+    unittest.main()